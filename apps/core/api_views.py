@@ -1,16 +1,21 @@
+import os
+
+from django.http import FileResponse, Http404
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import SystemActivity, Notification
-from .serializers import ActivitySerializer, NotificationSerializer
+from .mixins import FieldProjectionMixin
+from .models import SystemActivity, Notification, Job
+from .serializers import ActivitySerializer, NotificationSerializer, JobSerializer
 
-class ActivityViewSet(viewsets.ReadOnlyModelViewSet):
+class ActivityViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
     queryset = SystemActivity.objects.all()[:15]
     serializer_class = ActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None  # Already a fixed-size feed (sliced queryset)
 
 
-class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+class NotificationViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
     """Per-user notification inbox. Users only ever see their own."""
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -33,3 +38,25 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
         n.is_read = True
         n.save(update_fields=['is_read'])
         return Response({'status': 'ok'})
+
+
+class JobViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
+    """Status / progress of background jobs (apps.core.jobs). Users see the
+    jobs they started; superusers see everyone's."""
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filterset_fields = ['kind', 'status']
+
+    def get_queryset(self):
+        qs = Job.objects.all()
+        if not self.request.user.is_superuser:
+            qs = qs.filter(created_by=self.request.user)
+        return qs
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if not job.result_file:
+            raise Http404("This job has no result file")
+        filename = (job.result or {}).get('filename') or os.path.basename(job.result_file.name)
+        return FileResponse(job.result_file.open('rb'), as_attachment=True, filename=filename)
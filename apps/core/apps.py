@@ -7,3 +7,6 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         import apps.core.signals
+        # Register background job handlers (apps/<app>/jobs.py).
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules('jobs')
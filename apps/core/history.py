@@ -0,0 +1,78 @@
+"""How much django-simple-history keeps, and how it is written.
+
+Usage:
+    from apps.core.history import IndexedHistoricalRecords, bulk_history, compact
+
+    history = IndexedHistoricalRecords()          # on a model, instead of HistoricalRecords()
+    bulk_history(Stock, rows, update=True, user=request.user)
+    compact(Stock.history.model, before)          # see manage.py compact_history
+
+Policy:
+  * Bulk writes (bulk_create, queryset UPDATEs) send no post_save, so they
+    record their history with bulk_history(): one INSERT for the batch
+    instead of a save() and a history row per object.
+  * Stock quantity changes already land in the StockMovement ledger with
+    the user, reason and resulting balance, so apps.inventory.movements
+    only adds Stock history rows when settings.STOCK_HISTORY_WITH_LEDGER is
+    on. Other Stock edits (thresholds) are still recorded by post_save.
+  * Detail beyond settings.HISTORY_RETENTION_DAYS is collapsed to the last
+    version of each object per day by compact().
+  * History tables carry an (object id, history_date) index, the lookup
+    behind "what happened to this object".
+"""
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber, TruncDate
+from simple_history.models import HistoricalRecords, registered_models
+
+
+class IndexedHistoricalRecords(HistoricalRecords):
+    """HistoricalRecords with an (object id, history_date) index."""
+
+    def get_meta_options(self, model):
+        meta = super().get_meta_options(model)
+        meta['indexes'] = tuple(meta.get('indexes', ())) + (
+            models.Index(fields=(model._meta.pk.attname, 'history_date')),
+        )
+        return meta
+
+
+def bulk_history(model, objs, update=False, user=None):
+    """Record history for objects written in bulk, in one INSERT. `update`
+    marks the rows as changes (~) rather than creations (+)."""
+    objs = list(objs)
+    if not objs or not getattr(settings, 'SIMPLE_HISTORY_ENABLED', True):
+        return
+    model.history.bulk_history_create(
+        objs, update=update,
+        default_user=user if getattr(user, 'is_authenticated', False) else None,
+    )
+
+
+def stock_history_with_ledger():
+    return getattr(settings, 'STOCK_HISTORY_WITH_LEDGER', False)
+
+
+def history_models():
+    """{'app.Model': historical model} for every tracked model."""
+    tracked = {}
+    for model in registered_models.values():
+        manager = getattr(model, 'history', None)
+        if manager is not None:
+            tracked[model._meta.label] = manager.model
+    return tracked
+
+
+def compact(historical, before):
+    """Collapse history older than `before` to one row per object per day
+    (the last version that day). Returns the number of rows removed."""
+    pk = historical.instance_type._meta.pk.attname
+    superseded = (historical.objects.filter(history_date__lt=before)
+                  .annotate(newer=Window(RowNumber(),
+                                         partition_by=[F(pk), TruncDate('history_date')],
+                                         order_by=[F('history_date').desc(), F('history_id').desc()]))
+                  .filter(newer__gt=1)
+                  .values('history_id'))
+    deleted, _ = historical.objects.filter(history_id__in=superseded).delete()
+    return deleted
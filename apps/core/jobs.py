@@ -0,0 +1,186 @@
+"""In-process background jobs for imports, exports and payroll runs.
+
+Usage:
+    from apps.core.jobs import register, enqueue, job_accepted
+
+    @register('sales.import_customers')          # in apps/<app>/jobs.py
+    def import_customers(job):
+        ...
+        job.report_progress(done, total)          # optional
+        return {'message': ...}                   # stored in Job.result
+
+    job = enqueue('sales.import_customers', request.user, upload=request.FILES['file'])
+    return job_accepted(job)                      # 202 + job id
+
+Each job is a core.Job row, so its status survives the request. A small
+thread pool (settings.JOB_WORKERS, default 2) picks it up once the
+enqueuing transaction commits; clients poll /api/jobs/<id>/ and fetch any
+result file from /api/jobs/<id>/download/. When a job finishes a
+"job_update" event with just its id and status is pushed to the
+stock_updates channel group.
+
+With settings.JOBS_ALWAYS_EAGER the handler runs inline instead (tests).
+
+The pool lives in the web process, so a restart loses jobs waiting for it
+and leaves running ones unfinished. ``manage.py recover_jobs`` (cron) runs
+the queued ones and fails those running for longer than
+settings.JOB_STALE_MINUTES; a job is claimed with a conditional UPDATE, so
+it never runs twice. Its outcome is written the same way, only while it is
+still 'running': a job recover_jobs already failed keeps that status and its
+late result is dropped. JOB_STALE_MINUTES must therefore be longer than the
+longest job (a big import or payroll run), or such jobs are failed while
+still working.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_executor = None
+
+
+def register(kind):
+    """Decorator: make `func(job)` the handler for jobs of this kind."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'JOB_WORKERS', 2),
+                                       thread_name_prefix='job')
+    return _executor
+
+
+def enqueue(kind, user=None, payload=None, upload=None):
+    """Create a queued Job and hand it to the worker pool after commit."""
+    from .models import Job
+    if kind not in _handlers:
+        raise KeyError(f"No job handler registered for '{kind}'")
+    job = Job(kind=kind, payload=payload or {},
+              created_by=user if getattr(user, 'is_authenticated', False) else None)
+    if upload is not None:
+        job.input_file.save(os.path.basename(upload.name), upload, save=False)
+    job.save()
+
+    if getattr(settings, 'JOBS_ALWAYS_EAGER', False):
+        run_job(job.pk)
+        job.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: _pool().submit(run_job, job.pk))
+    return job
+
+
+def run_job(job_id):
+    """Execute one job and record the outcome. Runs on a pool thread."""
+    from .models import Job
+    eager = getattr(settings, 'JOBS_ALWAYS_EAGER', False)
+    if not eager:
+        close_old_connections()
+    try:
+        # Claim the job: only one worker (pool thread or recover_jobs) gets it.
+        if not Job.objects.filter(pk=job_id, status='queued').update(status='running',
+                                                                     started_at=timezone.now()):
+            return
+        job = Job.objects.get(pk=job_id)
+        try:
+            job.result = _handlers[job.kind](job)
+            job.status = 'succeeded'
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.pk, job.kind)
+            job.status = 'failed'
+            job.error = str(e) or e.__class__.__name__
+        job.finished_at = timezone.now()
+        # Only while still ours: recover() may have failed it as stale.
+        if not Job.objects.filter(pk=job.pk, status='running').update(
+                status=job.status, result=job.result, result_file=job.result_file.name or '',
+                error=job.error, finished_at=job.finished_at):
+            logger.warning("Job %s (%s) finished after being marked failed; result dropped", job.pk, job.kind)
+            if job.result_file:
+                job.result_file.delete(save=False)
+            return
+        if job.input_file:
+            job.input_file.delete(save=True)
+        broadcast_job(job)
+    finally:
+        if not eager:
+            close_old_connections()
+
+
+def recover(stale_after=None, queued_grace=timedelta(minutes=1)):
+    """Clean up after a restart or crash, when the in-process pool lost its
+    work: jobs 'running' for longer than `stale_after` (default
+    settings.JOB_STALE_MINUTES) are marked failed, and the ids of jobs
+    still 'queued' after `queued_grace` are returned to be run again.
+    Returns (failed count, queued ids)."""
+    from .models import Job
+    if stale_after is None:
+        stale_after = timedelta(minutes=getattr(settings, 'JOB_STALE_MINUTES', 120))
+    now = timezone.now()
+    stale = list(Job.objects.filter(status='running', started_at__lt=now - stale_after))
+    for job in stale:
+        if not Job.objects.filter(pk=job.pk, status='running').update(
+                status='failed', finished_at=now,
+                error="Interrupted: the server stopped before the job finished. Please try again."):
+            continue
+        job.refresh_from_db()
+        if job.input_file:
+            job.input_file.delete(save=True)
+        broadcast_job(job)
+    queued = list(Job.objects.filter(status='queued', created_at__lt=now - queued_grace)
+                  .order_by('created_at').values_list('pk', flat=True))
+    return len(stale), queued
+
+
+def attach_response(job, response):
+    """Store a file-download HttpResponse (an export) as the job's result
+    file, keeping the filename from its Content-Disposition header."""
+    disposition = response.get('Content-Disposition', '')
+    filename = disposition.split('filename=')[-1].strip('"') if 'filename=' in disposition else f"job_{job.pk}"
+    job.result_file.save(filename, ContentFile(response.content), save=False)
+    return {'filename': filename}
+
+
+def job_url(job):
+    return f"/api/jobs/{job.pk}/"
+
+
+def job_accepted(job):
+    """202 response pointing the client at the job's status endpoint."""
+    return JsonResponse({
+        'job_id': job.pk,
+        'status': job.status,
+        'status_url': job_url(job),
+    }, status=202)
+
+
+def broadcast_job(job):
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            "stock_updates",
+            {
+                "type": "job_update",
+                # Everyone in the group gets this, so only id and status:
+                # the owner's page fetches the rest from /api/jobs/<id>/.
+                "data": {"id": job.pk, "status": job.status},
+            }
+        )
+    except Exception:
+        logger.exception("Job broadcast failed for job %s", job.pk)
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.core.history import compact, history_models
+
+
+class Command(BaseCommand):
+    help = ('Collapse change history older than the retention period to one version per object per day '
+            '(run weekly or nightly)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Keep full detail for this many days (default: settings.HISTORY_RETENTION_DAYS)')
+        parser.add_argument('--model', action='append',
+                            help='Only this tracked model, e.g. inventory.Stock (repeatable)')
+
+    def handle(self, *args, **options):
+        days = options['days'] or getattr(settings, 'HISTORY_RETENTION_DAYS', 90)
+        if days < 1:
+            raise CommandError('--days must be at least 1')
+        tracked = history_models()
+        labels = options['model'] or sorted(tracked)
+        unknown = [label for label in labels if label not in tracked]
+        if unknown:
+            raise CommandError(f"Not tracked: {', '.join(unknown)}. Choose from {', '.join(sorted(tracked))}")
+
+        before = timezone.now() - timedelta(days=days)
+        for label in labels:
+            removed = compact(tracked[label], before)
+            self.stdout.write(self.style.SUCCESS(f'{label}: removed {removed} history rows older than {days} days.'))
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard daily rollups (core.DailyMetric) from the sales, expense and purchase tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only rebuild the last N days (default: all history)')
+        parser.add_argument('--since', help='Only rebuild from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date like 2026-01-31')
+        elif options['days']:
+            since = date.today() - timedelta(days=options['days'])
+
+        written = rebuild(since)
+        scope = f'since {since}' if since else 'for all history'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} rollup rows {scope}.'))
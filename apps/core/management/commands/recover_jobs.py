@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.jobs import recover, run_job
+
+
+class Command(BaseCommand):
+    help = ('Fail background jobs lost to a restart and run the ones still queued '
+            '(run every few minutes from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=int,
+                            help="Fail jobs 'running' for longer than this (default: settings.JOB_STALE_MINUTES)")
+
+    def handle(self, *args, **options):
+        stale = options['stale_minutes']
+        if stale is not None and stale < 1:
+            raise CommandError('--stale-minutes must be at least 1')
+        failed, queued = recover(timedelta(minutes=stale) if stale else None)
+        for job_id in queued:
+            run_job(job_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {failed} interrupted jobs failed; ran {len(queued)} queued jobs.'))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_job'),
+        ('inventory', '0014_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('metric', models.CharField(max_length=30)),
+                ('key', models.CharField(blank=True, default='', max_length=30)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='inventory.branch')),
+            ],
+            options={
+                'ordering': ['day'],
+                'unique_together': {('metric', 'day', 'branch', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from rest_framework import permissions
+
+
+class FieldProjectionMixin:
+    """Let API clients fetch only the columns they render.
+
+    GET /api/products/?fields=id,name,price returns just those keys. Dropped
+    fields are removed from the serializer before it runs, so method fields
+    and nested serializers that were not asked for cost nothing. Unknown
+    names are ignored; writes always use the full serializer.
+    """
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return None
+        raw = request.query_params.get(self.fields_query_param)
+        if not raw:
+            return None
+        return {name.strip() for name in raw.split(',') if name.strip()}
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        requested = self.get_requested_fields()
+        if requested:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in requested:
+                    target.fields.pop(name)
+        return serializer
@@ -33,6 +33,34 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.recipient}: {self.title}"
 
+class DailyMetric(models.Model):
+    """Pre-aggregated daily totals (sales, expenses, purchases, ...) per
+    branch, maintained by apps.core.rollups so dashboards read O(days) rows
+    instead of scanning the fact tables. `key` splits a metric by a
+    dimension (e.g. expense category id); it is '' for the plain total."""
+    branch = models.ForeignKey('inventory.Branch', on_delete=models.CASCADE, related_name='daily_metrics')
+    day = models.DateField()
+    metric = models.CharField(max_length=30)
+    key = models.CharField(max_length=30, blank=True, default='')
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('metric', 'day', 'branch', 'key')
+        ordering = ['day']
+
+    def __str__(self):
+        return f"{self.metric}{'/' + self.key if self.key else ''} {self.day} @{self.branch_id}: {self.value}"
+
+class DocumentSequence(models.Model):
+    """The counter behind one document-number series (apps.core.numbering).
+    `key` is the prefix, followed by the branch id for per-branch series."""
+    key = models.CharField(max_length=40, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.last_value}"
+
 class SystemSettings(models.Model):
     company_name = models.CharField(max_length=100, default="Umoja Hardware")
     currency = models.CharField(max_length=10, default="TZS")
@@ -53,3 +81,46 @@ class SystemSettings(models.Model):
     def __str__(self):
         return "System Configuration"
 
+
+
+class Job(models.Model):
+    """A long-running operation (import, export, payroll run) executed off
+    the request thread by apps.core.jobs. Clients poll /api/jobs/<id>/."""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    payload = models.JSONField(default=dict, blank=True)
+    input_file = models.FileField(upload_to='jobs/input/', blank=True)
+    progress = models.PositiveIntegerField(default=0, help_text="Items processed so far")
+    total = models.PositiveIntegerField(null=True, blank=True, help_text="Items expected, when known")
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.FileField(upload_to='jobs/output/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def report_progress(self, done, total=None):
+        """Record progress with a single UPDATE (called from the worker)."""
+        fields = {'progress': done}
+        if total is not None:
+            fields['total'] = total
+        for name, value in fields.items():
+            setattr(self, name, value)
+        Job.objects.filter(pk=self.pk).update(**fields)
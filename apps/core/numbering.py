@@ -0,0 +1,73 @@
+"""Document numbers (SKUs, invoice, PO, GRN, transfer and count numbers)
+from counters kept in the database.
+
+Usage:
+    from apps.core import numbering
+
+    numbering.next_number('INV', branch=sale.branch)    # 'INV-3-000042'
+    numbering.allocate('PROD', 500)                      # 500 SKUs at once
+
+Each series is one DocumentSequence row: the prefix for catalogue-wide
+series, prefix plus branch id for per-branch ones (see SERIES). allocate()
+reserves a whole block with a single INSERT ... ON CONFLICT DO UPDATE ...
+RETURNING, so a batch of any size costs one statement and no number is ever
+looked up to see whether it is taken.
+
+The counter row stays locked until the caller's transaction ends: other
+allocations in the same series wait for it, and a rolled-back import or
+order hands its numbers back, so those series have no gaps. Where the
+series is hot and the surrounding transaction long, allocate outside it
+instead and accept gaps: SaleSerializer.create takes the invoice number in
+its own autocommit statement so concurrent sales at a branch don't
+serialize on the counter.
+
+Series numbers can't clash with documents numbered before they existed:
+old SKUs were six random characters (these have seven digits), old invoice
+numbers were eight hex digits without a prefix, and old POs / GRNs kept
+their id-based number without a branch part.
+"""
+from django.db import connection
+
+from .models import DocumentSequence
+
+SERIES = {
+    # prefix -> (digits, one series per branch)
+    'PROD': (7, False),
+    'SERV': (7, False),
+    'INV': (6, True),
+    'PO': (5, True),
+    'GRN': (5, True),
+    'TRF': (5, True),
+    'CNT': (5, True),
+}
+
+
+def series_key(prefix, branch=None):
+    _, per_branch = SERIES[prefix]
+    branch_id = getattr(branch, 'pk', branch)
+    if per_branch and branch_id is not None:
+        return f"{prefix}-{branch_id}"
+    return prefix
+
+
+def allocate(prefix, count=1, branch=None):
+    """Reserve `count` consecutive numbers in a series; returns them formatted,
+    lowest first."""
+    if count < 1:
+        return []
+    digits, _ = SERIES[prefix]
+    key = series_key(prefix, branch)
+    table = connection.ops.quote_name(DocumentSequence._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ("key", last_value) VALUES (%s, %s) '
+            f'ON CONFLICT ("key") DO UPDATE SET last_value = {table}.last_value + EXCLUDED.last_value '
+            f'RETURNING last_value',
+            [key, count],
+        )
+        last = cursor.fetchone()[0]
+    return [f"{key}-{n:0{digits}d}" for n in range(last - count + 1, last + 1)]
+
+
+def next_number(prefix, branch=None):
+    return allocate(prefix, 1, branch)[0]
@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """Keyset pagination for every router-registered ViewSet.
+
+    A client opts in by sending ``?page_size=`` (first page) or following the
+    ``next``/``previous`` links (which carry ``?cursor=``); it then gets a
+    ``{next, previous, results}`` envelope. Requests without either parameter
+    still receive the plain list the web templates were written against, so
+    pages can move over one at a time.
+
+    Pages are keyed on the primary key, so fetching page N costs one indexed
+    range scan no matter how deep into the table it is (unlike OFFSET).
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-pk'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,216 @@
+"""Daily rollups (core.DailyMetric) behind the dashboards.
+
+Each SOURCE describes one fact table: which date and amount to total and
+the metrics it feeds. A metric is either a plain total per branch/day
+(dimension None) or a total split by a foreign key (the id goes in `key`).
+
+Kept current two ways:
+  * signals (apps.core.signals) call mark_dirty() for the (branch, day)
+    a saved/deleted row belongs to; after commit refresh() recomputes just
+    that bucket from the fact table, which is an indexed one-day query;
+    refreshes of the same bucket are serialized by an advisory lock and
+    upsert their rows, so two writes committing together can't collide on
+    the unique index, and a failed refresh never fails the committed write;
+  * ``manage.py rebuild_daily_metrics`` recomputes any range from scratch
+    (first deploy, or after bulk writes that skip signals).
+
+Dashboards read them with totals_by_day() / totals_by_key().
+"""
+import threading
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+SOURCES = {
+    'sales.Sale': {
+        'date': 'created_at',
+        'amount': 'total_amount',
+        'metrics': {'sales': None},
+    },
+    'finance.Expense': {
+        'date': 'date_incurred',
+        'amount': 'amount',
+        'metrics': {'expenses': None, 'expense_category': 'category', 'expense_bank': 'bank'},
+    },
+    'inventory.Purchase': {
+        'date': 'date_purchased',
+        'amount': 'total_cost',
+        'metrics': {'purchases': None, 'purchase_supplier': 'supplier'},
+    },
+}
+
+_local = threading.local()
+
+
+def bucket_of(label, instance):
+    """(branch_id, day) an instance of a SOURCE model is counted under."""
+    value = getattr(instance, SOURCES[label]['date'])
+    if value is None:
+        return None
+    if hasattr(value, 'tzinfo'):  # datetime -> local calendar day
+        value = timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return instance.branch_id, value
+
+
+def mark_dirty(label, bucket):
+    """Queue a bucket for refresh() once the current transaction commits.
+    Repeated saves of the same rows within a transaction refresh it once."""
+    if bucket is None or bucket[0] is None:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = set()
+    pending.add((label, bucket))
+    # The first callback to run takes the whole set; later ones find it
+    # empty. Buckets left over from a rolled-back transaction are simply
+    # refreshed with the next commit.
+    transaction.on_commit(_flush, robust=True)
+
+
+def _flush():
+    pending, _local.pending = getattr(_local, 'pending', set()), set()
+    for label, (branch_id, day) in pending:
+        refresh(label, branch_id, day)
+
+
+def _aggregate(label, qs, with_day):
+    """Rows of (metric, day or None, branch_id, key, value, count)."""
+    source = SOURCES[label]
+    date_field = source['date']
+    model = apps.get_model(label)
+    is_datetime = model._meta.get_field(date_field).get_internal_type() == 'DateTimeField'
+    if with_day:
+        qs = qs.annotate(d=TruncDate(date_field) if is_datetime else F(date_field))
+    rows = []
+    for metric, dimension in source['metrics'].items():
+        group = ['branch_id'] + (['d'] if with_day else []) + ([f'{dimension}_id'] if dimension else [])
+        for r in qs.values(*group).annotate(v=Sum(source['amount']), n=Count('pk')).order_by():
+            key = r.get(f'{dimension}_id') if dimension else ''
+            rows.append((metric, r.get('d'), r['branch_id'], '' if key is None else str(key),
+                         r['v'] or Decimal('0'), r['n']))
+    return rows
+
+
+def _date_filter(label, start, end=None):
+    field = SOURCES[label]['date']
+    model = apps.get_model(label)
+    if model._meta.get_field(field).get_internal_type() == 'DateTimeField':
+        field = f'{field}__date'
+    lookups = {f'{field}__gte': start}
+    if end is not None:
+        lookups[f'{field}__lte'] = end
+    return lookups
+
+
+def _lock_bucket(label, branch_id, day):
+    """Transaction-scoped advisory lock on one (source, branch, day)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)",
+                       [zlib.crc32(f'rollup:{label}:{branch_id}:{day.isoformat()}'.encode())])
+
+
+def refresh(label, branch_id, day):
+    """Recompute every metric of one source for one branch and day."""
+    from .models import DailyMetric
+    model = apps.get_model(label)
+    with transaction.atomic():
+        # Read under the lock: a refresh that waited sees the other's commit.
+        _lock_bucket(label, branch_id, day)
+        qs = model.objects.filter(branch_id=branch_id, **_date_filter(label, day, day))
+        rows = [DailyMetric(metric=m, day=day, branch_id=b, key=k, value=v, count=n)
+                for m, _, b, k, v, n in _aggregate(label, qs, with_day=False)]
+        DailyMetric.objects.bulk_create(rows, update_conflicts=True,
+                                        unique_fields=['metric', 'day', 'branch', 'key'],
+                                        update_fields=['value', 'count'])
+        # Keys whose rows are all gone (e.g. the day's last fuel expense).
+        (DailyMetric.objects.filter(metric__in=SOURCES[label]['metrics'], branch_id=branch_id, day=day)
+         .exclude(pk__in=[r.pk for r in rows]).delete())
+
+
+def rebuild(since=None):
+    """Recompute all metrics from `since` (a date; None = all history).
+    Returns the number of rollup rows written."""
+    from .models import DailyMetric
+    written = 0
+    for label, source in SOURCES.items():
+        model = apps.get_model(label)
+        qs = model.objects.all()
+        old = DailyMetric.objects.filter(metric__in=source['metrics'])
+        if since is not None:
+            qs = qs.filter(**_date_filter(label, since))
+            old = old.filter(day__gte=since)
+        rows = [DailyMetric(metric=m, day=d, branch_id=b, key=k, value=v, count=n)
+                for m, d, b, k, v, n in _aggregate(label, qs, with_day=True)]
+        with transaction.atomic():
+            old.delete()
+            DailyMetric.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+# -- reading -------------------------------------------------------------------
+
+def _rows(metric, since, branch=None):
+    from .models import DailyMetric
+    qs = DailyMetric.objects.filter(metric=metric, day__gte=since)
+    if branch is not None:
+        qs = qs.filter(branch=branch)
+    return qs
+
+
+def totals_by_day(metric, since, branch=None):
+    """{day: (value, count)} summed over branches (or for one branch)."""
+    rows = (_rows(metric, since, branch).values('day')
+            .annotate(v=Sum('value'), n=Sum('count')).order_by('day'))
+    return {r['day']: (r['v'], r['n']) for r in rows}
+
+
+def totals_by_key(metric, since, branch=None):
+    """[(key, value)] for a split metric, largest first."""
+    rows = (_rows(metric, since, branch).values('key')
+            .annotate(v=Sum('value')).order_by('-v'))
+    return [(r['key'], r['v']) for r in rows]
+
+
+def period_totals(days, today):
+    """Today / this week (from Monday) / month / year totals from a
+    totals_by_day() result that reaches back at least to Jan 1."""
+    starts = {
+        'today': today,
+        'week': today - timedelta(days=today.weekday()),
+        'month': today.replace(day=1),
+        'year': today.replace(month=1, day=1),
+    }
+    return {name: float(sum((v for d, (v, _) in days.items() if start <= d <= today), Decimal('0')))
+            for name, start in starts.items()}
+
+
+def time_series(days, today):
+    """Day / week / month / year chart series (labels + data) from a
+    totals_by_day() result, in the shape the dashboard charts expect."""
+    def series(since, bucket, fmt):
+        totals = {}
+        for d, (v, _) in days.items():
+            if since <= d <= today:
+                b = bucket(d)
+                totals[b] = totals.get(b, Decimal('0')) + v
+        keys = sorted(totals)
+        return {'labels': [k.strftime(fmt) for k in keys], 'data': [float(totals[k]) for k in keys]}
+
+    return {
+        'day': series(today - timedelta(days=13), lambda d: d, '%d %b'),                 # last 14 days
+        'week': series(today - timedelta(weeks=11), lambda d: d - timedelta(days=d.weekday()), '%d %b'),
+        'month': series(today.replace(year=today.year - 1, day=1), lambda d: d.replace(day=1), '%b %Y'),
+        'year': series(today.replace(year=today.year - 4, month=1, day=1), lambda d: d.replace(month=1, day=1), '%Y'),
+    }
+
+
+def history_start(today):
+    """Earliest day any dashboard series needs (five calendar years)."""
+    return today.replace(year=today.year - 4, month=1, day=1)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import SystemActivity, Notification
+from .models import SystemActivity, Notification, Job
 from apps.users.serializers import UserSerializer
 
 
@@ -26,3 +26,16 @@ class ActivitySerializer(serializers.ModelSerializer):
     def get_time_ago(self, obj):
         from django.utils.timesince import timesince
         return timesince(obj.created_at) + " ago"
+
+
+class JobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'progress', 'total', 'result', 'error',
+                  'download_url', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        return f"/api/jobs/{obj.pk}/download/" if obj.result_file else None
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
@@ -76,3 +76,38 @@ def expense_activity(sender, instance, created, **kwargs):
             icon_class='bi-wallet2'
         )
         broadcast_activity(activity)
+
+
+# --- Dashboard rollups (apps.core.rollups) ---------------------------------
+# A saved or deleted sale/expense/purchase marks its (branch, day) bucket
+# dirty; the bucket is recomputed once after commit. Edits that move a row
+# to another day or branch refresh the old bucket as well.
+
+def _remember_old_bucket(sender, instance, **kwargs):
+    from . import rollups
+    if instance._state.adding or instance.pk is None:
+        return
+    label = sender._meta.label
+    old = sender.objects.only('branch', rollups.SOURCES[label]['date']).filter(pk=instance.pk).first()
+    instance._rollup_old_bucket = rollups.bucket_of(label, old) if old else None
+
+
+def _rollup_changed(sender, instance, **kwargs):
+    from . import rollups
+    label = sender._meta.label
+    rollups.mark_dirty(label, rollups.bucket_of(label, instance))
+    old = getattr(instance, '_rollup_old_bucket', None)
+    if old:
+        rollups.mark_dirty(label, old)
+
+
+def _connect_rollups():
+    from . import rollups
+    for label in rollups.SOURCES:
+        uid = f'rollup:{label}'
+        pre_save.connect(_remember_old_bucket, sender=label, dispatch_uid=uid)
+        post_save.connect(_rollup_changed, sender=label, dispatch_uid=uid)
+        post_delete.connect(_rollup_changed, sender=label, dispatch_uid=uid)
+
+
+_connect_rollups()
@@ -1,3 +1,256 @@
-from django.test import TestCase
+import io
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.users.models import User
+from apps.inventory.models import Category, Product
+
+
+class ListPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        category = Category.objects.create(name="Tools")
+        for i in range(5):
+            Product.objects.create(name=f"Item {i}", sku=f"T-{i}", category=category, price=10, cost=5)
+
+    def test_unpaged_by_default(self):
+        resp = self.client.get('/api/products/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsInstance(resp.json(), list)
+        self.assertEqual(len(resp.json()), 5)
+
+    def test_cursor_pages_walk_the_whole_table(self):
+        seen = []
+        url = '/api/products/?page_size=2'
+        while url:
+            body = self.client.get(url).json()
+            seen += [p['sku'] for p in body['results']]
+            url = body['next']
+        self.assertEqual(seen, ['T-4', 'T-3', 'T-2', 'T-1', 'T-0'])
+
+    def test_fields_projection(self):
+        body = self.client.get('/api/products/?fields=id,sku').json()
+        self.assertEqual(set(body[0]), {'id', 'sku'})
+
+
+@override_settings(JOBS_ALWAYS_EAGER=True, MEDIA_ROOT=tempfile.mkdtemp())
+class JobRunnerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_background_export_and_download(self):
+        self.client.force_login(self.user)
+        resp = self.client.get('/finance/expenses/report/export/?format=excel&background=1')
+        self.assertEqual(resp.status_code, 202)
+
+        job = self.client.get(resp.json()['status_url']).json()
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['kind'], 'finance.expense_report_export')
+
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('expense_report_', download['Content-Disposition'])
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'PK'))  # xlsx zip
+
+    def test_failures_are_recorded_and_jobs_are_private(self):
+        self.client.force_login(self.user)
+        resp = self.client.get('/finance/expenses/report/export/?format=doc&background=1')
+        job = self.client.get(resp.json()['status_url']).json()
+        self.assertEqual((job['status'], job['error']), ('failed', 'Unknown export format'))
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('clerk', password='x'))
+        self.assertEqual(other.get(resp.json()['status_url']).status_code, 404)
+
+
+    def test_recover_jobs_after_a_restart(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .jobs import register, run_job
+        from .models import Job
+        register('core.test_echo')(lambda job: {'echo': job.payload['value']})
+        long_ago = timezone.now() - timedelta(hours=3)
+        lost = Job.objects.create(kind='core.test_echo', status='running', started_at=long_ago)
+        waiting = Job.objects.create(kind='core.test_echo', payload={'value': 7})
+        Job.objects.filter(pk=waiting.pk).update(created_at=long_ago)
+
+        call_command('recover_jobs', stdout=io.StringIO())
+        lost.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertEqual(lost.status, 'failed')
+        self.assertIn('Interrupted', lost.error)
+        self.assertEqual((waiting.status, waiting.result), ('succeeded', {'echo': 7}))
+
+        # A job another worker already claimed isn't run again.
+        run_job(waiting.pk)
+        self.assertEqual(Job.objects.get(pk=waiting.pk).finished_at, waiting.finished_at)
+
+    def test_job_failed_as_stale_keeps_its_failure(self):
+        from datetime import timedelta
+        from .jobs import enqueue, recover, register
+        from .models import Job
+
+        @register('core.test_slow')
+        def slow(job):
+            recover(stale_after=timedelta(0))  # the cron sweep runs mid-job
+            return {'done': True}
+
+        job = enqueue('core.test_slow')
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Interrupted', job.error)
+        self.assertIsNone(Job.objects.get(pk=job.pk).result)
+
+
+class DailyRollupTest(TestCase):
+    def setUp(self):
+        from apps.inventory.models import Branch
+        from apps.finance.models import ExpenseCategory
+        self.branch = Branch.objects.create(name="Main Branch")
+        self.fuel = ExpenseCategory.objects.create(name="Fuel")
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def _expense(self, amount, day, category=None):
+        from apps.finance.models import Expense
+        with self.captureOnCommitCallbacks(execute=True):
+            return Expense.objects.create(branch=self.branch, category=category, description="x",
+                                          amount=amount, date_incurred=day, created_by=self.user)
+
+    def test_signals_keep_rollups_current(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import DailyMetric
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+
+        first = self._expense(100, today, self.fuel)
+        self._expense(50, today)
+        totals = {(m.metric, m.key): (m.value, m.count) for m in DailyMetric.objects.filter(day=today)}
+        self.assertEqual(totals[('expenses', '')], (150, 2))
+        self.assertEqual(totals[('expense_category', str(self.fuel.pk))], (100, 1))
+        self.assertEqual(totals[('expense_category', '')], (50, 1))
+
+        # Moving a row to another day refreshes both days.
+        first.date_incurred = yesterday
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+        self.assertEqual(DailyMetric.objects.get(metric='expenses', day=today).value, 50)
+        self.assertEqual(DailyMetric.objects.get(metric='expenses', day=yesterday).value, 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(DailyMetric.objects.filter(day=yesterday).exists())
+
+    def test_rebuild_and_dashboard(self):
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import DailyMetric
+        self._expense(70, timezone.localdate(), self.fuel)
+        DailyMetric.objects.all().delete()
+        call_command('rebuild_daily_metrics', stdout=io.StringIO())
+        self.assertEqual(DailyMetric.objects.get(metric='expenses').value, 70)
+
+        from django.contrib.auth.models import Group
+        accountant = User.objects.create_user('acc', password='x')
+        accountant.groups.add(Group.objects.create(name='Accountant'))
+        self.client.force_login(accountant)
+        resp = self.client.get('/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['exp_today'], 70.0)
+        self.assertEqual(resp.context['exp_by_category'], [{'name': 'Fuel', 'total': 70.0}])
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/').context['todays_sales_count'], 0)
+
+
+class ConcurrentRollupTest(TransactionTestCase):
+    def test_parallel_refreshes_of_one_bucket(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection as conn
+        from django.utils import timezone
+        from apps.finance.models import Expense, ExpenseCategory
+        from apps.inventory.models import Branch
+        from . import rollups
+        from .models import DailyMetric
+        branch = Branch.objects.create(name="Main Branch")
+        fuel = ExpenseCategory.objects.create(name="Fuel")
+        today = timezone.localdate()
+        for amount in (100, 50):
+            Expense.objects.create(branch=branch, category=fuel, description="x", amount=amount,
+                                   date_incurred=today)
+        DailyMetric.objects.all().delete()
+        start = threading.Barrier(4)
+
+        def worker(_):
+            try:
+                for _ in range(5):
+                    start.wait(timeout=10)
+                    rollups.refresh('finance.Expense', branch.pk, today)
+            except Exception:
+                start.abort()  # don't leave the other workers waiting
+                raise
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(worker, range(4)))
+
+        totals = {(m.metric, m.key): (m.value, m.count) for m in DailyMetric.objects.filter(day=today)}
+        self.assertEqual(totals, {('expenses', ''): (150, 2), ('expense_category', str(fuel.pk)): (150, 2),
+                                  ('expense_bank', ''): (150, 2)})
+
+
+class DocumentNumberTest(TestCase):
+    def test_series_allocate_blocks_without_lookups(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from apps.inventory.models import Branch, PurchaseOrder
+        from .numbering import allocate, next_number
+        main, town = Branch.objects.create(name="Main"), Branch.objects.create(name="Town")
+        tools = Category.objects.create(name="Tools")
+
+        with CaptureQueriesContext(connection) as ctx:
+            batch = allocate('PROD', 3)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(batch, ['PROD-0000001', 'PROD-0000002', 'PROD-0000003'])
+        self.assertEqual(Product.objects.create(name="Nails", category=tools, cost=1, price=1).sku, 'PROD-0000004')
+        service = Product.objects.create(name="Cutting", category=tools, cost=1, price=1, product_type='service')
+        self.assertEqual(service.sku, 'SERV-0000001')
+
+        # Invoice and PO numbers run per branch.
+        self.assertEqual(next_number('INV', branch=main), f'INV-{main.pk}-000001')
+        self.assertEqual(next_number('INV', branch=town), f'INV-{town.pk}-000001')
+        self.assertEqual(next_number('INV', branch=main.pk), f'INV-{main.pk}-000002')
+        self.assertEqual(PurchaseOrder.objects.create(branch=town).number, f'PO-{town.pk}-00001')
+
+
+class HistoryCompactionTest(TestCase):
+    def test_old_history_keeps_the_last_version_per_day(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        product = Product.objects.create(name="Nails", category=Category.objects.create(name="Tools"),
+                                         cost=1, price=1)
+        for price in (2, 3, 4):
+            product.price = price
+            product.save()
+        old = timezone.now() - timedelta(days=200)
+        history = Product.history.model.objects
+        # Two versions on an old day, one the day before; the rest are recent
+        # and stay as they are.
+        ids = list(history.order_by('history_id').values_list('history_id', flat=True))
+        history.filter(history_id__in=ids[:3]).update(history_date=old)
+        history.filter(history_id=ids[0]).update(history_date=old - timedelta(days=1))
+        product.price = 5
+        product.save()
+
+        out = io.StringIO()
+        call_command('compact_history', '--model', 'inventory.Product', stdout=out)
+        self.assertIn('removed 1 history rows', out.getvalue())
+        self.assertEqual(list(history.order_by('history_id').values_list('price', flat=True)), [1, 3, 4, 5])
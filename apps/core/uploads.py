@@ -0,0 +1,72 @@
+"""Streaming readers for spreadsheet uploads (CSV / Excel).
+
+read_upload() returns the header row plus a *generator* of row dicts, so an
+import never holds the whole file in memory: CSV is decoded line by line
+from the upload's chunks and .xlsx is opened with openpyxl in read-only
+mode. Importers consume the generator with chunked() and write each batch
+before the next one is parsed.
+"""
+import codecs
+import csv
+from itertools import islice
+
+
+class UnsupportedUpload(ValueError):
+    pass
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from any iterable."""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def check_upload(upload):
+    """Raise UnsupportedUpload unless the file is .csv / .xlsx / .xls."""
+    if not (upload.name or '').lower().endswith(('.csv', '.xlsx', '.xls')):
+        raise UnsupportedUpload("Unsupported file format. Please upload CSV or Excel.")
+
+
+def read_upload(upload):
+    """Return (headers, rows) for an uploaded .csv / .xlsx file.
+
+    `rows` yields one dict per non-empty data row, keyed by header. Raises
+    UnsupportedUpload for any other extension.
+    """
+    check_upload(upload)
+    if upload.name.lower().endswith('.csv'):
+        return _read_csv(upload)
+    return _read_xlsx(upload)
+
+
+def _read_csv(upload):
+    upload.seek(0)
+    # Iterating an UploadedFile yields lines read chunk by chunk; utf-8-sig
+    # also drops the BOM Excel puts in front of "Save as CSV" files.
+    reader = csv.DictReader(codecs.iterdecode(upload, 'utf-8-sig'))
+    headers = reader.fieldnames or []
+    return headers, iter(reader)
+
+
+def _read_xlsx(upload):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    sheet_rows = wb.active.iter_rows(values_only=True)
+    first = next(sheet_rows, None) or ()
+    headers = [str(v).strip() if v else "" for v in first]
+
+    def rows():
+        try:
+            for values in sheet_rows:
+                row = dict(zip(headers, values))
+                if any(row.values()):  # Skip empty rows
+                    yield row
+        finally:
+            wb.close()
+
+    return headers, rows()
@@ -1,21 +1,23 @@
 import json
-from datetime import date, timedelta
+from datetime import timedelta
 
 from django.conf import settings
 from django.http import FileResponse, Http404
 from django.shortcuts import redirect
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import F, Sum
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay
 from django.utils import timezone
 
 from apps.sales.models import Sale, Vehicle, Quotation, Customer
 from apps.inventory.models import (
-    Stock, Purchase, PurchaseOrder, Product,
+    Stock, PurchaseOrder, Product, Supplier,
     GoodsReceivedNote, StockAdjustment,
 )
-from apps.finance.models import Expense
+from apps.finance.models import ExpenseCategory, BankAccount
+
+from . import rollups
 
 
 def download_app(request):
@@ -36,6 +38,13 @@ def download_app(request):
     )
 
 
+def _named_totals(pairs, model, blank_label):
+    """[(fk id as str, total)] from a split rollup -> [{'name', 'total'}],
+    resolving the names with one IN query."""
+    names = dict(model.objects.filter(pk__in=[k for k, _ in pairs if k]).values_list('pk', 'name'))
+    return [{'name': names.get(int(k), blank_label) if k else blank_label, 'total': float(v)} for k, v in pairs]
+
+
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = "dashboard.html"
 
@@ -101,73 +110,40 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             context['low_stock_alert'] = Stock.objects.filter(quantity__lte=F('low_stock_threshold')).count()
             context['recent_approved'] = Sale.objects.filter(status='approved').order_by('-approved_at')[:5]
 
+        # Sales figures come from the daily rollups (apps.core.rollups).
+        today = timezone.localdate()
+        sales_per_day = rollups.totals_by_day('sales', today - timedelta(days=7))
+
         if is_privileged or getattr(user, 'is_sales_manager', False):
             context['pending_approvals'] = Sale.objects.filter(status='pending').count()
-            context['todays_sales_count'] = Sale.objects.filter(created_at__date=timezone.now().date()).count()
-            context['todays_revenue'] = Sale.objects.filter(created_at__date=timezone.now().date()).aggregate(
-                total=Sum('total_amount'))['total'] or 0
-        
+            todays_revenue, todays_count = sales_per_day.get(today, (0, 0))
+            context['todays_sales_count'] = todays_count
+            context['todays_revenue'] = todays_revenue
+
         # Chart Data: Sales per Day (Last 7 Days)
-        from django.db.models.functions import TruncDate
-        last_7_days = timezone.now() - timezone.timedelta(days=7)
-        sales_per_day = Sale.objects.filter(created_at__gte=last_7_days).annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(total=Sum('total_amount')).order_by('date')
-        
-        import json
-        dates = [s['date'].strftime('%Y-%m-%d') for s in sales_per_day]
-        revenues = [float(s['total']) for s in sales_per_day]
-        
-        context['sales_chart_labels'] = json.dumps(dates)
-        context['sales_chart_data'] = json.dumps(revenues)
+        context['sales_chart_labels'] = json.dumps([d.strftime('%Y-%m-%d') for d in sales_per_day])
+        context['sales_chart_data'] = json.dumps([float(v) for v, _ in sales_per_day.values()])
 
         return context
 
     def _add_expense_dashboard(self, context):
         """Build expenses-only data: totals by period + time series + by
         category and by bank. Used for the accountant dashboard."""
-        today = timezone.now().date()
-        expenses = Expense.objects.all()
-
-        def total(qs):
-            return float(qs.aggregate(t=Sum('amount'))['t'] or 0)
-
-        week_start = today - timedelta(days=today.weekday())          # Monday
-        month_start = today.replace(day=1)
-        year_start = today.replace(month=1, day=1)
-
-        context['exp_today'] = total(expenses.filter(date_incurred=today))
-        context['exp_week'] = total(expenses.filter(date_incurred__gte=week_start))
-        context['exp_month'] = total(expenses.filter(date_incurred__gte=month_start))
-        context['exp_year'] = total(expenses.filter(date_incurred__gte=year_start))
-
-        def series(trunc, since, fmt):
-            rows = (expenses.filter(date_incurred__gte=since)
-                    .annotate(p=trunc('date_incurred'))
-                    .values('p').annotate(t=Sum('amount')).order_by('p'))
-            return {
-                'labels': [r['p'].strftime(fmt) for r in rows if r['p']],
-                'data': [float(r['t']) for r in rows if r['p']],
-            }
-
-        time_series = {
-            'day': series(TruncDay, today - timedelta(days=13), '%d %b'),       # last 14 days
-            'week': series(TruncWeek, today - timedelta(weeks=11), '%d %b'),    # last 12 weeks
-            'month': series(TruncMonth, date(today.year - 1, today.month, 1), '%b %Y'),  # last ~12 months
-            'year': series(TruncYear, date(today.year - 4, 1, 1), '%Y'),       # last 5 years
-        }
-        context['exp_time_series'] = json.dumps(time_series)
+        today = timezone.localdate()
+        days = rollups.totals_by_day('expenses', rollups.history_start(today))
+        totals = rollups.period_totals(days, today)
+        context['exp_today'] = totals['today']
+        context['exp_week'] = totals['week']
+        context['exp_month'] = totals['month']
+        context['exp_year'] = totals['year']
+        context['exp_time_series'] = json.dumps(rollups.time_series(days, today))
 
         # Breakdown by category and by bank (this year)
-        ytd = expenses.filter(date_incurred__gte=year_start)
-
-        cat_rows = (ytd.values('category__name')
-                    .annotate(t=Sum('amount')).order_by('-t'))
-        cat = [{'name': r['category__name'] or 'Uncategorized', 'total': float(r['t'])} for r in cat_rows]
-
-        bank_rows = (ytd.values('bank__name')
-                     .annotate(t=Sum('amount')).order_by('-t'))
-        bank = [{'name': r['bank__name'] or 'Cash / none', 'total': float(r['t'])} for r in bank_rows]
+        year_start = today.replace(month=1, day=1)
+        cat = _named_totals(rollups.totals_by_key('expense_category', year_start),
+                            ExpenseCategory, 'Uncategorized')
+        bank = _named_totals(rollups.totals_by_key('expense_bank', year_start),
+                             BankAccount, 'Cash / none')
 
         context['exp_by_category'] = cat
         context['exp_by_bank'] = bank
@@ -180,53 +156,30 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         (Afisa Ugavi): spend by period, the purchase-order pipeline, top
         suppliers and the items that need re-ordering. Deliberately excludes
         sales revenue, dispatch and other figures outside their remit."""
-        today = timezone.now().date()
-        purchases = Purchase.objects.all()
-
-        def total(qs):
-            return float(qs.aggregate(t=Sum('total_cost'))['t'] or 0)
-
-        week_start = today - timedelta(days=today.weekday())          # Monday
-        month_start = today.replace(day=1)
-        year_start = today.replace(month=1, day=1)
-
-        context['pur_today'] = total(purchases.filter(date_purchased__date=today))
-        context['pur_week'] = total(purchases.filter(date_purchased__date__gte=week_start))
-        context['pur_month'] = total(purchases.filter(date_purchased__date__gte=month_start))
-        context['pur_year'] = total(purchases.filter(date_purchased__date__gte=year_start))
+        today = timezone.localdate()
+        days = rollups.totals_by_day('purchases', rollups.history_start(today))
+        totals = rollups.period_totals(days, today)
+        context['pur_today'] = totals['today']
+        context['pur_week'] = totals['week']
+        context['pur_month'] = totals['month']
+        context['pur_year'] = totals['year']
 
         # Purchase-order pipeline
-        context['po_draft'] = PurchaseOrder.objects.filter(status='draft').count()
-        context['po_sent'] = PurchaseOrder.objects.filter(status='sent').count()
-        context['po_received'] = PurchaseOrder.objects.filter(status='received').count()
+        pipeline = dict(PurchaseOrder.objects.filter(status__in=['draft', 'sent', 'received'])
+                        .values_list('status').annotate(n=Count('pk')).order_by())
+        context['po_draft'] = pipeline.get('draft', 0)
+        context['po_sent'] = pipeline.get('sent', 0)
+        context['po_received'] = pipeline.get('received', 0)
         context['recent_orders'] = (PurchaseOrder.objects
                                      .select_related('supplier', 'branch')
                                      .order_by('-created_at')[:6])
 
         # Spend over time, with granularity toggle (same shape as accountant)
-        def series(trunc, since, fmt):
-            rows = (purchases.filter(date_purchased__date__gte=since)
-                    .annotate(p=trunc('date_purchased'))
-                    .values('p').annotate(t=Sum('total_cost')).order_by('p'))
-            return {
-                'labels': [r['p'].strftime(fmt) for r in rows if r['p']],
-                'data': [float(r['t']) for r in rows if r['p']],
-            }
-
-        time_series = {
-            'day': series(TruncDay, today - timedelta(days=13), '%d %b'),       # last 14 days
-            'week': series(TruncWeek, today - timedelta(weeks=11), '%d %b'),    # last 12 weeks
-            'month': series(TruncMonth, date(today.year - 1, today.month, 1), '%b %Y'),  # ~12 months
-            'year': series(TruncYear, date(today.year - 4, 1, 1), '%Y'),       # last 5 years
-        }
-        context['pur_time_series'] = json.dumps(time_series)
+        context['pur_time_series'] = json.dumps(rollups.time_series(days, today))
 
         # Top suppliers by spend (this year)
-        ytd = purchases.filter(date_purchased__date__gte=year_start)
-        sup_rows = (ytd.values('supplier__name')
-                    .annotate(t=Sum('total_cost')).order_by('-t')[:8])
-        sup = [{'name': r['supplier__name'] or 'Unknown supplier', 'total': float(r['t'])}
-               for r in sup_rows]
+        sup = _named_totals(rollups.totals_by_key('purchase_supplier', today.replace(month=1, day=1))[:8],
+                            Supplier, 'Unknown supplier')
         context['pur_by_supplier'] = sup
         context['pur_by_supplier_json'] = json.dumps(sup)
 
@@ -0,0 +1,8 @@
+"""Background job handlers for the finance app (see apps.core.jobs)."""
+from apps.core.jobs import register, attach_response
+
+
+@register('finance.expense_report_export')
+def expense_report_export(job):
+    from .views import build_expense_export
+    return attach_response(job, build_expense_export(job.payload.get('params', {})))
@@ -98,8 +98,8 @@ class PaymentReceipt(models.Model):
     the amount on the receipt. We snapshot the invoice total and the invoice
     issuer at record time, and compute the outstanding balance the customer
     still owes (a receivable / "credit") after this and all prior receipts on
-    the same invoice. This is a standalone Finance ledger — it does not write
-    back to the Sale/Transaction records.
+    the same invoice. Receipts don't create Transactions, but they do count
+    towards the Sale's stored amount_paid / balance (apps.sales.receivables).
     """
     sale = models.ForeignKey('sales.Sale', on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_receipts')
     invoice_number = models.CharField(max_length=50, db_index=True, help_text="Invoice the customer paid against")
@@ -7,6 +7,8 @@ from rest_framework.response import Response
 from django.db.models import Sum
 from django.http import HttpResponse, Http404
 from apps.users.permissions import IsAccountant, CanRecordSupplierPayment
+from apps.core.jobs import enqueue, job_accepted
+from apps.core.mixins import FieldProjectionMixin
 from apps.sales.models import Sale
 from apps.inventory.models import Branch
 from .models import Expense, ExpenseCategory
@@ -39,12 +41,12 @@ class RecentExpenseListView(LoginRequiredMixin, TemplateView):
 class ExpenseCategoryListView(LoginRequiredMixin, TemplateView):
     template_name = 'finance/category_list.html'
 
-class ExpenseCategoryViewSet(viewsets.ModelViewSet):
+class ExpenseCategoryViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = ExpenseCategory.objects.all()
     serializer_class = ExpenseCategorySerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
-class BankAccountViewSet(viewsets.ModelViewSet):
+class BankAccountViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = BankAccount.objects.all().order_by('name')
     serializer_class = BankAccountSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -52,7 +54,7 @@ class BankAccountViewSet(viewsets.ModelViewSet):
 class BankListView(LoginRequiredMixin, TemplateView):
     template_name = 'finance/bank_list.html'
 
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Expense.objects.select_related('category', 'bank', 'branch').order_by('-date_incurred')
     serializer_class = ExpenseSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -60,12 +62,12 @@ class ExpenseViewSet(viewsets.ModelViewSet):
 class IncomeListView(LoginRequiredMixin, TemplateView):
     template_name = 'finance/income_list.html'
 
-class IncomeViewSet(viewsets.ModelViewSet):
+class IncomeViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Income.objects.all().order_by('-date_received')
     serializer_class = IncomeSerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
-class SupplierPaymentViewSet(viewsets.ModelViewSet):
+class SupplierPaymentViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = SupplierPayment.objects.all().order_by('-payment_date')
     serializer_class = SupplierPaymentSerializer
     permission_classes = [permissions.IsAuthenticated, CanRecordSupplierPayment]
@@ -76,7 +78,7 @@ class SupplierPaymentViewSet(viewsets.ModelViewSet):
 class SupplierPaymentListView(LoginRequiredMixin, TemplateView):
     template_name = 'finance/supplier_payment_list.html'
 
-class TaxPaymentViewSet(viewsets.ModelViewSet):
+class TaxPaymentViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = TaxPayment.objects.all().order_by('-payment_date')
     serializer_class = TaxPaymentSerializer
     permission_classes = [permissions.IsAuthenticated, IsAccountant]
@@ -90,8 +92,13 @@ class TaxPaymentListView(LoginRequiredMixin, TemplateView):
 class DebtorListView(LoginRequiredMixin, TemplateView):
     template_name = 'finance/debtor_list.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['branches'] = Branch.objects.order_by('name')
+        return context
+
 
-class PaymentReceiptViewSet(viewsets.ModelViewSet):
+class PaymentReceiptViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = PaymentReceipt.objects.select_related(
         'sale', 'customer', 'issued_by', 'created_by'
     ).order_by('-created_at')
@@ -367,14 +374,23 @@ def _export_pdf(qs, params):
     return resp
 
 
+def build_expense_export(params):
+    qs = _filter_expenses(params)
+    fmt = (params.get('format') or 'excel').lower()
+    if fmt in ('xlsx', 'excel'):
+        return _export_excel(qs, params)
+    if fmt == 'pdf':
+        return _export_pdf(qs, params)
+    raise Http404("Unknown export format")
+
+
 class ExpenseReportExportView(LoginRequiredMixin, TemplateView):
-    """GET ?format=excel|pdf plus the same filter params as the report page."""
+    """GET ?format=excel|pdf plus the same filter params as the report page.
+    With ?background=1 the file is built by a job (202 + job id)."""
 
     def get(self, request, *args, **kwargs):
-        qs = _filter_expenses(request.GET)
-        fmt = (request.GET.get('format') or 'excel').lower()
-        if fmt in ('xlsx', 'excel'):
-            return _export_excel(qs, request.GET)
-        if fmt == 'pdf':
-            return _export_pdf(qs, request.GET)
-        raise Http404("Unknown export format")
+        if request.GET.get('background'):
+            job = enqueue('finance.expense_report_export', request.user,
+                          payload={'params': request.GET.dict()})
+            return job_accepted(job)
+        return build_expense_export(request.GET)
@@ -0,0 +1,44 @@
+"""Background job handlers for the HR app (see apps.core.jobs)."""
+from django.utils import timezone
+
+from apps.core.jobs import register
+
+from .models import Employee, Payslip, PayrollPeriod
+
+
+@register('hr.generate_payslips')
+def generate_payslips(job):
+    """Generate a Payslip for every active employee in the period.
+
+    Idempotent: if a payslip already exists for (period, employee), it's
+    recomputed in place rather than duplicated.
+    """
+    period = PayrollPeriod.objects.get(pk=job.payload['period'])
+    active = list(Employee.objects.filter(status='active'))
+    job.report_progress(0, len(active))
+    created, updated = 0, 0
+    for i, emp in enumerate(active, start=1):
+        slip, was_created = Payslip.objects.get_or_create(period=period, employee=emp)
+        slip.basic_salary = emp.basic_salary
+        slip.housing_allowance = emp.housing_allowance
+        slip.transport_allowance = emp.transport_allowance
+        slip.other_allowances = emp.other_allowances
+        slip.save()  # recalculate fires here
+        if was_created:
+            created += 1
+        else:
+            updated += 1
+        if i % 50 == 0:
+            job.report_progress(i)
+    job.report_progress(len(active))
+
+    period.status = 'processed'
+    period.processed_by = job.created_by
+    period.processed_at = timezone.now()
+    period.save()
+    return {
+        'created': created,
+        'updated': updated,
+        'total': created + updated,
+        'status': period.status,
+    }
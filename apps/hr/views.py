@@ -7,6 +7,9 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from apps.core.jobs import enqueue, job_accepted
+from apps.core.mixins import FieldProjectionMixin
+
 from .models import (
     AttendanceRecord, Department, DisciplinaryAction, Employee, EmployeeDocument,
     JobPosition, LeaveRequest, LeaveType, PayrollPeriod, Payslip, PerformanceReview,
@@ -41,19 +44,19 @@ class StrictDjangoModelPermissions(permissions.DjangoModelPermissions):
 # ---------------------------------------------------------------------------
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [StrictDjangoModelPermissions]
 
 
-class JobPositionViewSet(viewsets.ModelViewSet):
+class JobPositionViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = JobPosition.objects.select_related('department').all()
     serializer_class = JobPositionSerializer
     permission_classes = [StrictDjangoModelPermissions]
 
 
-class EmployeeViewSet(viewsets.ModelViewSet):
+class EmployeeViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Employee.objects.select_related('department', 'position', 'branch', 'user').all()
     serializer_class = EmployeeSerializer
     permission_classes = [StrictDjangoModelPermissions]
@@ -93,13 +96,13 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             )
 
 
-class LeaveTypeViewSet(viewsets.ModelViewSet):
+class LeaveTypeViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = LeaveType.objects.all()
     serializer_class = LeaveTypeSerializer
     permission_classes = [StrictDjangoModelPermissions]
 
 
-class LeaveRequestViewSet(viewsets.ModelViewSet):
+class LeaveRequestViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = LeaveRequest.objects.select_related('employee', 'leave_type', 'approved_by').all()
     serializer_class = LeaveRequestSerializer
     permission_classes = [StrictDjangoModelPermissions]
@@ -135,7 +138,7 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
         return Response(LeaveRequestSerializer(leave).data)
 
 
-class AttendanceRecordViewSet(viewsets.ModelViewSet):
+class AttendanceRecordViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = AttendanceRecord.objects.select_related('employee').all()
     serializer_class = AttendanceRecordSerializer
     permission_classes = [StrictDjangoModelPermissions]
@@ -234,7 +237,7 @@ class AttendanceRecordViewSet(viewsets.ModelViewSet):
         return Response(AttendanceRecordSerializer(rec).data)
 
 
-class PayrollPeriodViewSet(viewsets.ModelViewSet):
+class PayrollPeriodViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = PayrollPeriod.objects.all()
     serializer_class = PayrollPeriodSerializer
     permission_classes = [StrictDjangoModelPermissions]
@@ -251,30 +254,9 @@ class PayrollPeriodViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Can only generate while period is draft or processed'},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        active = Employee.objects.filter(status='active')
-        created, updated = 0, 0
-        for emp in active:
-            slip, was_created = Payslip.objects.get_or_create(period=period, employee=emp)
-            slip.basic_salary = emp.basic_salary
-            slip.housing_allowance = emp.housing_allowance
-            slip.transport_allowance = emp.transport_allowance
-            slip.other_allowances = emp.other_allowances
-            slip.save()  # recalculate fires here
-            if was_created:
-                created += 1
-            else:
-                updated += 1
-
-        period.status = 'processed'
-        period.processed_by = request.user
-        period.processed_at = timezone.now()
-        period.save()
-        return Response({
-            'created': created,
-            'updated': updated,
-            'total': created + updated,
-            'status': period.status,
-        })
+        # Runs on the job pool; the payroll page polls /api/jobs/<id>/.
+        job = enqueue('hr.generate_payslips', request.user, payload={'period': period.pk})
+        return job_accepted(job)
 
     @action(detail=True, methods=['POST'])
     def mark_paid(self, request, pk=None):
@@ -287,13 +269,13 @@ class PayrollPeriodViewSet(viewsets.ModelViewSet):
         return Response(PayrollPeriodSerializer(period).data)
 
 
-class PayslipViewSet(viewsets.ModelViewSet):
+class PayslipViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Payslip.objects.select_related('period', 'employee').all()
     serializer_class = PayslipSerializer
     permission_classes = [StrictDjangoModelPermissions]
 
 
-class EmployeeDocumentViewSet(viewsets.ModelViewSet):
+class EmployeeDocumentViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = EmployeeDocument.objects.select_related('employee').all()
     serializer_class = EmployeeDocumentSerializer
     permission_classes = [StrictDjangoModelPermissions]
@@ -302,7 +284,7 @@ class EmployeeDocumentViewSet(viewsets.ModelViewSet):
         serializer.save(uploaded_by=self.request.user)
 
 
-class PerformanceReviewViewSet(viewsets.ModelViewSet):
+class PerformanceReviewViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = PerformanceReview.objects.select_related('employee', 'reviewer').all()
     serializer_class = PerformanceReviewSerializer
     permission_classes = [StrictDjangoModelPermissions]
@@ -311,7 +293,7 @@ class PerformanceReviewViewSet(viewsets.ModelViewSet):
         serializer.save(reviewer=self.request.user)
 
 
-class DisciplinaryActionViewSet(viewsets.ModelViewSet):
+class DisciplinaryActionViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = DisciplinaryAction.objects.select_related('employee', 'issued_by').all()
     serializer_class = DisciplinaryActionSerializer
     permission_classes = [StrictDjangoModelPermissions]
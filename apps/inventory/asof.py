@@ -0,0 +1,118 @@
+"""Stock on hand at a past moment ("what was at branch X on 30 June?").
+
+Usage:
+    from apps.inventory.asof import stock_as_of, take_snapshot
+
+    take_snapshot(day)                            # nightly, see snapshot_stock
+    levels, basis = stock_as_of(branch, moment)   # {product_id: qty}
+
+Every change to Stock.quantity is a StockMovement (apps.inventory.movements),
+whatever caused it: purchases, GRN lines, transfers, adjustments, dispatches.
+So a past level is a StockSnapshot plus the movements after it. stock_as_of()
+starts from the latest snapshot that ends before the moment asked for and
+adds only the movements in between, which for nightly snapshots is at most
+a day's worth, however long the history is.
+
+A snapshot for `day` is the level at the start of the next local day. It is
+computed as the current quantity less every movement since then, in one
+statement (so both are read at the same instant), which also means a
+missed night can be filled in later (``snapshot_stock --date``). Moments
+before the first snapshot are answered the same way, backwards from the
+current Stock.
+
+The ledger only began with the StockMovement table, and stock that was on
+hand before then has no movements behind it. Stepping back past a branch's
+first movement would return today's levels less partial history, so such
+answers come back with basis['complete'] False (the API says so too).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.core.uploads import chunked
+from .models import Stock, StockMovement, StockSnapshot
+
+BATCH_SIZE = 5000
+
+
+def day_end(day):
+    """The moment a snapshot for `day` describes: local midnight after it."""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _movements_since(moment):
+    return (StockMovement.objects
+            .filter(product=OuterRef('product_id'), branch=OuterRef('branch_id'), created_at__gte=moment)
+            .values('product').annotate(total=Sum('quantity')).values('total'))
+
+
+def take_snapshot(day, branches=None):
+    """(Re)write the snapshot for the end of `day`, for every branch or the
+    given ones. Returns the number of rows written."""
+    stocks = Stock.objects.all()
+    snapshots = StockSnapshot.objects.filter(day=day)
+    if branches is not None:
+        stocks = stocks.filter(branch__in=branches)
+        snapshots = snapshots.filter(branch__in=branches)
+    later = Coalesce(Subquery(_movements_since(day_end(day)), output_field=IntegerField()), Value(0))
+    rows = (stocks.annotate(level=F('quantity') - later).exclude(level=0)
+            .values_list('branch_id', 'product_id', 'level').order_by())
+
+    written = 0
+    with transaction.atomic():
+        snapshots.delete()
+        for batch in chunked(rows.iterator(chunk_size=BATCH_SIZE), BATCH_SIZE):
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(branch_id=b, product_id=p, day=day, quantity=q) for b, p, q in batch
+            ])
+            written += len(batch)
+    return written
+
+
+def _sums(qs):
+    totals, count = {}, 0
+    for row in qs.values('product_id').annotate(total=Sum('quantity'), n=Count('pk')).order_by():
+        totals[row['product_id']] = row['total']
+        count += row['n']
+    return totals, count
+
+
+def stock_as_of(branch, moment, products=None):
+    """({product_id: quantity on hand}, basis) at `branch` at `moment`.
+    Products with nothing on hand are left out. `products` narrows the
+    answer (a queryset or ids). `basis` says where the figures came from:
+    {'snapshot': day or None, 'movements': movements replayed,
+     'complete': False when `moment` is before the branch's ledger starts,
+     'history_starts': the first movement at the branch, or None}."""
+    branch_id = getattr(branch, 'pk', branch)
+    movements = StockMovement.objects.filter(branch_id=branch_id)
+    if products is not None:
+        movements = movements.filter(product__in=products)
+
+    latest = (StockSnapshot.objects
+              .filter(branch_id=branch_id, day__lt=timezone.localdate(moment))
+              .aggregate(day=Max('day'))['day'])
+    first = StockMovement.objects.filter(branch_id=branch_id).aggregate(at=Min('created_at'))['at']
+    if latest is not None:
+        base = StockSnapshot.objects.filter(branch_id=branch_id, day=latest)
+        delta, count = _sums(movements.filter(created_at__gte=day_end(latest), created_at__lte=moment))
+        sign = 1
+        complete = True
+    else:
+        # No snapshot that early: step back from today's levels instead.
+        base = Stock.objects.filter(branch_id=branch_id)
+        delta, count = _sums(movements.filter(created_at__gt=moment))
+        sign = -1
+        complete = first is not None and moment >= first
+    if products is not None:
+        base = base.filter(product__in=products)
+
+    levels = dict(base.values_list('product_id', 'quantity'))
+    for product_id, total in delta.items():
+        levels[product_id] = levels.get(product_id, 0) + sign * total
+    levels = {pk: qty for pk, qty in levels.items() if qty}
+    return levels, {'snapshot': latest if sign == 1 else None, 'movements': count,
+                    'complete': complete, 'history_starts': first}
@@ -43,3 +43,9 @@ class StockConsumer(AsyncWebsocketConsumer):
             'type': 'activity_update',
             'data': event['data']
         }))
+
+    async def job_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'job_update',
+            'data': event['data']
+        }))
@@ -0,0 +1,213 @@
+"""Cycle counts: freeze expected stock, take counted quantities in bulk,
+post the differences in one go.
+
+Usage:
+    from apps.inventory import counts
+
+    session = counts.open_session(branch, category=None, user=request.user)
+    counts.record(session, [{'sku': 'CEM-50', 'quantity': 12}, ...], mode='add')
+    counts.variances(session)          # queryset of counted lines that differ
+    counts.approve(session, user=request.user)
+
+open_session() writes one CountLine per stock product in scope with the
+branch's quantity at that moment as `expected` (products without a Stock
+row expect 0). The branch's Stock rows are read with a row lock, which waits
+for stock moves in flight and holds off new ones until the session exists,
+so every movement is either in `expected` or dated after the session opened,
+never both.
+
+record() takes any number of lines keyed by SKU (case-insensitive, as the
+till scanner reads them) or product id. Repeated lines are summed, so a
+scanner export with one row per scan works as is. mode='add' adds to what
+was already counted (several people counting different shelves), 'set'
+replaces it. SKUs are resolved in one query and the session's lines are
+locked and bulk-updated, so two uploads at once don't lose counts.
+
+The variance of a line is counted minus its book quantity: `expected` plus
+the movements posted at the branch between the session opening and the
+line's counted_at. A sale made after the snapshot but before the shelf was
+counted is already missing from the shelf and from the book, so it is not
+a variance. approve() posts every non-zero variance in one move_stock() call
+(reason 'count'); movements after counted_at stay as they are. One
+StockAdjustment per line is bulk-inserted for the adjustments screen,
+without the per-row activity and stock broadcasts; a single activity and a
+notification to whoever opened the session replace them.
+"""
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Upper
+from django.utils import timezone
+
+from .models import CountLine, CountSession, Product, Stock, StockAdjustment, StockMovement
+from .movements import move_stock
+
+BATCH_SIZE = 2000
+MODES = ('set', 'add')
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+class CountError(Exception):
+    """The session can't take this step (not open, bad input)."""
+
+
+def _user(user):
+    return user if getattr(user, 'is_authenticated', False) else None
+
+
+def open_session(branch, category=None, user=None, note=''):
+    products = Product.objects.filter(product_type='product')
+    if category is not None:
+        products = products.filter(category=category)
+    with transaction.atomic():
+        # Read on-hand under lock *before* the session (and its created_at)
+        # exists; move_stock() takes the same locks before dating movements.
+        on_hand = dict(Stock.objects.select_for_update().filter(branch=branch, product__in=products)
+                       .values_list('product_id', 'quantity'))
+        session = CountSession.objects.create(branch=branch, category=category, note=note,
+                                              created_by=_user(user))
+        CountLine.objects.bulk_create(
+            (CountLine(session=session, product_id=pk, expected=on_hand.get(pk, 0))
+             for pk in products.values_list('pk', flat=True).iterator()),
+            batch_size=BATCH_SIZE,
+        )
+    return session
+
+
+def _parse(rows):
+    """({product_id: qty}, {SKU: qty}, [bad rows]) from dicts with a
+    'product' or 'sku' and a 'quantity' (or 'counted' / 'qty')."""
+    by_id, by_sku, bad = {}, {}, []
+    for row in rows:
+        qty = next((row[k] for k in ('quantity', 'counted', 'qty') if row.get(k) not in (None, '')), None)
+        try:
+            qty = int(float(qty))
+        except (TypeError, ValueError):
+            bad.append(row)
+            continue
+        sku = str(row.get('sku') or '').strip().upper()
+        if row.get('product') not in (None, ''):
+            try:
+                key = int(row['product'])
+            except (TypeError, ValueError):
+                bad.append(row)
+                continue
+            by_id[key] = by_id.get(key, 0) + qty
+        elif sku:
+            by_sku[sku] = by_sku.get(sku, 0) + qty
+        else:
+            bad.append(row)
+    return by_id, by_sku, bad
+
+
+def record(session, rows, mode='set'):
+    """Apply counted quantities; returns (lines updated, unknown codes,
+    unreadable rows)."""
+    if mode not in MODES:
+        raise CountError(f"mode must be one of {', '.join(MODES)}")
+    quantities, by_sku, bad = _parse(rows)
+    unknown = []
+    if by_sku:
+        skus = dict(Product.objects.annotate(code=Upper('sku')).filter(code__in=list(by_sku))
+                    .values_list('code', 'pk'))
+        for code, qty in by_sku.items():
+            if code in skus:
+                quantities[skus[code]] = quantities.get(skus[code], 0) + qty
+            else:
+                unknown.append(code)
+
+    now = timezone.now()
+    with transaction.atomic():
+        session = CountSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'open':
+            raise CountError(f"{session.number} is {session.get_status_display().lower()}.")
+        lines = list(session.lines.select_for_update().filter(product_id__in=list(quantities)))
+        for line in lines:
+            qty = quantities.pop(line.product_id)
+            line.counted = (line.counted or 0) + qty if mode == 'add' else qty
+            line.counted_at = now
+        CountLine.objects.bulk_update(lines, ['counted', 'counted_at'], batch_size=BATCH_SIZE)
+    unknown += sorted(quantities)
+    return len(lines), unknown, bad
+
+
+def _book():
+    """What the ledger says was on the shelf when the line was counted: the
+    frozen `expected` plus every movement posted at the branch since the
+    session opened, up to the line's counted_at."""
+    moved = (StockMovement.objects
+             .filter(product=OuterRef('product_id'), branch=OuterRef('session__branch_id'),
+                     created_at__gt=OuterRef('session__created_at'), created_at__lte=OuterRef('counted_at'))
+             .values('product').annotate(total=Sum('quantity')).values('total'))
+    return F('expected') + Coalesce(Subquery(moved), 0)
+
+
+def _with_variance(session):
+    return (session.lines.filter(counted__isnull=False)
+            .annotate(book=_book())
+            .annotate(variance=F('counted') - F('book'))
+            .annotate(value=ExpressionWrapper(F('variance') * F('product__cost'), output_field=MONEY)))
+
+
+def variances(session):
+    """Counted lines whose count differs from the book quantity at the time
+    they were counted, with the difference and its value at cost."""
+    return _with_variance(session).exclude(variance=0).order_by('product_id')
+
+
+def summary(session):
+    """Line counts and variance totals for the whole session."""
+    totals = session.lines.aggregate(lines=Count('pk'), counted_lines=Count('pk', filter=Q(counted__isnull=False)))
+    totals.update(_with_variance(session).exclude(variance=0).aggregate(
+        differing=Count('pk'),
+        units_over=Coalesce(Sum('variance', filter=Q(variance__gt=0)), 0),
+        units_short=Coalesce(Sum(-F('variance'), filter=Q(variance__lt=0)), 0),
+        value=Coalesce(Sum(F('variance') * F('product__cost'), output_field=MONEY), Value(0), output_field=MONEY),
+    ))
+    return totals
+
+
+def approve(session, user=None):
+    """Post every variance; returns the number of products adjusted."""
+    user = _user(user)
+    with transaction.atomic():
+        session = CountSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'open':
+            raise CountError(f"{session.number} is {session.get_status_display().lower()}.")
+        deltas = list(variances(session).values_list('product_id', 'variance'))
+        move_stock([(pid, session.branch_id, d) for pid, d in deltas], reason='count',
+                   reference=session.number, user=user, broadcast=False)
+        StockAdjustment.objects.bulk_create([
+            StockAdjustment(product_id=pid, branch_id=session.branch_id,
+                            adjustment_type='addition' if d > 0 else 'deduction',
+                            quantity=abs(d), reason=f"Cycle count {session.number}", user=user)
+            for pid, d in deltas
+        ], batch_size=BATCH_SIZE)
+        session.status = 'approved'
+        session.approved_by = user
+        session.approved_at = timezone.now()
+        session.save(update_fields=['status', 'approved_by', 'approved_at'])
+
+        from apps.core.models import SystemActivity
+        from apps.core.notify import notify
+        from apps.core.signals import broadcast_activity
+        activity = SystemActivity.objects.create(
+            user=user, activity_type='stock', icon_class='bi-clipboard-check',
+            description=f"Cycle count {session.number} at {session.branch.name} approved: "
+                        f"{len(deltas)} products adjusted",
+        )
+        if session.created_by_id and session.created_by != user:
+            notify(session.created_by, title=f"Cycle count {session.number} approved",
+                   message=f"{len(deltas)} stock levels at {session.branch.name} were corrected.",
+                   url='/inventory/stock/adjustment/')
+        transaction.on_commit(lambda: broadcast_activity(activity))
+    return len(deltas)
+
+
+def cancel(session):
+    with transaction.atomic():
+        session = CountSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'open':
+            raise CountError(f"{session.number} is {session.get_status_display().lower()}.")
+        session.status = 'cancelled'
+        session.save(update_fields=['status'])
+    return session
@@ -0,0 +1,252 @@
+"""Set-based product catalogue import.
+
+ProductViewSet.import_products hands the parsed rows to ProductImporter,
+which works through them in batches. Each batch resolves its categories,
+products and Main Branch stock rows with a handful of ``IN`` queries and
+writes with bulk_create and one move_stock() call, instead of four
+get_or_create calls and a save() per line. Per-row problems are still
+reported as "Row N: ..." and the rest of the file carries on. If writing a
+batch fails (a value the database rejects), it is retried in halves, each in
+its own savepoint, until the offending rows are isolated and reported on
+their own; the good rows around them are still imported.
+"""
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history
+
+from apps.core.numbering import allocate
+from apps.core.uploads import chunked
+from .models import Branch, Category, Product, Stock
+from . import scan
+from .movements import move_stock
+from .search import update_search_vectors
+
+
+# Canonical field -> column header in the import template.
+COLUMNS = {
+    'name': 'Name',
+    'sku': 'SKU',
+    'category': 'Category',
+    'type': 'Type',
+    'cost': 'Cost',
+    'price': 'Price',
+    'weight': 'Weight (kg)',
+    'description': 'Description',
+    'opening_stock': 'Opening Stock',
+    'low_stock': 'Low Stock Alert',
+}
+
+def _number(value, default=0):
+    return float(str(value or default).replace(',', ''))
+
+
+class ProductImporter:
+    """Import product rows (dicts keyed by the file's own headers).
+
+    Usage:
+        importer = ProductImporter().run(rows)
+        importer.processed, importer.imported, importer.errors
+
+    `rows` may be a generator (see apps.core.uploads.read_upload); only one
+    batch is held in memory at a time. `progress`, if given, is called with
+    the importer after every batch.
+    """
+    batch_size = 1000
+    branch_name = "Main Branch"
+
+    def __init__(self, batch_size=None, progress=None):
+        if batch_size:
+            self.batch_size = batch_size
+        self.progress = progress
+        self.processed = 0
+        self.imported = 0
+        self.errors = []
+        self._columns = None
+        self._branch = None
+
+    def run(self, rows):
+        numbered = enumerate(rows, start=2)  # row 1 is the header
+        for batch in chunked(numbered, self.batch_size):
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(self)
+        return self
+
+    # -- parsing -------------------------------------------------------------
+
+    def _resolve_columns(self, headers):
+        """Map canonical fields to the file's headers once, case-insensitively."""
+        lookup = {}
+        for h in headers:
+            if h:
+                lookup.setdefault(str(h).strip().lower(), h)
+        return {field: lookup.get(label.lower()) for field, label in COLUMNS.items()}
+
+    def _parse(self, row_no, row):
+        if self._columns is None:
+            self._columns = self._resolve_columns(row.keys())
+
+        def get(field, default=''):
+            key = self._columns[field]
+            val = row.get(key) if key is not None else None
+            return val if val is not None else default
+
+        category = get('category', None)
+        if not category:
+            raise ValueError("Missing Category")
+        name = get('name', None)
+        if not name:
+            raise ValueError("Missing Product Name")
+        name = str(name).strip()
+        sku = get('sku', None)
+        sku = str(sku).strip() if sku else None
+        if len(name) > Product._meta.get_field('name').max_length:
+            raise ValueError("Product Name is too long")
+        if sku and len(sku) > Product._meta.get_field('sku').max_length:
+            raise ValueError("SKU is too long")
+
+        try:
+            opening_stock = int(_number(get('opening_stock', 0)))
+            low_stock = int(_number(get('low_stock', 10), default=10))
+        except (ValueError, TypeError):
+            opening_stock, low_stock = 0, 10
+
+        return {
+            'row': row_no,
+            'name': name,
+            'sku': sku,
+            'category': str(category).strip(),
+            'product_type': str(get('type', 'product')).lower().strip(),
+            'cost': _number(get('cost', 0)),
+            'price': _number(get('price', 0)),
+            'weight': _number(get('weight', 0)),
+            'description': str(get('description', '')).strip(),
+            'opening_stock': opening_stock,
+            'low_stock': low_stock,
+        }
+
+    # -- batch -----------------------------------------------------------------
+
+    def import_batch(self, batch):
+        """Import one list of (row_number, row_dict) pairs."""
+        parsed = []
+        for row_no, row in batch:
+            self.processed += 1
+            try:
+                parsed.append(self._parse(row_no, row))
+            except Exception as e:
+                self.errors.append(f"Row {row_no}: {e}")
+        if not parsed:
+            return
+
+        self._write_isolating(parsed)
+
+    def _write_isolating(self, parsed):
+        """Write the rows in one savepoint; if that fails, split them in
+        halves and retry each, down to single rows, so only the rows the
+        database rejects are lost (log2(n) extra attempts per bad row)."""
+        try:
+            with transaction.atomic():
+                self._write(parsed)
+        except Exception as e:
+            # The Main Branch may have been created in the rolled-back savepoint.
+            self._branch = None
+            if len(parsed) == 1:
+                self.errors.append(f"Row {parsed[0]['row']}: {e}")
+                return
+            half = len(parsed) // 2
+            self._write_isolating(parsed[:half])
+            self._write_isolating(parsed[half:])
+            return
+        self.imported += len(parsed)
+
+    def _write(self, parsed):
+        categories = self._categories({p['category'] for p in parsed})
+        products = self._products(parsed, categories)
+        self._stock(parsed, products)
+
+    def _categories(self, names):
+        found = {}
+        # Highest pk first so the oldest category wins when names repeat.
+        for c in Category.objects.filter(name__in=names).order_by('-pk'):
+            found[c.name] = c
+        missing = [Category(name=n) for n in names if n not in found]
+        for c in Category.objects.bulk_create(missing):
+            found[c.name] = c
+        return found
+
+    def _products(self, parsed, categories):
+        """Return one Product per parsed row (same order), creating the new
+        ones in bulk. Rows with a SKU match on SKU; rows without one match
+        on name + category, as the one-at-a-time import did."""
+        by_sku = Product.objects.in_bulk({p['sku'] for p in parsed if p['sku']}, field_name='sku')
+        by_name = {}
+        unkeyed = [p for p in parsed if not p['sku']]
+        if unkeyed:
+            existing = (Product.objects
+                        .filter(name__in={p['name'] for p in unkeyed},
+                                category__in=[categories[p['category']] for p in unkeyed])
+                        .order_by('-pk'))
+            for prod in existing:
+                by_name[(prod.name, prod.category_id)] = prod
+
+        resolved, new = [], []
+        for p in parsed:
+            category = categories[p['category']]
+            if p['sku']:
+                product = by_sku.get(p['sku'])
+            else:
+                product = by_name.get((p['name'], category.pk))
+            if product is None:
+                product = Product(
+                    name=p['name'], sku=p['sku'], category=category,
+                    product_type=p['product_type'], cost=p['cost'], price=p['price'],
+                    weight=p['weight'], description=p['description'],
+                )
+                new.append(product)
+                # Later rows of the same file resolve to this new product.
+                if p['sku']:
+                    by_sku[p['sku']] = product
+                else:
+                    by_name[(p['name'], category.pk)] = product
+            resolved.append(product)
+
+        if new:
+            self._assign_skus(new)
+            bulk_create_with_history(new, Product, batch_size=self.batch_size)
+            update_search_vectors(new)
+            transaction.on_commit(lambda: [scan.product_changed(p) for p in new])
+        return resolved
+
+    def _assign_skus(self, products):
+        """Number new products that came without a SKU, reserving one block
+        per series (PROD- / SERV-) for the whole batch."""
+        pending = {}
+        for p in products:
+            if not p.sku:
+                pending.setdefault("PROD" if p.product_type == 'product' else "SERV", []).append(p)
+        for prefix, group in pending.items():
+            for p, sku in zip(group, allocate(prefix, len(group))):
+                p.sku = sku
+
+    def _stock(self, parsed, products):
+        """Add each row's opening stock to the product's Main Branch stock."""
+        if self._branch is None:
+            self._branch, _ = Branch.objects.get_or_create(name=self.branch_name)
+
+        wanted = {}  # product pk -> [opening total, threshold for a new row]
+        for p, product in zip(parsed, products):
+            if p['product_type'] != 'product':
+                continue
+            entry = wanted.setdefault(product.pk, [0, p['low_stock']])
+            entry[0] += p['opening_stock']
+        if not wanted:
+            return
+
+        # New rows take the file's Low Stock Alert; existing rows keep theirs.
+        Stock.objects.bulk_create(
+            [Stock(product_id=pk, branch=self._branch, quantity=0, low_stock_threshold=low)
+             for pk, (_, low) in sorted(wanted.items())],
+            ignore_conflicts=True,
+        )
+        move_stock([(pk, self._branch, qty) for pk, (qty, _) in wanted.items()],
+                   reason='import', reference='Product import')
@@ -0,0 +1,34 @@
+"""Background job handlers for the inventory app (see apps.core.jobs)."""
+from apps.core.jobs import register, attach_response
+from apps.core.uploads import read_upload
+
+from .importers import ProductImporter
+
+
+@register('inventory.import_products')
+def import_products(job):
+    with job.input_file.open('rb') as f:
+        headers, rows = read_upload(f)
+        importer = ProductImporter(progress=lambda imp: job.report_progress(imp.processed))
+        try:
+            importer.run(rows)
+        except Exception as e:
+            importer.errors.append(f"Failed to read file after row {importer.processed + 1}: {str(e)}")
+    job.report_progress(importer.processed)
+    return {
+        "message": f"Processed {importer.processed} rows, successfully imported/found {importer.imported} products.",
+        "errors": importer.errors,
+        "detected_headers": headers,
+    }
+
+
+@register('inventory.purchase_report_export')
+def purchase_report_export(job):
+    from .views import build_purchase_export
+    return attach_response(job, build_purchase_export(job.payload.get('params', {})))
+
+
+@register('inventory.transport_cost_export')
+def transport_cost_export(job):
+    from .views import build_truck_cost_export
+    return attach_response(job, build_truck_cost_export(job.payload.get('params', {})))
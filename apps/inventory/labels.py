@@ -0,0 +1,70 @@
+"""Printable barcode label sheets (A4, 3 x 8 labels of 70 x 37 mm).
+
+Each label carries the product name, a Code 128 barcode of the SKU (what
+the till scanner reads, see apps.inventory.scan) and the selling price.
+
+    pdf_bytes = label_sheet([(product, copies), ...], title="GRN #12")
+"""
+import io
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+COLUMNS, ROWS = 3, 8
+LABEL_W, LABEL_H = 70 * mm, 37 * mm
+MAX_LABELS = 2000
+
+
+def _barcode_png(sku):
+    import barcode
+    from barcode.writer import ImageWriter
+    buf = io.BytesIO()
+    barcode.get('code128', sku, writer=ImageWriter()).write(buf, options={
+        'module_height': 10, 'font_size': 7, 'text_distance': 3, 'quiet_zone': 2,
+    })
+    buf.seek(0)
+    return ImageReader(buf)
+
+
+def label_sheet(items, title="Labels"):
+    """PDF bytes with `copies` labels for each (product, copies) pair, in
+    order. Products without a SKU are skipped; at most MAX_LABELS labels."""
+    buf = io.BytesIO()
+    pdf = canvas.Canvas(buf, pagesize=A4)
+    pdf.setTitle(title)
+    page_w, page_h = A4
+    left = (page_w - COLUMNS * LABEL_W) / 2
+    top = page_h - (page_h - ROWS * LABEL_H) / 2
+
+    images = {}
+    slot = 0
+    for product, copies in items:
+        if not product.sku:
+            continue
+        if product.sku not in images:
+            images[product.sku] = _barcode_png(product.sku)
+        for _ in range(max(0, int(copies))):
+            if slot >= MAX_LABELS:
+                break
+            if slot and slot % (COLUMNS * ROWS) == 0:
+                pdf.showPage()
+            col = slot % COLUMNS
+            row = (slot // COLUMNS) % ROWS
+            x = left + col * LABEL_W
+            y = top - (row + 1) * LABEL_H
+
+            pdf.setFont('Helvetica-Bold', 8)
+            pdf.drawCentredString(x + LABEL_W / 2, y + LABEL_H - 5 * mm, product.name[:40])
+            pdf.drawImage(images[product.sku], x + 5 * mm, y + 7 * mm,
+                          width=LABEL_W - 10 * mm, height=LABEL_H - 14 * mm, preserveAspectRatio=True)
+            pdf.setFont('Helvetica', 8)
+            pdf.drawCentredString(x + LABEL_W / 2, y + 3 * mm, 'TZS {:,.0f}'.format(product.price))
+            slot += 1
+
+    if not slot:
+        pdf.setFont('Helvetica', 10)
+        pdf.drawString(20 * mm, page_h - 20 * mm, "No products with a SKU to label.")
+    pdf.save()
+    return buf.getvalue()
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.inventory.asof import take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshot stock on hand per branch at the end of a day (run nightly, after midnight)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to snapshot (YYYY-MM-DD, default: yesterday)')
+        parser.add_argument('--days', type=int, default=1,
+                            help='Also snapshot the N-1 days before it (backfill)')
+        parser.add_argument('--branch', type=int, action='append', help='Only this branch id (repeatable)')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                last = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('--date must be a date like 2026-06-30')
+        else:
+            last = timezone.localdate() - timedelta(days=1)
+        if last >= timezone.localdate():
+            raise CommandError('Only days that have ended can be snapshotted')
+
+        for offset in range(max(1, options['days'])):
+            day = last - timedelta(days=offset)
+            written = take_snapshot(day, options['branch'])
+            self.stdout.write(self.style.SUCCESS(f'Snapshot for {day}: {written} stock rows.'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory.reorder import DEFAULT_DAYS, DEFAULT_SERVICE_LEVEL, apply, compute
+
+
+class Command(BaseCommand):
+    help = 'Set Stock.low_stock_threshold to a reorder point computed from dispatched sales and PO lead times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='Sales history window in days')
+        parser.add_argument('--service-level', type=float, default=DEFAULT_SERVICE_LEVEL,
+                            help='Chance of not running out during a lead time (0.5-0.999)')
+        parser.add_argument('--branch', type=int, help='Only this branch id')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving')
+
+    def handle(self, *args, **options):
+        if options['days'] < 2:
+            raise CommandError('--days must be at least 2')
+        if not 0.5 <= options['service_level'] < 1:
+            raise CommandError('--service-level must be between 0.5 and 0.999')
+
+        started = time.monotonic()
+        plan = compute(options['days'], options['service_level'], options['branch'])
+        changed = apply(plan, dry_run=options['dry_run'])
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(plan.reorder)} product/branch pairs with sales; {verb.lower()} '
+            f'{changed} thresholds in {time.monotonic() - started:.1f}s.'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_purchaseorder_afisa_comment_purchaseorder_checked_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(help_text='Signed change: + in, - out')),
+                ('balance_after', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening Stock'), ('import', 'Product Import'), ('purchase', 'Purchase'), ('po_receipt', 'Purchase Order Receipt'), ('grn', 'Goods Received'), ('transfer', 'Branch Transfer'), ('adjustment', 'Adjustment'), ('correction', 'Correction'), ('sale', 'Sale Dispatch'), ('sale_reversal', 'Sale Reversal')], max_length=20)),
+                ('reference', models.CharField(blank=True, help_text='e.g. PO-00012, INV-..., Transfer #4', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.branch')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['product', 'branch', 'created_at'], name='inventory_s_product_2cc34f_idx')],
+            },
+        ),
+    ]
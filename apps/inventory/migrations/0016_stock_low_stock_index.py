@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_purchase_product_branch_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('low_stock_threshold'))), fields=['branch', 'product'], name='inventory_stock_low_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from django.contrib.postgres.search import SearchVector
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_search_vectors(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    Category = apps.get_model('inventory', 'Category')
+    category = Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1]
+    Product.objects.update(search_vector=(
+        SearchVector('name', 'sku', weight='A', config='simple')
+        + SearchVector(Coalesce(Subquery(category), Value('')), weight='B', config='simple')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_stock_low_stock_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='inventory_product_search'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('sku'), name='varchar_pattern_ops'), name='inventory_product_sku_pfx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
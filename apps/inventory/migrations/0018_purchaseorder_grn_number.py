@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:25
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Concat, LPad
+
+
+def number_existing(apps, schema_editor):
+    # Keep the id-based numbers these documents were already shown with.
+    # New ones come from the per-branch series (PO-<branch>-00001), which
+    # can't produce these.
+    for model, prefix in (('PurchaseOrder', 'PO-'), ('GoodsReceivedNote', 'GRN-')):
+        apps.get_model('inventory', model).objects.update(
+            number=Concat(Value(prefix), LPad(Cast(F('id'), models.CharField()), 5, Value('0'))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_documentsequence'),
+        ('inventory', '0017_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='number',
+            field=models.CharField(editable=False, max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='goodsreceivednote',
+            name='number',
+            field=models.CharField(editable=False, max_length=30, null=True),
+        ),
+        migrations.RunPython(number_existing, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='number',
+            field=models.CharField(editable=False, max_length=30, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='goodsreceivednote',
+            name='number',
+            field=models.CharField(editable=False, max_length=30, unique=True),
+        ),
+    ]
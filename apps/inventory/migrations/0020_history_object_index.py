@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_stocksnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalproduct',
+            index=models.Index(fields=['id', 'history_date'], name='inventory_h_id_e06d48_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalpurchase',
+            index=models.Index(fields=['id', 'history_date'], name='inventory_h_id_f5c09f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalstock',
+            index=models.Index(fields=['id', 'history_date'], name='inventory_h_id_15e19c_idx'),
+        ),
+    ]
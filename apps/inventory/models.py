@@ -1,9 +1,11 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import User
-from simple_history.models import HistoricalRecords
-import random
-import string
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.functions import Upper
+
+from apps.core.history import IndexedHistoricalRecords
 
 class Branch(models.Model):
     name = models.CharField(max_length=100)
@@ -39,18 +41,23 @@ class Product(models.Model):
     weight = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Weight in kg")
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    history = HistoricalRecords()
+    # Name, SKU and category name for /api/products/search/; maintained by
+    # apps.inventory.search.update_search_vectors().
+    search_vector = SearchVectorField(null=True, editable=False)
+    history = IndexedHistoricalRecords(excluded_fields=['search_vector'])
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='inventory_product_search'),
+            # sku__istartswith (typeahead / scanner prefixes)
+            models.Index(OpClass(Upper('sku'), name='varchar_pattern_ops'), name='inventory_product_sku_pfx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.sku:
-            # Generate a unique SKU if not provided
-            prefix = "PROD" if self.product_type == 'product' else "SERV"
-            while True:
-                random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-                new_sku = f"{prefix}-{random_str}"
-                if not Product.objects.filter(sku=new_sku).exists():
-                    self.sku = new_sku
-                    break
+            # Number products without a SKU from the PROD- / SERV- series
+            from apps.core.numbering import next_number
+            self.sku = next_number("PROD" if self.product_type == 'product' else "SERV")
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -61,14 +68,95 @@ class Stock(models.Model):
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stocks')
     quantity = models.IntegerField(default=0)
     low_stock_threshold = models.IntegerField(default=10)
-    history = HistoricalRecords()
+    history = IndexedHistoricalRecords()
 
     class Meta:
         unique_together = ('product', 'branch')
+        indexes = [
+            # Only the rows at or below their threshold, so low-stock counts
+            # and lists stay small scans however many stock rows there are.
+            models.Index(fields=['branch', 'product'], name='inventory_stock_low_idx',
+                         condition=models.Q(quantity__lte=models.F('low_stock_threshold'))),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.branch.name}: {self.quantity}"
 
+
+class StockMovement(models.Model):
+    """Append-only ledger: one row per Stock quantity change, written by
+    apps.inventory.movements. `balance_after` is the stock level right after
+    this movement, so any past level can be read straight off the ledger."""
+    REASONS = (
+        ('opening', 'Opening Stock'),
+        ('import', 'Product Import'),
+        ('purchase', 'Purchase'),
+        ('po_receipt', 'Purchase Order Receipt'),
+        ('grn', 'Goods Received'),
+        ('transfer', 'Branch Transfer'),
+        ('adjustment', 'Adjustment'),
+        ('correction', 'Correction'),
+        ('count', 'Cycle Count'),
+        ('sale', 'Sale Dispatch'),
+        ('sale_reversal', 'Sale Reversal'),
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='movements')
+    quantity = models.IntegerField(help_text="Signed change: + in, - out")
+    balance_after = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASONS)
+    reference = models.CharField(max_length=100, blank=True, help_text="e.g. PO-00012, INV-..., Transfer #4")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [models.Index(fields=['product', 'branch', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_reason_display()} {self.quantity:+d} {self.product_id}@{self.branch_id}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Stock movements are append-only")
+        return super().save(*args, **kwargs)
+
+
+class DemandForecast(models.Model):
+    """Expected dispatches of a product at a branch on `day`, written by
+    ``manage.py forecast_demand`` (apps.inventory.forecasting). Each run
+    replaces the forecasts it covers."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='forecasts')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='forecasts')
+    day = models.DateField()
+    quantity = models.FloatField()
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('branch', 'product', 'day')
+        ordering = ['day']
+
+    def __str__(self):
+        return f"{self.product_id}@{self.branch_id} {self.day}: {self.quantity:.1f}"
+
+
+class StockSnapshot(models.Model):
+    """Stock on hand per product and branch at the end of `day`, written
+    nightly by ``manage.py snapshot_stock``. Past levels are answered from
+    the nearest snapshot plus the StockMovements after it (apps.inventory.asof).
+    Products with nothing on hand have no row."""
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stock_snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    day = models.DateField()
+    quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = ('branch', 'day', 'product')
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.product_id}@{self.branch_id} {self.day}: {self.quantity}"
+
 class Supplier(models.Model):
     name = models.CharField(max_length=200)
     contact_name = models.CharField(max_length=100, blank=True)
@@ -90,7 +178,11 @@ class Purchase(models.Model):
     # This model records inbound stock. In a real app we might have a 'PurchaseOrder' parent.
     # For simplicity, we record individual line item purchases or simple records.
     # User asked for "Purchases (Supplier orders)". I will keep it simple.
-    history = HistoricalRecords()
+    history = IndexedHistoricalRecords()
+
+    class Meta:
+        # Latest purchase of a product at a branch (inventory aging).
+        indexes = [models.Index(fields=['product', 'branch', 'date_purchased'])]
 
     def save(self, *args, **kwargs):
         self.total_cost = self.quantity * self.unit_cost
@@ -110,6 +202,7 @@ class PurchaseOrder(models.Model):
     )
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, related_name='purchase_orders')
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='purchase_orders')
+    number = models.CharField(max_length=30, unique=True, editable=False)
     order_date = models.DateField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
@@ -125,8 +218,14 @@ class PurchaseOrder(models.Model):
     store_note = models.TextField(blank=True, help_text="Store Manager's note during cross-check")
     afisa_comment = models.TextField(blank=True, help_text="Afisa Ugavi's explanation for a discrepancy")
 
+    def save(self, *args, **kwargs):
+        if not self.number:
+            from apps.core.numbering import next_number
+            self.number = next_number('PO', branch=self.branch_id)
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"PO #{self.id} - {self.supplier}"
+        return f"{self.number} - {self.supplier}"
 
 class PurchaseOrderItem(models.Model):
     UNIT_CHOICES = [
@@ -155,13 +254,20 @@ class PurchaseOrderItem(models.Model):
 class GoodsReceivedNote(models.Model):
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='grns', null=True, blank=True)
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='grns')
+    number = models.CharField(max_length=30, unique=True, editable=False)
     received_date = models.DateTimeField(auto_now_add=True)
     receipt_number = models.CharField(max_length=50, unique=True, help_text="Delivery Note / Receipt Number from Supplier")
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
+    def save(self, *args, **kwargs):
+        if not self.number:
+            from apps.core.numbering import next_number
+            self.number = next_number('GRN', branch=self.branch_id)
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"GRN #{self.id} - {self.receipt_number}"
+        return f"{self.number} - {self.receipt_number}"
 
 class GRNItem(models.Model):
     grn = models.ForeignKey(GoodsReceivedNote, on_delete=models.CASCADE, related_name='items')
@@ -292,6 +398,103 @@ class StockTransfer(models.Model):
     def __str__(self):
         return f"Transfer {self.product.name} ({self.quantity}) from {self.from_branch} to {self.to_branch}"
 
+class TransferOrder(models.Model):
+    """A branch-to-branch transfer of many products (see
+    apps.inventory.transfers). Stock leaves the source branch on dispatch
+    and arrives at the destination on receipt; in between it is in transit
+    and counted at neither branch."""
+    STATUS_CHOICES = (
+        ('draft', 'Draft'),
+        ('in_transit', 'In Transit'),
+        ('received', 'Received'),
+        ('cancelled', 'Cancelled'),
+    )
+    number = models.CharField(max_length=30, unique=True, editable=False)
+    from_branch = models.ForeignKey(Branch, related_name='transfer_orders_out', on_delete=models.CASCADE)
+    to_branch = models.ForeignKey(Branch, related_name='transfer_orders_in', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    note = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                                      blank=True, related_name='+')
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    received_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                                    blank=True, related_name='+')
+    received_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def save(self, *args, **kwargs):
+        if not self.number:
+            from apps.core.numbering import next_number
+            self.number = next_number('TRF', branch=self.from_branch_id)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.number} {self.from_branch} -> {self.to_branch}"
+
+class TransferOrderItem(models.Model):
+    transfer = models.ForeignKey(TransferOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('transfer', 'product')
+
+    def __str__(self):
+        return f"{self.product} x {self.quantity}"
+
+class CountSession(models.Model):
+    """A cycle count at one branch, optionally one category (see
+    apps.inventory.counts). `expected` on each line is frozen when the
+    session opens; approval posts the difference between the count and the
+    book quantity when the line was counted (expected plus the movements
+    since the session opened)."""
+    STATUS_CHOICES = (
+        ('open', 'Open'),
+        ('approved', 'Approved'),
+        ('cancelled', 'Cancelled'),
+    )
+    number = models.CharField(max_length=30, unique=True, editable=False)
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='count_sessions')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    note = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    approved_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                                    blank=True, related_name='+')
+    approved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def save(self, *args, **kwargs):
+        if not self.number:
+            from apps.core.numbering import next_number
+            self.number = next_number('CNT', branch=self.branch_id)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.number} ({self.branch})"
+
+class CountLine(models.Model):
+    session = models.ForeignKey(CountSession, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    expected = models.IntegerField()
+    counted = models.IntegerField(null=True, blank=True)
+    counted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('session', 'product')
+
+    def __str__(self):
+        return f"{self.product} {self.counted}/{self.expected}"
+
 class StockAdjustment(models.Model):
     ADJUSTMENT_TYPES = (
         ('addition', 'Addition (+)'),
@@ -0,0 +1,159 @@
+"""Stock movement service: the one place Stock.quantity is changed.
+
+Usage:
+    from apps.inventory.movements import move_stock, set_stock, InsufficientStock
+
+    move_stock([(product, branch, -5), (other, branch, -2)], reason='sale',
+               reference=sale.invoice_number, user=request.user,
+               require_available=True)
+
+Each call is one transaction:
+  1. missing Stock rows are created at 0,
+  2. every affected row is locked by a single SELECT ... FOR UPDATE ordered
+     by (branch, product), so concurrent callers always take their locks in
+     the same order and can't deadlock each other,
+  3. a single UPDATE applies all deltas (quantity = quantity + CASE ...).
+     With require_available that same statement only matches rows still
+     holding enough stock, so nothing can slip in between check and write,
+  4. one StockMovement per row (the append-only ledger) is bulk-inserted;
+     Stock history rows only if settings.STOCK_HISTORY_WITH_LEDGER is on
+     (see apps.core.history).
+stock_update / low_stock_alert broadcasts go out after commit, as the
+Stock post_save signal would have sent them (broadcast=False leaves them to
+the caller, for bulk postings that announce themselves once).
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from apps.core.history import bulk_history, stock_history_with_ledger
+from .models import Stock, StockMovement
+
+
+class InsufficientStock(Exception):
+    """Raised (and the whole movement rolled back) when require_available
+    is set and a row would go below zero. `messages` has one line per
+    short product, worded as the dispatch screen always showed them."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [(stock, requested, had_row)]
+        super().__init__("; ".join(self.messages))
+
+    @property
+    def messages(self):
+        lines = []
+        for stock, requested, had_row in self.shortages:
+            if had_row:
+                lines.append(f"Insufficient stock for {stock.product.name}")
+            else:
+                lines.append(f"No stock record for {stock.product.name} at this branch")
+        return lines
+
+
+def _pk(obj):
+    return getattr(obj, 'pk', obj)
+
+
+def _match(keys):
+    q = Q()
+    for branch_id, product_id in keys:
+        q |= Q(branch_id=branch_id, product_id=product_id)
+    return q
+
+
+def _lock(keys):
+    """Return ({(branch_id, product_id): Stock}, keys that had no row),
+    with every row locked for the rest of the transaction."""
+    keys = sorted(keys)
+    existing = set(Stock.objects.filter(_match(keys)).values_list('branch_id', 'product_id'))
+    missing = [k for k in keys if k not in existing]
+    if missing:
+        Stock.objects.bulk_create(
+            [Stock(branch_id=b, product_id=p, quantity=0) for b, p in missing],
+            ignore_conflicts=True,
+        )
+    locked = (Stock.objects.select_for_update(of=('self',))
+              .select_related('product', 'branch')
+              .filter(_match(keys))
+              .order_by('branch_id', 'product_id'))
+    return {(s.branch_id, s.product_id): s for s in locked}, set(missing)
+
+
+def _apply(stocks, deltas, reason, reference, user, require_available, created, broadcast=True):
+    rows = [(stocks[key], delta) for key, delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return []
+
+    if require_available:
+        short = [(s, -d, (s.branch_id, s.product_id) not in created)
+                 for s, d in rows if s.quantity + d < 0]
+        if short:
+            raise InsufficientStock(short)
+
+    # One UPDATE for every row. The guard repeats the availability check in
+    # the statement itself; rows are locked, so a mismatch means a bug.
+    target = Q()
+    for s, d in rows:
+        if require_available and d < 0:
+            target |= Q(pk=s.pk, quantity__gte=-d)
+        else:
+            target |= Q(pk=s.pk)
+    updated = Stock.objects.filter(target).update(quantity=F('quantity') + Case(
+        *[When(pk=s.pk, then=Value(d)) for s, d in rows],
+        output_field=IntegerField(),
+    ))
+    if updated != len(rows):
+        raise InsufficientStock([(s, -d, True) for s, d in rows if s.quantity + d < 0])
+
+    movements = []
+    for s, d in rows:
+        s.quantity += d
+        movements.append(StockMovement(
+            product_id=s.product_id, branch_id=s.branch_id, quantity=d,
+            balance_after=s.quantity, reason=reason, reference=reference or '',
+            user=user if getattr(user, 'is_authenticated', False) else None,
+        ))
+    StockMovement.objects.bulk_create(movements)
+
+    touched = [s for s, _ in rows]
+    if stock_history_with_ledger():
+        bulk_history(Stock, [s for s in touched if (s.branch_id, s.product_id) in created], user=user)
+        bulk_history(Stock, [s for s in touched if (s.branch_id, s.product_id) not in created],
+                     update=True, user=user)
+
+    from .signals import broadcast_stock
+    from . import scan
+
+    def after_commit():
+        for s in touched:
+            scan.stock_changed(s)
+            if broadcast:
+                broadcast_stock(s)
+    transaction.on_commit(after_commit)
+    return touched
+
+
+def move_stock(lines, reason, reference='', user=None, require_available=False, broadcast=True):
+    """Apply signed quantity changes. `lines` is an iterable of
+    (product, branch, delta); products/branches may be instances or ids and
+    repeated pairs are summed. Returns the updated Stock rows."""
+    deltas = {}
+    for product, branch, delta in lines:
+        key = (_pk(branch), _pk(product))
+        deltas[key] = deltas.get(key, 0) + int(delta)
+    deltas = {k: d for k, d in deltas.items() if d}
+    if not deltas:
+        return []
+    with transaction.atomic():
+        stocks, created = _lock(deltas)
+        return _apply(stocks, deltas, reason, reference, user, require_available, created, broadcast)
+
+
+def set_stock(product, branch, quantity, reason='correction', reference='', user=None):
+    """Set one stock level outright (a count / correction), recorded as the
+    difference from the locked current quantity."""
+    key = (_pk(branch), _pk(product))
+    with transaction.atomic():
+        stocks, created = _lock([key])
+        delta = int(quantity) - stocks[key].quantity
+        _apply(stocks, {key: delta}, reason, reference, user, False, created)
+        return stocks[key]
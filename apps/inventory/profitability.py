@@ -0,0 +1,155 @@
+"""Profitability of what was actually sold, per product / category / branch /
+month.
+
+Usage:
+    from apps.inventory.profitability import profitability, summarize
+
+    rows = profitability(start, end)              # cached, see below
+    summarize(rows, 'category', branch=3)         # drill-down, no query
+
+profitability() runs one grouped query over SaleItem for a date range:
+revenue is each line's subtotal less its share of the sale's flat
+discount, COGS is quantity x the product's cost. The rows come back at the
+finest grain (product x branch x month) so every other grouping and filter
+is a sum over them in Python.
+
+Results are cached per period. The cache key carries a version for every
+month in the period plus a global one (apps.inventory.signals): a sale or
+sale line bumps only the month the sale was made in, so ringing up today's
+sales leaves last year's reports cached, while a change to a product's cost
+(or the name / SKU / category the rows carry) bumps the global version and
+makes every period stale. A stale report is never served; CACHE_TIMEOUT
+only bounds how long an unread period stays in the cache.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+
+CACHE_TIMEOUT = 60 * 60
+VERSION_KEY = 'profitability:version'
+
+GROUPS = {
+    # group -> (key field, label field) in the rows profitability() returns
+    'product': ('product_id', 'product_name'),
+    'category': ('category_id', 'category_name'),
+    'branch': ('branch_id', 'branch_name'),
+    'period': ('period', 'period'),
+}
+
+ZERO = Decimal('0')
+
+
+def _month_key(month):
+    return f'{VERSION_KEY}:{month}'
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield f'{year:04d}-{month:02d}'
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_of(when):
+    """The 'YYYY-MM' a sale made at `when` is reported under."""
+    return timezone.localtime(when).strftime('%Y-%m') if timezone.is_aware(when) else when.strftime('%Y-%m')
+
+
+def invalidate(month=None):
+    """Make the cached periods covering one 'YYYY-MM' month stale, or every
+    cached period when no month is given (called from signals)."""
+    key = VERSION_KEY if month is None else _month_key(month)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _query(start, end):
+    from apps.sales.models import SaleItem
+    money = DecimalField(max_digits=16, decimal_places=2)
+    # The discount is a flat amount on the sale; spread it over the lines
+    # in proportion to their subtotals (total_amount = lines - discount).
+    net = ExpressionWrapper(
+        F('subtotal') * F('sale__total_amount')
+        / NullIf(F('sale__total_amount') + F('sale__discount'), Value(0)),
+        output_field=money,
+    )
+    cost = ExpressionWrapper(F('quantity') * F('product__cost'), output_field=money)
+    rows = (SaleItem.objects
+            .filter(sale__created_at__date__range=(start, end))
+            .exclude(sale__status='cancelled')
+            .annotate(period=TruncMonth('sale__created_at'))
+            .values('product_id', 'product__name', 'product__sku',
+                    'product__category_id', 'product__category__name',
+                    'sale__branch_id', 'sale__branch__name', 'period')
+            .annotate(quantity_sold=Sum('quantity'),
+                      revenue=Coalesce(Sum(net), Value(ZERO), output_field=money),
+                      cogs=Coalesce(Sum(cost), Value(ZERO), output_field=money))
+            .order_by())
+    return [{
+        'product_id': r['product_id'],
+        'product_name': r['product__name'],
+        'sku': r['product__sku'],
+        'category_id': r['product__category_id'],
+        'category_name': r['product__category__name'],
+        'branch_id': r['sale__branch_id'],
+        'branch_name': r['sale__branch__name'],
+        'period': r['period'].strftime('%Y-%m'),
+        'quantity': r['quantity_sold'],
+        'revenue': r['revenue'].quantize(Decimal('0.01')),
+        'cogs': r['cogs'].quantize(Decimal('0.01')),
+    } for r in rows]
+
+
+def profitability(start, end):
+    """Finest-grain rows for sales created between two dates (inclusive)."""
+    keys = [VERSION_KEY] + [_month_key(m) for m in _months(start, end)]
+    versions = cache.get_many(keys)
+    version = '.'.join(str(versions.get(k, 0)) for k in keys)
+    key = f'profitability:{version}:{start.isoformat()}:{end.isoformat()}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = _query(start, end)
+        cache.set(key, rows, CACHE_TIMEOUT)
+    return rows
+
+
+def _margin(entry):
+    entry['margin'] = entry['revenue'] - entry['cogs']
+    entry['margin_pct'] = (entry['margin'] / entry['revenue'] * 100).quantize(Decimal('0.1')) \
+        if entry['revenue'] else None
+    return entry
+
+
+def summarize(rows, group='product', branch=None, category=None):
+    """Roll rows up by one of GROUPS, optionally for one branch / category.
+    Returns (lines sorted by margin, largest first; grand total)."""
+    key_field, label_field = GROUPS[group]
+    totals = {}
+    grand = {'quantity': 0, 'revenue': ZERO, 'cogs': ZERO}
+    for r in rows:
+        if branch and str(r['branch_id']) != str(branch):
+            continue
+        if category and str(r['category_id']) != str(category):
+            continue
+        entry = totals.get(r[key_field])
+        if entry is None:
+            entry = totals[r[key_field]] = {
+                'key': r[key_field], 'label': r[label_field],
+                'sku': r['sku'] if group == 'product' else '',
+                'quantity': 0, 'revenue': ZERO, 'cogs': ZERO,
+            }
+        for target in (entry, grand):
+            target['quantity'] += r['quantity']
+            target['revenue'] += r['revenue']
+            target['cogs'] += r['cogs']
+    lines = [_margin(e) for e in totals.values()]
+    if group == 'period':
+        lines.sort(key=lambda e: e['key'])
+    else:
+        lines.sort(key=lambda e: e['margin'], reverse=True)
+    return lines, _margin(grand)
@@ -0,0 +1,152 @@
+"""Purchase-order lines in bulk, with the order total kept current.
+
+Usage:
+    from apps.inventory import purchase_lines
+
+    purchase_lines.add(po, [{'product': 4, 'quantity': 10, 'unit_cost': '1500'}, ...])
+    purchase_lines.update(po, [{'id': 17, 'quantity': 12}, ...])
+    purchase_lines.record_delivery(po, {item_id: delivered, ...})
+
+Lines are checked in Python plus one query for the products, written with
+a single bulk_create / bulk_update, and PurchaseOrder.total_amount moves by
+the batch's difference in one UPDATE (total_amount = total_amount + x), so
+a 300-line order costs the same handful of queries as a 3-line one and two
+people adding lines at once can't overwrite each other's total.
+
+Lines can only be added or changed while the order is a draft or sent.
+The order row is locked and its status read inside the transaction that
+writes the lines, so a line can't slip onto an order that is being received
+or cancelled at the same moment.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Product, PurchaseOrder, PurchaseOrderItem
+
+EDITABLE = ('draft', 'sent')
+UNITS = {u for u, _ in PurchaseOrderItem.UNIT_CHOICES}
+
+
+class LineError(ValueError):
+    """Bad lines; `errors` has one message per rejected line."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+def _quantity(value):
+    qty = int(value)
+    if qty <= 0:
+        raise ValueError
+    return qty
+
+
+def _cost(value):
+    cost = Decimal(str(value if value not in (None, '') else 0))
+    if cost < 0 or not cost.is_finite():
+        raise ValueError
+    return cost.quantize(Decimal('0.01'))
+
+
+def clean(rows):
+    """(lines, errors) for new-line dicts with product, quantity, unit_cost
+    and optional unit. Unknown products are errors too."""
+    lines, errors = [], []
+    for n, row in enumerate(rows, start=1):
+        try:
+            lines.append({
+                'product_id': int(row.get('product')),
+                'quantity': _quantity(row.get('quantity')),
+                'unit_cost': _cost(row.get('unit_cost')),
+                'unit': row.get('unit') if row.get('unit') in UNITS else 'pcs',
+            })
+        except (TypeError, ValueError, InvalidOperation):
+            errors.append(f"Line {n}: needs a product, a quantity above 0 and a unit cost.")
+    known = set(Product.objects.filter(pk__in={ln['product_id'] for ln in lines}).values_list('pk', flat=True))
+    for ln in lines:
+        if ln['product_id'] not in known:
+            errors.append(f"Product {ln['product_id']} does not exist.")
+    return [ln for ln in lines if ln['product_id'] in known], errors
+
+
+def _check_editable(po):
+    """Lock the order row and check its current status; call inside
+    transaction.atomic()."""
+    locked = PurchaseOrder.objects.select_for_update().get(pk=po.pk)
+    if locked.status not in EDITABLE:
+        raise LineError([f"{locked.number} is {locked.get_status_display().lower()}; its lines can't change."])
+
+
+def _bump_total(po, delta):
+    if delta:
+        PurchaseOrder.objects.filter(pk=po.pk).update(total_amount=F('total_amount') + delta)
+    po.refresh_from_db(fields=['total_amount'])
+
+
+def build(po, lines):
+    """Unsaved PurchaseOrderItems for cleaned lines, total_cost filled in
+    (bulk_create skips save())."""
+    return [PurchaseOrderItem(purchase_order=po, total_cost=ln['quantity'] * ln['unit_cost'], **ln)
+            for ln in lines]
+
+
+def add(po, rows):
+    """Append lines; every line must be valid or nothing is added."""
+    lines, errors = clean(rows)
+    if errors:
+        raise LineError(errors)
+    items = build(po, lines)
+    with transaction.atomic():
+        _check_editable(po)
+        PurchaseOrderItem.objects.bulk_create(items)
+        _bump_total(po, sum((i.total_cost for i in items), Decimal('0')))
+    return items
+
+
+def update(po, rows):
+    """Change quantity / unit_cost / unit of existing lines, by id."""
+    changes, errors = {}, []
+    for n, row in enumerate(rows, start=1):
+        try:
+            change = {'id': int(row.get('id'))}
+            if row.get('quantity') not in (None, ''):
+                change['quantity'] = _quantity(row['quantity'])
+            if row.get('unit_cost') not in (None, ''):
+                change['unit_cost'] = _cost(row['unit_cost'])
+            if row.get('unit') in UNITS:
+                change['unit'] = row['unit']
+            changes[change['id']] = change
+        except (TypeError, ValueError, InvalidOperation):
+            errors.append(f"Line {n}: needs the line id and a quantity above 0 / a unit cost.")
+    if errors:
+        raise LineError(errors)
+
+    with transaction.atomic():
+        _check_editable(po)
+        items = list(po.items.select_for_update().filter(pk__in=list(changes)))
+        missing = set(changes) - {i.pk for i in items}
+        if missing:
+            raise LineError([f"Line {pk} is not on {po.number}." for pk in sorted(missing)])
+        delta = Decimal('0')
+        for item in items:
+            before = item.total_cost
+            for field, value in changes[item.pk].items():
+                setattr(item, field, value)
+            item.total_cost = item.quantity * item.unit_cost
+            delta += item.total_cost - before
+        PurchaseOrderItem.objects.bulk_update(items, ['quantity', 'unit_cost', 'unit', 'total_cost'])
+        _bump_total(po, delta)
+    return items
+
+
+def record_delivery(po, delivered):
+    """Store the cross-checked quantities ({item_id: qty}, missing -> 0) in
+    one bulk UPDATE; returns the items."""
+    items = list(po.items.all())
+    for item in items:
+        item.delivered_quantity = delivered.get(item.pk, 0)
+    PurchaseOrderItem.objects.bulk_update(items, ['delivered_quantity'])
+    return items
@@ -0,0 +1,126 @@
+"""Receive a whole delivery as one GRN (/api/grns/receive/).
+
+Usage:
+    from apps.inventory import receiving
+
+    grn, created = receiving.receive(
+        'DN-4471', branch, [{'product': 4, 'quantity_received': 10, 'remarks': ''}, ...],
+        purchase_order=po, user=request.user)
+
+One transaction: the purchase order row is locked, every line is checked
+against what the order still has outstanding (ordered minus received on
+earlier GRNs, from two grouped queries), the GRN and all its GRNItems are
+inserted with one bulk_create, and stock goes up through a single
+move_stock() call (locked rows, one UPDATE). A line that isn't on the
+order, or would take a product past its ordered quantity, rejects the
+whole delivery. The order is marked received once everything on it has
+arrived.
+
+The supplier's receipt number is unique, which makes the call idempotent:
+posting the same delivery again (a retry after a dropped connection, a
+double click) returns the GRN already recorded with created=False and
+moves no stock. Two retries racing each other meet at the unique index;
+the loser returns the winner's GRN.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from .models import GoodsReceivedNote, GRNItem, Product, PurchaseOrder
+from .movements import move_stock
+
+
+class ReceivingError(ValueError):
+    """The delivery was rejected; `errors` has one message per problem."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+def _clean(rows):
+    lines, errors = [], []
+    for n, row in enumerate(rows, start=1):
+        try:
+            qty = int(row.get('quantity_received'))
+            if qty <= 0:
+                raise ValueError
+            lines.append({'product_id': int(row.get('product')), 'quantity_received': qty,
+                          'remarks': str(row.get('remarks') or '')[:255]})
+        except (TypeError, ValueError):
+            errors.append(f"Line {n}: needs a product and a quantity above 0.")
+    if not rows:
+        errors.append("The delivery has no lines.")
+    return lines, errors
+
+
+def _outstanding(po):
+    ordered = dict(po.items.values('product_id').annotate(q=Sum('quantity')).values_list('product_id', 'q'))
+    received = dict(GRNItem.objects.filter(grn__purchase_order=po).values('product_id')
+                    .annotate(q=Sum('quantity_received')).values_list('product_id', 'q'))
+    return {pid: q - received.get(pid, 0) for pid, q in ordered.items()}
+
+
+def _replay(receipt_number, branch, purchase_order):
+    grn = GoodsReceivedNote.objects.filter(receipt_number=receipt_number).first()
+    if grn is None:
+        return None
+    if grn.branch_id != getattr(branch, 'pk', branch) or \
+            grn.purchase_order_id != getattr(purchase_order, 'pk', purchase_order):
+        raise ReceivingError([f"Receipt number {receipt_number} is already recorded on {grn.number}."])
+    return grn
+
+
+def receive(receipt_number, branch, rows, purchase_order=None, user=None, notes=''):
+    """Record the delivery; returns (grn, created)."""
+    receipt_number = (receipt_number or '').strip()
+    if not receipt_number:
+        raise ReceivingError(["A receipt number is required."])
+    grn = _replay(receipt_number, branch, purchase_order)
+    if grn is not None:
+        return grn, False
+
+    lines, errors = _clean(rows)
+    if errors:
+        raise ReceivingError(errors)
+    wanted = {}
+    for ln in lines:
+        wanted[ln['product_id']] = wanted.get(ln['product_id'], 0) + ln['quantity_received']
+    names = dict(Product.objects.filter(pk__in=list(wanted), product_type='product').values_list('pk', 'name'))
+    errors = [f"Product {pid} is not a stock product." for pid in sorted(set(wanted) - set(names))]
+    user = user if getattr(user, 'is_authenticated', False) else None
+
+    try:
+        with transaction.atomic():
+            po = None
+            if purchase_order is not None:
+                po = PurchaseOrder.objects.select_for_update().get(pk=getattr(purchase_order, 'pk', purchase_order))
+                if po.status == 'cancelled':
+                    errors.append(f"{po.number} is cancelled.")
+                outstanding = _outstanding(po)
+                for pid, qty in sorted(wanted.items()):
+                    if pid not in names:
+                        continue
+                    if pid not in outstanding:
+                        errors.append(f"{names[pid]} is not on {po.number}.")
+                    elif qty > outstanding[pid]:
+                        errors.append(f"{names[pid]}: {qty} received but only {max(outstanding[pid], 0)} "
+                                      f"outstanding on {po.number}.")
+            if errors:
+                raise ReceivingError(errors)
+
+            grn = GoodsReceivedNote.objects.create(
+                receipt_number=receipt_number, branch=branch, purchase_order=po,
+                notes=notes or '', created_by=user,
+            )
+            GRNItem.objects.bulk_create([GRNItem(grn=grn, **ln) for ln in lines])
+            move_stock([(pid, grn.branch_id, qty) for pid, qty in wanted.items()], reason='grn',
+                       reference=receipt_number, user=user)
+            if po is not None and all(wanted.get(pid, 0) >= q for pid, q in outstanding.items()):
+                po.status = 'received'
+                po.save(update_fields=['status', 'updated_at'])
+    except IntegrityError:
+        grn = _replay(receipt_number, branch, purchase_order)
+        if grn is None:
+            raise
+        return grn, False
+    return grn, True
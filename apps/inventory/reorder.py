@@ -0,0 +1,144 @@
+"""Reorder points from sales velocity (Stock.low_stock_threshold).
+
+Usage:
+    from apps.inventory.reorder import compute, apply
+
+    plan = compute(days=90, service_level=0.95)
+    changed = apply(plan)                 # or ``manage.py update_reorder_points``
+
+For every (product, branch) with dispatched sales in the window, the daily
+quantities go into one dense key x day NumPy array, from which mean daily
+demand and its standard deviation come out in a single pass. Lead time is
+how long purchase orders took from creation to the store's check
+(PurchaseOrder.created_at -> checked_at): per product and branch where the
+product has been ordered, else the branch's average, else the overall
+average, else DEFAULT_LEAD_DAYS. Then
+
+    safety stock  = z(service level) x demand std-dev x sqrt(lead days)
+    reorder point = mean demand x lead days + safety stock   (rounded up)
+
+and the reorder point becomes the stock row's low_stock_threshold, so the
+low-stock alerts and reorder lists fire when it is time to order. Stock
+rows without sales in the window keep their threshold.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.core.history import bulk_history
+from .models import PurchaseOrder, PurchaseOrderItem, Stock
+
+DEFAULT_DAYS = 90
+DEFAULT_SERVICE_LEVEL = 0.95
+DEFAULT_LEAD_DAYS = 7.0
+BATCH_SIZE = 2000
+
+Plan = namedtuple('Plan', 'branch product mean std lead safety reorder')
+
+
+def _pack(branch, product):
+    return (np.asarray(branch, dtype=np.int64) << 32) | np.asarray(product, dtype=np.int64)
+
+
+def daily_demand(start, days, branch=None):
+    """Dispatched quantities per (branch, product) per day from `start`:
+    (branch ids, product ids, key x day array)."""
+    from apps.sales.models import SaleItem
+    qs = SaleItem.objects.filter(sale__status='dispatched', sale__created_at__gte=start,
+                                 sale__created_at__lt=start + timedelta(days=days))
+    if branch:
+        qs = qs.filter(sale__branch_id=branch)
+    rows = list(qs.annotate(day=TruncDate('sale__created_at'))
+                .values_list('sale__branch_id', 'product_id', 'day')
+                .annotate(quantity=Sum('quantity')).order_by())
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros((0, days))
+
+    branches, products, dates, quantities = zip(*rows)
+    keys, index = np.unique(_pack(branches, products), return_inverse=True)
+    offsets = (np.array(dates, dtype='datetime64[D]')
+               - np.datetime64(timezone.localdate(start))).astype(np.int64)
+    demand = np.zeros((len(keys), days))
+    np.add.at(demand, (index, offsets), np.array(quantities, dtype=float))
+    return keys >> 32, keys & 0xFFFFFFFF, demand
+
+
+def _lead_times(branches, products):
+    """Lead time in days for each (branch, product) pair, with fallbacks."""
+    took = ExpressionWrapper(F('checked_at') - F('created_at'), output_field=DurationField())
+    checked = PurchaseOrder.objects.filter(checked_at__isnull=False)
+    overall = checked.aggregate(lead=Avg(took))['lead']
+    lead = np.full(len(branches), overall.total_seconds() / 86400 if overall else DEFAULT_LEAD_DAYS)
+
+    for row in checked.values('branch_id').annotate(lead=Avg(took)).order_by():
+        lead[branches == row['branch_id']] = row['lead'].total_seconds() / 86400
+
+    per_item = (PurchaseOrderItem.objects.filter(purchase_order__checked_at__isnull=False)
+                .values_list('purchase_order__branch_id', 'product_id')
+                .annotate(lead=Avg(ExpressionWrapper(F('purchase_order__checked_at') - F('purchase_order__created_at'),
+                                                     output_field=DurationField())))
+                .order_by())
+    per_item = list(per_item)
+    if per_item and len(branches):
+        item_branch, item_product, item_lead = zip(*per_item)
+        item_keys = _pack(item_branch, item_product)
+        order = np.argsort(item_keys)
+        item_keys = item_keys[order]
+        item_days = np.array([d.total_seconds() / 86400 for d in item_lead])[order]
+        keys = _pack(branches, products)
+        pos = np.minimum(np.searchsorted(item_keys, keys), len(item_keys) - 1)
+        found = item_keys[pos] == keys
+        lead[found] = item_days[pos[found]]
+    return np.maximum(lead, 0.0)
+
+
+def compute(days=DEFAULT_DAYS, service_level=DEFAULT_SERVICE_LEVEL, branch=None, now=None):
+    """Demand statistics and reorder points over the last `days` full days."""
+    now = now or timezone.now()
+    today = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - timedelta(days=days)
+    branches, products, demand = daily_demand(start, days, branch)
+
+    mean = demand.mean(axis=1) if len(demand) else np.zeros(0)
+    std = demand.std(axis=1, ddof=1) if days > 1 and len(demand) else np.zeros(len(demand))
+    lead = _lead_times(branches, products)
+    z = NormalDist().inv_cdf(service_level)
+    safety = z * std * np.sqrt(lead)
+    reorder = np.ceil(mean * lead + safety).astype(np.int64)
+    return Plan(branches, products, mean, std, lead, safety, reorder)
+
+
+def apply(plan, dry_run=False):
+    """Write plan.reorder into low_stock_threshold where it differs; returns
+    the number of stock rows changed."""
+    if not len(plan.reorder):
+        return 0
+    keys = _pack(plan.branch, plan.product)
+    order = np.argsort(keys)
+    keys, reorder = keys[order], plan.reorder[order]
+
+    stocks = list(Stock.objects.filter(branch_id__in=np.unique(plan.branch).tolist()))
+    if not stocks:
+        return 0
+    stock_keys = _pack([s.branch_id for s in stocks], [s.product_id for s in stocks])
+    pos = np.minimum(np.searchsorted(keys, stock_keys), len(keys) - 1)
+    found = keys[pos] == stock_keys
+    current = np.array([s.low_stock_threshold for s in stocks], dtype=np.int64)
+    changed_at = np.flatnonzero(found & (reorder[pos] != current))
+
+    changed = []
+    for i in changed_at.tolist():
+        stocks[i].low_stock_threshold = int(reorder[pos[i]])
+        changed.append(stocks[i])
+    if changed and not dry_run:
+        with transaction.atomic():
+            Stock.objects.bulk_update(changed, ['low_stock_threshold'], batch_size=BATCH_SIZE)
+            bulk_history(Stock, changed, update=True)
+    return len(changed)
@@ -0,0 +1,143 @@
+"""Till scans: barcode / SKU -> product, price and branch stock.
+
+Usage:
+    from apps.inventory import scan
+
+    scan.resolve('cem-50', branch_id)          # dict or None
+    scan.resolve_many(['CEM-50', 'CEM-50', 'BRS-1'], branch_id)
+
+Labels print the SKU as the barcode, so a scan is a SKU lookup. Lookups are
+answered from two in-process maps, built on first use:
+  * SKU (upper-cased) -> product fields, for the whole catalogue;
+  * per branch, product id -> quantity on hand.
+Product / Stock signals, bulk product imports and apps.inventory.movements
+(whose UPDATEs don't send post_save) keep this process's maps current once
+their transaction commits. Other
+worker processes only hear about changes in their own process, so both maps
+are also rebuilt after settings.SCAN_MAP_TTL seconds (default 60).
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Product, Stock
+
+_lock = threading.Lock()
+_products = None          # {SKU: {...}}
+_skus = {}                # {product_id: SKU}, to re-key a product whose SKU changed
+_products_loaded = 0.0
+_stock = {}               # {branch_id: (loaded_at, {product_id: qty})}
+
+
+def _ttl():
+    return getattr(settings, 'SCAN_MAP_TTL', 60)
+
+
+def _entry(p):
+    return {'id': p['id'], 'name': p['name'], 'sku': p['sku'], 'price': p['price'],
+            'product_type': p['product_type']}
+
+
+def _product_map():
+    global _products, _skus, _products_loaded
+    products = _products
+    if products is not None and time.monotonic() - _products_loaded < _ttl():
+        return products
+    with _lock:
+        if _products is None or time.monotonic() - _products_loaded >= _ttl():
+            rows = (Product.objects.exclude(sku__isnull=True).exclude(sku='')
+                    .values('id', 'name', 'sku', 'price', 'product_type'))
+            _products = {r['sku'].upper(): _entry(r) for r in rows.iterator(chunk_size=5000)}
+            _skus = {v['id']: k for k, v in _products.items()}
+            _products_loaded = time.monotonic()
+        return _products
+
+
+def _stock_map(branch_id):
+    cached = _stock.get(branch_id)
+    if cached is not None and time.monotonic() - cached[0] < _ttl():
+        return cached[1]
+    levels = dict(Stock.objects.filter(branch_id=branch_id).values_list('product_id', 'quantity'))
+    _stock[branch_id] = (time.monotonic(), levels)
+    return levels
+
+
+def _with_stock(product, branch_id):
+    item = dict(product)
+    item['stock'] = _stock_map(branch_id).get(product['id'], 0) if branch_id else None
+    return item
+
+
+def resolve(code, branch_id=None):
+    """The product a scanned code belongs to (with its stock at the branch),
+    or None."""
+    product = _product_map().get((code or '').strip().upper())
+    return _with_stock(product, _int(branch_id)) if product else None
+
+
+def resolve_many(codes, branch_id=None):
+    """Resolve a whole scanned cart. Repeated codes become one line with a
+    quantity; returns (lines in first-scanned order, unknown codes)."""
+    branch_id = _int(branch_id)
+    products = _product_map()
+    lines, unknown = {}, []
+    for code in codes:
+        key = str(code or '').strip().upper()
+        product = products.get(key)
+        if product is None:
+            if key and code not in unknown:
+                unknown.append(code)
+            continue
+        line = lines.get(product['id'])
+        if line is None:
+            line = lines[product['id']] = _with_stock(product, branch_id)
+            line['quantity'] = 0
+        line['quantity'] += 1
+    return list(lines.values()), unknown
+
+
+def _int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+# -- invalidation --------------------------------------------------------------
+
+def product_changed(product):
+    with _lock:
+        if _products is None:
+            return
+        old = _skus.pop(product.pk, None)
+        if old is not None:
+            _products.pop(old, None)
+        if product.sku:
+            key = product.sku.upper()
+            _products[key] = _entry({
+                'id': product.pk, 'name': product.name, 'sku': product.sku,
+                'price': product.price, 'product_type': product.product_type,
+            })
+            _skus[product.pk] = key
+
+
+def product_removed(product):
+    with _lock:
+        old = _skus.pop(product.pk, None)
+        if old is not None and _products is not None:
+            _products.pop(old, None)
+
+
+def stock_changed(stock):
+    cached = _stock.get(stock.branch_id)
+    if cached is not None:
+        cached[1][stock.product_id] = stock.quantity
+
+
+def clear():
+    global _products
+    with _lock:
+        _products = None
+        _skus.clear()
+        _stock.clear()
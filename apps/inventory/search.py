@@ -0,0 +1,151 @@
+"""Typeahead product search (/api/products/search/).
+
+Product.search_vector holds the name and SKU (weight A) and the category
+name (weight B) as a 'simple' tsvector (no stemming: product names are a
+mix of English, Swahili and part numbers). It is GIN indexed and kept up to
+date by update_search_vectors(), called from the Product / Category signals
+and after bulk imports.
+
+search() matches every word of the query as a prefix (`cem 50` finds
+"Cement 50kg"), plus SKUs starting with the query as typed, ranks SKU hits
+first and then by ts_rank, and returns each product's stock at one branch,
+all in one query.
+
+Short queries repeat a lot at a till ("PROD-", "cem"), so results for
+queries up to PREFIX_CACHE_MAX_LENGTH characters are kept in a small
+in-process LRU for a few seconds (settings.PRODUCT_SEARCH_CACHE_SIZE,
+0 turns it off). Stock can move between hits, so the TTL is kept short.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Case, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Category, Product, Stock
+
+CONFIG = 'simple'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+PREFIX_CACHE_MAX_LENGTH = 6
+PREFIX_CACHE_TTL = 10  # seconds
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def _vector():
+    category = Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1]
+    return (SearchVector('name', 'sku', weight='A', config=CONFIG)
+            + SearchVector(Coalesce(Subquery(category), Value('')), weight='B', config=CONFIG))
+
+
+def update_search_vectors(products=None):
+    """Rebuild search_vector for the given products / ids (default: all),
+    in one UPDATE."""
+    qs = Product.objects.all()
+    if products is not None:
+        ids = [getattr(p, 'pk', p) for p in products]
+        if not ids:
+            return 0
+        qs = qs.filter(pk__in=ids)
+    return qs.update(search_vector=_vector())
+
+
+def _tsquery(term):
+    """'cem 50' -> cem:* & 50:* (each word a prefix), or None."""
+    words = _WORD.findall(term.lower())
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f"{w}:*" for w in words), search_type='raw', config=CONFIG)
+
+
+def search(term, branch=None, category=None, limit=DEFAULT_LIMIT):
+    """Up to `limit` dicts (id, name, sku, price, category, category_name,
+    product_type, stock) best match first. An empty term lists products by
+    name, which is what the POS shows before anything is typed."""
+    term = (term or '').strip()
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    key = (term.lower(), str(branch or ''), str(category or ''), limit)
+    cached = _cache.get(key) if len(term) <= PREFIX_CACHE_MAX_LENGTH else None
+    if cached is not None:
+        return cached
+
+    qs = Product.objects.all()
+    if category:
+        qs = qs.filter(category_id=category)
+    if term:
+        query = _tsquery(term)
+        match = Q(sku__istartswith=term)
+        if query is not None:
+            match |= Q(search_vector=query)
+        qs = qs.filter(match).annotate(
+            sku_rank=Case(When(sku__iexact=term, then=Value(2)),
+                          When(sku__istartswith=term, then=Value(1)),
+                          default=Value(0), output_field=IntegerField()),
+            rank=SearchRank(F('search_vector'), query) if query is not None
+            else Value(0.0, output_field=FloatField()),
+        ).order_by('-sku_rank', '-rank', 'name')
+    else:
+        qs = qs.order_by('name')
+
+    if branch:
+        on_hand = Stock.objects.filter(product=OuterRef('pk'), branch_id=branch).values('quantity')[:1]
+        qs = qs.annotate(stock=Coalesce(Subquery(on_hand), Value(0)))
+    else:
+        qs = qs.annotate(stock=Value(None, output_field=IntegerField()))
+
+    results = list(qs.values('id', 'name', 'sku', 'price', 'product_type', 'stock', 'category_id',
+                             category_name=F('category__name'))[:limit])
+    for r in results:
+        r['category'] = r.pop('category_id')
+    if len(term) <= PREFIX_CACHE_MAX_LENGTH:
+        _cache.set(key, results)
+    return results
+
+
+class PrefixCache:
+    """Tiny thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if not self.size:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self.size:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = PrefixCache(getattr(settings, 'PRODUCT_SEARCH_CACHE_SIZE', 256), PREFIX_CACHE_TTL)
+
+
+def clear_cache():
+    _cache.clear()
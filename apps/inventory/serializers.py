@@ -1,4 +1,4 @@
-from .models import Branch, Category, Product, Stock, Purchase, Supplier, StockTransfer, PurchaseOrder, PurchaseOrderItem, Truck, TruckAllocation, StockAdjustment, GoodsReceivedNote, GRNItem, Driver, TruckMaintenance, TruckCost
+from .models import Branch, Category, Product, Stock, Purchase, Supplier, StockTransfer, PurchaseOrder, PurchaseOrderItem, Truck, TruckAllocation, StockAdjustment, GoodsReceivedNote, GRNItem, Driver, TruckMaintenance, TruckCost, DemandForecast, TransferOrder, TransferOrderItem, CountSession
 from rest_framework import serializers
 
 class BranchSerializer(serializers.ModelSerializer):
@@ -33,11 +33,13 @@ class ProductSerializer(serializers.ModelSerializer):
         Stock.objects.get_or_create(
             product=product,
             branch=branch,
-            defaults={
-                'quantity': opening_stock,
-                'low_stock_threshold': low_stock_val
-            }
+            defaults={'low_stock_threshold': low_stock_val}
         )
+        if opening_stock:
+            from .movements import move_stock
+            request = self.context.get('request')
+            move_stock([(product, branch, opening_stock)], reason='opening',
+                       reference=product.sku, user=getattr(request, 'user', None))
         return product
 
 class StockSerializer(serializers.ModelSerializer):
@@ -49,6 +51,15 @@ class StockSerializer(serializers.ModelSerializer):
         model = Stock
         fields = '__all__'
 
+class DemandForecastSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
+
+    class Meta:
+        model = DemandForecast
+        fields = '__all__'
+
 class SupplierSerializer(serializers.ModelSerializer):
     class Meta:
         model = Supplier
@@ -72,6 +83,70 @@ class StockTransferSerializer(serializers.ModelSerializer):
         model = StockTransfer
         fields = '__all__'
 
+class TransferOrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    sku = serializers.CharField(source='product.sku', read_only=True)
+
+    class Meta:
+        model = TransferOrderItem
+        fields = ('id', 'product', 'product_name', 'sku', 'quantity')
+
+class TransferLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class TransferOrderSerializer(serializers.ModelSerializer):
+    from_branch_name = serializers.CharField(source='from_branch.name', read_only=True)
+    to_branch_name = serializers.CharField(source='to_branch.name', read_only=True)
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    items = TransferOrderItemSerializer(many=True, read_only=True)
+    # All lines come in with the order; products are checked in one query.
+    items_input = TransferLineSerializer(many=True, write_only=True)
+    status = serializers.ChoiceField(choices=('draft', 'in_transit', 'received'), default='draft')
+
+    class Meta:
+        model = TransferOrder
+        fields = '__all__'
+        read_only_fields = ('created_by', 'dispatched_by', 'dispatched_at', 'received_by', 'received_at')
+
+    def validate(self, attrs):
+        if attrs['from_branch'] == attrs['to_branch']:
+            raise serializers.ValidationError({'to_branch': "Choose a different branch to send to."})
+        lines = attrs.get('items_input') or []
+        if not lines:
+            raise serializers.ValidationError({'items_input': "Add at least one product."})
+        ids = {line['product'] for line in lines}
+        stocked = set(Product.objects.filter(pk__in=ids, product_type='product').values_list('pk', flat=True))
+        if ids - stocked:
+            raise serializers.ValidationError(
+                {'items_input': f"Unknown or non-stock products: {sorted(ids - stocked)}"})
+        return attrs
+
+    def create(self, validated_data):
+        from .transfers import create
+        return create(
+            validated_data['from_branch'], validated_data['to_branch'],
+            [(line['product'], line['quantity']) for line in validated_data['items_input']],
+            user=validated_data.get('created_by'), note=validated_data.get('note', ''),
+            status=validated_data['status'],
+        )
+
+class CountSessionSerializer(serializers.ModelSerializer):
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True, default=None)
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    approved_by_name = serializers.CharField(source='approved_by.username', read_only=True, default=None)
+
+    class Meta:
+        model = CountSession
+        fields = '__all__'
+        read_only_fields = ('status', 'created_by', 'approved_by', 'approved_at')
+
+    def create(self, validated_data):
+        from .counts import open_session
+        return open_session(validated_data['branch'], category=validated_data.get('category'),
+                            user=validated_data.get('created_by'), note=validated_data.get('note', ''))
+
 class StockAdjustmentSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     branch_name = serializers.CharField(source='branch.name', read_only=True)
@@ -107,21 +182,33 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         from decimal import Decimal
-        items = validated_data.pop('items_input', [])
-        po = PurchaseOrder.objects.create(**validated_data)
-        for it in items:
-            pid = it.get('product')
-            qty = int(it.get('quantity') or 0)
-            cost = Decimal(str(it.get('unit_cost') or 0))
-            if pid and qty > 0:
-                PurchaseOrderItem.objects.create(
-                    purchase_order=po, product_id=pid, quantity=qty, unit_cost=cost,
-                    unit=(it.get('unit') or 'pcs')
-                )
-        po.total_amount = sum((i.total_cost for i in po.items.all()), Decimal('0'))
-        po.save()
+        from . import purchase_lines
+        # Lines without a product or quantity are skipped, as they always were.
+        lines, _ = purchase_lines.clean(validated_data.pop('items_input', []))
+        total = sum((ln['quantity'] * ln['unit_cost'] for ln in lines), Decimal('0'))
+        po = PurchaseOrder.objects.create(total_amount=total, **validated_data)
+        PurchaseOrderItem.objects.bulk_create(purchase_lines.build(po, lines))
         return po
 
+class GRNReceiveSerializer(serializers.Serializer):
+    """Input for /api/grns/receive/: the whole delivery in one request. No
+    unique check on receipt_number here; a repeat is a replay, not an error
+    (see apps.inventory.receiving)."""
+    receipt_number = serializers.CharField(max_length=50)
+    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), required=False)
+    purchase_order = serializers.PrimaryKeyRelatedField(queryset=PurchaseOrder.objects.all(),
+                                                        required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate(self, attrs):
+        po = attrs.get('purchase_order')
+        if po is not None:
+            attrs.setdefault('branch', po.branch)
+        if attrs.get('branch') is None:
+            raise serializers.ValidationError({'branch': "Choose the receiving branch."})
+        return attrs
+
 class TruckSerializer(serializers.ModelSerializer):
     class Meta:
         model = Truck
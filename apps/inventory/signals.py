@@ -1,13 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.db import transaction
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from .models import Stock
+from .models import Category, Product, Stock
 
-@receiver(post_save, sender=Stock)
-def stock_update_handler(sender, instance, created, **kwargs):
+
+def broadcast_stock(instance):
+    """Push a stock_update (and a low_stock_alert when at/below threshold)
+    to the stock_updates group. Also called by apps.inventory.movements,
+    whose F() updates don't fire post_save."""
     channel_layer = get_channel_layer()
-    
+
     # Broadcast stock update
     async_to_sync(channel_layer.group_send)(
         "stock_updates",
@@ -35,3 +39,81 @@ def stock_update_handler(sender, instance, created, **kwargs):
                 }
             }
         )
+
+
+@receiver(post_save, sender=Stock)
+def stock_update_handler(sender, instance, created, **kwargs):
+    broadcast_stock(instance)
+
+
+REPORTED_FIELDS = ('cost', 'name', 'sku', 'category_id')
+
+
+@receiver(pre_save, sender=Product)
+def product_reported_values(sender, instance, **kwargs):
+    # Remember what the profitability rows show, to tell whether it changed.
+    if instance.pk:
+        instance._previous_reported = (sender.objects.filter(pk=instance.pk)
+                                       .values_list(*REPORTED_FIELDS).first())
+
+
+@receiver(post_save, sender=Product)
+def product_profitability_changed(sender, instance, created, **kwargs):
+    # A new cost (or label) reprices every period the product was sold in.
+    previous = getattr(instance, '_previous_reported', None)
+    if not created and previous != tuple(getattr(instance, f) for f in REPORTED_FIELDS):
+        from .profitability import invalidate
+        invalidate()
+
+
+@receiver(post_save, sender='sales.Sale')
+@receiver(post_delete, sender='sales.Sale')
+def sale_profitability_changed(sender, instance, **kwargs):
+    # Discount/status changed: only the sale's own month is stale.
+    from .profitability import invalidate, month_of
+    invalidate(month_of(instance.created_at))
+
+
+@receiver(post_save, sender='sales.SaleItem')
+@receiver(post_delete, sender='sales.SaleItem')
+def sale_item_profitability_changed(sender, instance, **kwargs):
+    from django.core.exceptions import ObjectDoesNotExist
+    from .profitability import invalidate, month_of
+    try:
+        invalidate(month_of(instance.sale.created_at))
+    except ObjectDoesNotExist:
+        invalidate()
+
+
+@receiver(post_save, sender=Product)
+def product_search_vector(sender, instance, **kwargs):
+    from .search import clear_cache, update_search_vectors
+    update_search_vectors([instance.pk])
+    clear_cache()
+
+
+@receiver(post_save, sender=Category)
+def category_search_vectors(sender, instance, created, **kwargs):
+    # The category name is part of every product's search vector.
+    if not created:
+        from .search import clear_cache, update_search_vectors
+        update_search_vectors(instance.products.values_list('pk', flat=True))
+        clear_cache()
+
+
+@receiver(post_save, sender=Product)
+def scan_map_product(sender, instance, **kwargs):
+    from . import scan
+    transaction.on_commit(lambda: scan.product_changed(instance))
+
+
+@receiver(post_delete, sender=Product)
+def scan_map_product_removed(sender, instance, **kwargs):
+    from . import scan
+    transaction.on_commit(lambda: scan.product_removed(instance))
+
+
+@receiver(post_save, sender=Stock)
+def scan_map_stock(sender, instance, **kwargs):
+    from . import scan
+    transaction.on_commit(lambda: scan.stock_changed(instance))
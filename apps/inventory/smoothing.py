@@ -0,0 +1,45 @@
+"""The forecasting model itself, on plain NumPy arrays (no Django imports,
+so apps.inventory.forecasting can run it in worker processes).
+
+Every series (row of `demand`, one column per day) gets:
+  * day-of-week factors: each weekday's average over the series' average
+    (1 for a series that never sold, 0 for a weekday it never sells on);
+  * simple exponential smoothing of the de-seasonalised series, starting
+    from its mean, with the smoothing constant picked per series from ALPHAS
+    by one-step-ahead squared error.
+All series and all ALPHAS are fitted together, one vector step per day.
+The forecast is the final level times the weekday factor of each day ahead.
+"""
+import numpy as np
+
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5])
+
+
+def fit(demand, weekdays, future_weekdays):
+    """Forecasts (series x len(future_weekdays)) for `demand` (series x days),
+    where weekdays[t] is the weekday (0-6) of column t."""
+    demand = np.asarray(demand, dtype=float)
+    n, days = demand.shape
+    mean = demand.mean(axis=1, keepdims=True)
+
+    seasonal = np.ones((n, 7))
+    for day in range(7):
+        columns = weekdays == day
+        if columns.any():
+            seasonal[:, day] = demand[:, columns].mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seasonal = np.where(mean > 0, seasonal / mean, 1.0)
+        factors = seasonal[:, weekdays]
+        adjusted = np.where(factors > 0, demand / factors, 0.0)
+    # A weekday that never sells says nothing about the level.
+    informative = factors > 0
+
+    level = np.repeat(mean, len(ALPHAS), axis=1)
+    sse = np.zeros_like(level)
+    for t in range(days):
+        error = np.where(informative[:, t:t + 1], adjusted[:, t:t + 1] - level, 0.0)
+        sse += error * error
+        level += ALPHAS * error
+    best = level[np.arange(n), sse.argmin(axis=1)]
+
+    return np.maximum(best[:, None] * seasonal[:, future_weekdays], 0.0)
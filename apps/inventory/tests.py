@@ -1,3 +1,755 @@
-from django.test import TestCase
+import io
+import tempfile
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.users.models import User
+from .models import Branch, Category, Product, Stock, StockMovement, StockTransfer
+from .movements import move_stock, set_stock, InsufficientStock
+
+
+def csv_upload(lines, name='products.csv'):
+    return SimpleUploadedFile(name, ("\n".join(lines) + "\n").encode('utf-8'), content_type='text/csv')
+
+
+@override_settings(JOBS_ALWAYS_EAGER=True, MEDIA_ROOT=tempfile.mkdtemp())
+class ProductImportTest(TestCase):
+    HEADER = "name,sku,category,type,cost,price,weight (kg),description,opening stock,low stock alert"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def _import(self, lines):
+        """Post the file and return the finished import job."""
+        resp = self.client.post('/api/products/import/', {'file': csv_upload([self.HEADER] + lines)},
+                                format='multipart')
+        self.assertEqual(resp.status_code, 202)
+        return self.client.get(resp.json()['status_url']).json()
+
+    def test_bulk_import_creates_and_accumulates(self):
+        tools = Category.objects.create(name="Tools")
+        existing = Product.objects.create(name="Hammer", sku="HMR-001", category=tools, price=1, cost=1)
+        main = Branch.objects.create(name="Main Branch")
+        Stock.objects.create(product=existing, branch=main, quantity=5)
+
+        job = self._import([
+            "Hammer,HMR-001,Tools,product,15000,25000,1.5,Steel,10,5",
+            "Nails,,Fasteners,product,100,150,0.1,,1000,50",
+            "Nails,,Fasteners,product,100,150,0.1,,500,50",
+            "Delivery,,Services,service,0,5000,0,,0,0",
+            ",NO-NAME,Tools,product,1,1,0,,0,0",
+            "Saw,SAW-1,Tools,product,abc,1,0,,0,0",
+        ])
+
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['progress'], 6)
+        errors = job['result']['errors']
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[0].startswith("Row 6: Missing Product Name"))
+        self.assertTrue(errors[1].startswith("Row 7:"))
+
+        self.assertEqual(Stock.objects.get(product=existing).quantity, 15)
+        nails = Product.objects.get(name="Nails")
+        self.assertTrue(nails.sku.startswith("PROD-"))
+        self.assertEqual(Stock.objects.get(product=nails).quantity, 1500)
+        self.assertEqual(Stock.objects.get(product=nails).low_stock_threshold, 50)
+        delivery = Product.objects.get(name="Delivery")
+        self.assertTrue(delivery.sku.startswith("SERV-"))
+        self.assertFalse(Stock.objects.filter(product=delivery).exists())
+        self.assertEqual(Product.objects.filter(name="Nails").count(), 1)
+        self.assertEqual(nails.history.count(), 1)
+
+    def test_rows_the_database_rejects_do_not_sink_the_batch(self):
+        Branch.objects.create(name="Main Branch")
+        rows = [f"Item {i},SKU-{i},Tools,product,10,20,1,,5,2" for i in range(8)]
+        rows[5] = "Item 5,SKU-5,Tools,product,10,99999999999,1,,5,2"  # too big for price
+
+        job = self._import(rows)
+
+        errors = job['result']['errors']
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("Row 7:"))
+        self.assertIn("imported/found 7 products", job['result']['message'])
+        self.assertEqual(sorted(Product.objects.values_list('sku', flat=True)),
+                         [f"SKU-{i}" for i in range(8) if i != 5])
+        self.assertEqual(Stock.objects.filter(product__sku="SKU-0").get().quantity, 5)
+
+    def _count_import_queries(self, start, n):
+        rows = [f"Item {i},SKU-{i},Cat {start}-{i % 3},product,10,20,1,,5,2" for i in range(start, start + n)]
+        with CaptureQueriesContext(connection) as ctx:
+            job = self._import(rows)
+        self.assertEqual(job['result']['errors'], [])
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        Branch.objects.create(name="Main Branch")
+        small = self._count_import_queries(0, 5)
+        large = self._count_import_queries(5, 300)
+        self.assertEqual(small, large)
+        self.assertEqual(Product.objects.count(), 305)
+
+    def test_xlsx_import_streams_in_batches(self):
+        import io
+        from openpyxl import Workbook
+        from .importers import ProductImporter
+        from apps.core.uploads import read_upload
+
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["Name", "SKU", "Category", "Type", "Opening Stock"])
+        for i in range(25):
+            ws.append([f"Bolt {i}", f"BLT-{i}", "Fasteners", "product", 4])
+        ws.append([None, None, None, None, None])  # blank rows are skipped
+        buf = io.BytesIO()
+        wb.save(buf)
+        upload = SimpleUploadedFile('products.xlsx', buf.getvalue())
+
+        headers, rows = read_upload(upload)
+        seen = []
+        importer = ProductImporter(batch_size=10, progress=lambda imp: seen.append(imp.processed)).run(rows)
+
+        self.assertEqual(headers, ["Name", "SKU", "Category", "Type", "Opening Stock"])
+        self.assertEqual(seen, [10, 20, 25])
+        self.assertEqual((importer.imported, importer.errors), (25, []))
+        self.assertEqual(Stock.objects.filter(product__sku__startswith='BLT-', quantity=4).count(), 25)
+
+
+class StockMovementTest(TestCase):
+    def setUp(self):
+        self.main = Branch.objects.create(name="Main Branch")
+        self.town = Branch.objects.create(name="Town")
+        category = Category.objects.create(name="Cement")
+        self.a = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=category, price=1, cost=1)
+        self.b = Product.objects.create(name="Cement 25kg", sku="CEM-25", category=category, price=1, cost=1)
+        Stock.objects.create(product=self.a, branch=self.main, quantity=10)
+
+    def test_moves_are_applied_and_recorded(self):
+        move_stock([(self.a, self.main, -3), (self.b, self.main, 7), (self.a, self.main, -1)],
+                   reason='adjustment', reference='test')
+
+        self.assertEqual(Stock.objects.get(product=self.a, branch=self.main).quantity, 6)
+        self.assertEqual(Stock.objects.get(product=self.b, branch=self.main).quantity, 7)
+        ledger = {m.product_id: (m.quantity, m.balance_after) for m in StockMovement.objects.all()}
+        self.assertEqual(ledger, {self.a.pk: (-4, 6), self.b.pk: (7, 7)})
+        # The ledger is the record of quantity changes; Stock history only
+        # has the row's creation unless STOCK_HISTORY_WITH_LEDGER is set.
+        stock = Stock.objects.get(product=self.a, branch=self.main)
+        self.assertEqual(stock.history.count(), 1)
+
+        with self.settings(STOCK_HISTORY_WITH_LEDGER=True):
+            set_stock(self.a, self.main, 2)
+        self.assertEqual(stock.history.first().quantity, 2)
+        self.assertEqual(StockMovement.objects.first().quantity, -4)
+        self.assertEqual(StockMovement.objects.first().reason, 'correction')
+
+    def test_ledger_rows_cannot_be_edited(self):
+        move_stock([(self.a, self.main, -1)], reason='sale')
+        movement = StockMovement.objects.get()
+        movement.quantity = -5
+        with self.assertRaises(ValueError):
+            movement.save()
+        self.assertEqual(StockMovement.objects.get().quantity, -1)
+
+    def test_shortage_rolls_back_every_line(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            move_stock([(self.a, self.main, -5), (self.b, self.main, -1)], reason='sale',
+                       require_available=True)
+        self.assertEqual(ctx.exception.messages, ["No stock record for Cement 25kg at this branch"])
+        self.assertEqual(Stock.objects.get(product=self.a, branch=self.main).quantity, 10)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_transfer_needs_source_stock(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        payload = {'product': self.a.pk, 'from_branch': self.main.pk, 'to_branch': self.town.pk}
+
+        resp = client.post('/api/transfers/', {**payload, 'quantity': 11}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(StockTransfer.objects.exists())
+
+        resp = client.post('/api/transfers/', {**payload, 'quantity': 4}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Stock.objects.get(product=self.a, branch=self.main).quantity, 6)
+        self.assertEqual(Stock.objects.get(product=self.a, branch=self.town).quantity, 4)
+
+    def test_transfer_order_moves_all_lines_through_transit(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        Stock.objects.create(product=self.b, branch=self.main, quantity=3)
+        payload = {'from_branch': self.main.pk, 'to_branch': self.town.pk,
+                   'items_input': [{'product': self.a.pk, 'quantity': 4},
+                                   {'product': self.b.pk, 'quantity': 5}]}
+
+        resp = client.post('/api/transfer-orders/', {**payload, 'status': 'in_transit'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Stock.objects.get(product=self.a, branch=self.main).quantity, 10)
+
+        payload['items_input'][1]['quantity'] = 3
+        resp = client.post('/api/transfer-orders/', payload, format='json')
+        self.assertEqual(resp.status_code, 201)
+        pk = resp.data['id']
+        self.assertTrue(resp.data['number'].startswith(f"TRF-{self.main.pk}-"))
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.post(f'/api/transfer-orders/{pk}/dispatch/')
+        self.assertEqual(resp.data['status'], 'in_transit')
+        self.assertEqual(sum('UPDATE "inventory_stock"' in q['sql'] for q in ctx.captured_queries), 1)
+        self.assertEqual(Stock.objects.get(product=self.a, branch=self.main).quantity, 6)
+        self.assertEqual(Stock.objects.get(product=self.b, branch=self.main).quantity, 0)
+        self.assertFalse(Stock.objects.filter(branch=self.town).exists())
+
+        self.assertEqual(client.post(f'/api/transfer-orders/{pk}/dispatch/').status_code, 400)
+        resp = client.post(f'/api/transfer-orders/{pk}/receive/')
+        self.assertEqual(resp.data['status'], 'received')
+        self.assertEqual(dict(Stock.objects.filter(branch=self.town).values_list('product', 'quantity')),
+                         {self.a.pk: 4, self.b.pk: 3})
+        self.assertEqual(StockMovement.objects.filter(reference=resp.data['number']).count(), 4)
+
+    def test_stock_api_writes_quantity_only_through_the_ledger(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        resp = client.post('/api/stocks/', {'product': self.b.pk, 'branch': self.town.pk, 'quantity': 5},
+                           format='json')
+        self.assertEqual(resp.data['quantity'], 5)
+        opening = StockMovement.objects.get(product=self.b)
+        self.assertEqual((opening.reason, opening.quantity), ('opening', 5))
+
+        stock = Stock.objects.get(product=self.a, branch=self.main)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.patch(f'/api/stocks/{stock.pk}/', {'low_stock_threshold': 3}, format='json')
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "inventory_stock"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"quantity"', updates[0])
+        self.assertEqual((resp.data['low_stock_threshold'], resp.data['quantity']), (3, 10))
+
+    def test_health_counts_and_lists(self):
+        Stock.objects.create(product=self.b, branch=self.main, quantity=0)
+        Stock.objects.create(product=self.a, branch=self.town, quantity=50)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+        data = client.get('/api/stocks/health/').json()
+        self.assertEqual(data['counts'], {'out': 1, 'low': 1, 'healthy': 1})
+        self.assertEqual(sorted(r['status'] for r in data['results']), ['low', 'out'])
+
+        data = client.get(f'/api/stocks/health/?status=healthy&branch={self.town.pk}&page_size=1').json()
+        self.assertEqual(data['counts'], {'out': 0, 'low': 0, 'healthy': 1})
+        self.assertEqual([r['branch_name'] for r in data['results']], ["Town"])
+        self.assertEqual(client.get('/api/stocks/health/?status=bogus').status_code, 400)
+
+    def test_matrix_pivots_branches_per_product(self):
+        Stock.objects.create(product=self.b, branch=self.main, quantity=0)
+        Stock.objects.create(product=self.a, branch=self.town, quantity=50)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get('/api/stocks/matrix/')
+        # The page count and the page itself; the pivot is one grouped query.
+        self.assertEqual(len([q for q in ctx.captured_queries if 'inventory_stock' in q['sql']]), 2)
+        data = resp.json()
+        self.assertEqual([b['name'] for b in data['branches']], ["Main Branch", "Town"])
+        self.assertEqual([(r['name'], r['quantities'], r['total']) for r in data['results']], [
+            ("Cement 25kg", {str(self.main.pk): 0}, 0),
+            ("Cement 50kg", {str(self.main.pk): 10, str(self.town.pk): 50}, 60),
+        ])
+        out = client.get('/api/stocks/matrix/?status=out').json()
+        self.assertEqual([r['product'] for r in out['results']], [self.b.pk])
+
+        again = client.get('/api/stocks/matrix/', HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual((again.status_code, again.content), (304, b''))
+        move_stock([(self.a, self.town, -1)], reason='sale')
+        self.assertEqual(client.get('/api/stocks/matrix/', HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 200)
+
+
+class ConcurrentStockMovementTest(TransactionTestCase):
+    def test_parallel_decrements_lose_nothing(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection as conn
+
+        branch = Branch.objects.create(name="Main Branch")
+        category = Category.objects.create(name="Nails")
+        products = [Product.objects.create(name=f"Nail {i}", sku=f"N-{i}", category=category, price=1, cost=1)
+                    for i in range(2)]
+        for p in products:
+            Stock.objects.create(product=p, branch=branch, quantity=40)
+
+        def worker(i):
+            ok = 0
+            try:
+                for _ in range(6):
+                    # Alternate line order between workers: the service sorts locks.
+                    lines = [(p, branch, -1) for p in (products if i % 2 else products[::-1])]
+                    try:
+                        move_stock(lines, reason='sale', require_available=True)
+                        ok += 1
+                    except InsufficientStock:
+                        pass
+            finally:
+                conn.close()
+            return ok
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            succeeded = sum(pool.map(worker, range(8)))
+
+        self.assertEqual(succeeded, 40)
+        self.assertEqual(list(Stock.objects.values_list('quantity', flat=True)), [0, 0])
+        self.assertEqual(StockMovement.objects.count(), 80)
+
+
+class InventoryAgingTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import GoodsReceivedNote, GRNItem, Purchase
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        main = Branch.objects.create(name="Main Branch")
+        category = Category.objects.create(name="Paint")
+        now = timezone.now()
+        for i in range(12):
+            product = Product.objects.create(name=f"Paint {i}", sku=f"PNT-{i}", category=category, price=1, cost=1)
+            Stock.objects.create(product=product, branch=main, quantity=i)
+            Purchase.objects.create(branch=main, product=product, quantity=1, unit_cost=1, total_cost=1)
+            Purchase.objects.filter(product=product).update(date_purchased=now - timedelta(days=100))
+        # A recent goods receipt makes Paint 0 fresh again.
+        grn = GoodsReceivedNote.objects.create(branch=main, receipt_number="DN-1")
+        GRNItem.objects.create(grn=grn, product=Product.objects.get(sku="PNT-0"), quantity_received=1)
+
+    def test_report_is_one_query_for_the_page(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/inventory/aging/')
+        rows = resp.context['aging_data']
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[-1]['product_name'], "Paint 0")
+        self.assertEqual(rows[-1]['status'], 'success')
+        self.assertEqual(rows[0]['status'], 'danger')
+        self.assertEqual({b['key']: b['count'] for b in resp.context['buckets']},
+                         {'0-30': 1, '31-60': 0, '61-90': 0, '90+': 11})
+        aging = [q for q in ctx.captured_queries if 'inventory_purchase' in q['sql']]
+        self.assertLessEqual(len(aging), 3)  # page count, page rows, bucket totals
+
+        resp = self.client.get('/inventory/aging/?bucket=90%2B&export=csv')
+        lines = resp.content.decode().strip().splitlines()
+        self.assertEqual(len(lines), 12)
+        self.assertTrue(lines[1].startswith("Paint"))
+
+
+class ProfitabilityTest(TestCase):
+    def setUp(self):
+        from apps.sales.models import Sale, SaleItem
+        main = Branch.objects.create(name="Main Branch")
+        category = Category.objects.create(name="Roofing")
+        self.sheet = Product.objects.create(name="Iron sheet", sku="IRS-1", category=category, price=30, cost=20)
+        nails = Product.objects.create(name="Roofing nails", sku="RNL-1", category=category, price=5, cost=2)
+        # 100 of lines less a 10 discount: every line keeps 90% of its subtotal.
+        sale = Sale.objects.create(branch=main, invoice_number="INV-1", total_amount=90, discount=10)
+        SaleItem.objects.create(sale=sale, product=self.sheet, quantity=3, price_at_sale=30)
+        self.line = SaleItem.objects.create(sale=sale, product=nails, quantity=2, price_at_sale=5)
+        Sale.objects.create(branch=main, invoice_number="INV-2", total_amount=0, status='cancelled')
+
+    def test_margins_are_cached_per_period(self):
+        from datetime import date
+        from django.core.cache import cache
+        from .profitability import profitability, summarize
+        cache.clear()
+        today = date.today()
+
+        with CaptureQueriesContext(connection) as ctx:
+            rows = profitability(today, today)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        lines, total = summarize(rows, 'product')
+        self.assertEqual([(l['label'], l['revenue'], l['cogs']) for l in lines],
+                         [("Iron sheet", 81, 60), ("Roofing nails", 9, 4)])
+        self.assertEqual((total['revenue'], total['margin']), (90, 26))
+
+        with CaptureQueriesContext(connection) as ctx:
+            profitability(today, today)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        self.sheet.cost = 25
+        self.sheet.save()
+        _, total = summarize(profitability(today, today), 'category')
+        self.assertEqual(total['cogs'], 79)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        resp = self.client.get('/inventory/profitability/?group=branch')
+        self.assertEqual([l['label'] for l in resp.context['lines']], ["Main Branch"])
+
+    def test_sales_only_invalidate_their_own_month(self):
+        from datetime import date, timedelta
+        from django.core.cache import cache
+        from apps.sales.models import Sale, SaleItem
+        from .profitability import profitability
+        cache.clear()
+        today = date.today()
+        last_year = (today.replace(day=1) - timedelta(days=365), today.replace(day=1) - timedelta(days=300))
+        profitability(*last_year)
+        profitability(today, today)
+
+        sale = Sale.objects.create(branch=Branch.objects.get(), invoice_number="INV-3", total_amount=30)
+        SaleItem.objects.create(sale=sale, product=self.sheet, quantity=1, price_at_sale=30)
+        with CaptureQueriesContext(connection) as ctx:
+            profitability(*last_year)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            profitability(today, today)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        self.sheet.price = 35
+        self.sheet.save()
+        with CaptureQueriesContext(connection) as ctx:
+            profitability(today, today)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        self.sheet.cost = 25
+        self.sheet.save()
+        with CaptureQueriesContext(connection) as ctx:
+            profitability(*last_year)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        from .search import clear_cache
+        clear_cache()
+        self.main = Branch.objects.create(name="Main Branch")
+        cement = Category.objects.create(name="Cement")
+        paint = Category.objects.create(name="Paint")
+        self.bag = Product.objects.create(name="Twiga Cement 50kg", sku="CEM-50", category=cement, price=1, cost=1)
+        Product.objects.create(name="Cement brush", sku="BRS-1", category=paint, price=1, cost=1)
+        Product.objects.create(name="Gloss white", sku="PNT-CEMX", category=paint, price=1, cost=1)
+        Stock.objects.create(product=self.bag, branch=self.main, quantity=40)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def _search(self, query):
+        return self.client.get(f'/api/products/search/?branch={self.main.pk}&{query}').json()
+
+    def test_ranked_prefix_search_with_stock(self):
+        with CaptureQueriesContext(connection) as ctx:
+            results = self._search('q=twi+ceme')
+        self.assertEqual([(r['sku'], r['stock']) for r in results], [("CEM-50", 40)])
+        self.assertEqual(len([q for q in ctx.captured_queries if 'inventory_product' in q['sql']]), 1)
+
+        self.assertEqual(self._search('q=cem-5')[0]['sku'], "CEM-50")
+        self.assertEqual({r['sku'] for r in self._search('q=cement')}, {"CEM-50", "BRS-1"})
+        self.assertEqual([r['sku'] for r in self._search('q=paint')], ["BRS-1", "PNT-CEMX"])
+
+    def test_renames_reach_the_index(self):
+        self.bag.name = "Simba Cement"
+        self.bag.save()
+        self.assertEqual([r['sku'] for r in self._search('q=simba')], ["CEM-50"])
+        self.bag.category.name = "Binders"
+        self.bag.category.save()
+        self.assertEqual([r['sku'] for r in self._search('q=binder')], ["CEM-50"])
+
+
+class ScanTest(TestCase):
+    def setUp(self):
+        from . import scan
+        scan.clear()
+        self.main = Branch.objects.create(name="Main Branch")
+        self.category = Category.objects.create(name="Cement")
+        self.bag = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=self.category, price=1500, cost=1)
+        Stock.objects.create(product=self.bag, branch=self.main, quantity=40)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def test_scans_come_from_the_warm_map(self):
+        self.client.get(f'/api/products/scan/?code=cem-50&branch={self.main.pk}')
+        with CaptureQueriesContext(connection) as ctx:
+            item = self.client.get(f'/api/products/scan/?code=CEM-50&branch={self.main.pk}').json()
+        self.assertEqual((item['id'], item['stock']), (self.bag.pk, 40))
+        self.assertFalse([q for q in ctx.captured_queries if 'inventory_' in q['sql']])
+
+        # Writes reach the map once committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            move_stock([(self.bag, self.main, -5)], reason='sale')
+            self.bag.price = 1600
+            self.bag.save()
+        body = self.client.post('/api/products/scan-cart/',
+                                {'codes': ['CEM-50', 'cem-50', 'NOPE'], 'branch': self.main.pk},
+                                format='json').json()
+        line = body['items'][0]
+        self.assertEqual((line['quantity'], line['stock'], float(line['price'])), (2, 35, 1600))
+        self.assertEqual(body['unknown'], ['NOPE'])
+        self.assertEqual(self.client.get('/api/products/scan/?code=NOPE').status_code, 404)
+
+    def test_label_sheet_for_a_category(self):
+        resp = self.client.get(f'/api/products/labels/?category={self.category.pk}&copies=30')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        self.assertTrue(resp.content.startswith(b'%PDF'))
+
+
+class StockAsOfTest(TestCase):
+    def test_snapshot_plus_replay_matches_the_ledger(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .asof import day_end
+        main = Branch.objects.create(name="Main Branch")
+        category = Category.objects.create(name="Cement")
+        bag = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=category, price=1, cost=1)
+        today = timezone.localdate()
+        day1, day2 = today - timedelta(days=3), today - timedelta(days=2)
+        for delta, day in ((10, day1), (-4, day2), (5, today)):
+            move_stock([(bag, main, delta)], reason='adjustment')
+            StockMovement.objects.filter(pk=StockMovement.objects.latest('id').pk).update(
+                created_at=day_end(day) - timedelta(hours=12))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        url = f'/api/stocks/as-of/?branch={main.pk}&at='
+        # Before any snapshot: stepped back from the current 11.
+        body = client.get(url + day2.isoformat()).json()
+        self.assertEqual((body['snapshot'], body['results'][0]['quantity'], body['complete']), (None, 6, True))
+
+        call_command('snapshot_stock', '--date', day1.isoformat(), stdout=io.StringIO())
+        body = client.get(url + day2.isoformat()).json()
+        self.assertEqual((body['snapshot'], body['movements_replayed']), (day1.isoformat(), 1))
+        self.assertEqual(body['results'], [{'product': bag.pk, 'product_name': bag.name, 'sku': 'CEM-50',
+                                            'quantity': 6}])
+        self.assertEqual(client.get(url + day1.isoformat()).json()['results'][0]['quantity'], 10)
+        self.assertEqual(client.get(url + 'yesterday').status_code, 400)
+
+        # Before the branch's first movement the ledger can't say.
+        body = client.get(url + (day1 - timedelta(days=5)).isoformat()).json()
+        self.assertEqual((body['snapshot'], body['complete']), (None, False))
+        self.assertTrue(client.get(url + day2.isoformat()).json()['complete'])
+
+
+class ReorderPointTest(TestCase):
+    def test_thresholds_follow_demand_and_lead_time(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from apps.sales.models import Sale, SaleItem
+        from .models import PurchaseOrder, PurchaseOrderItem
+        main, town = Branch.objects.create(name="Main Branch"), Branch.objects.create(name="Town")
+        bag = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=Category.objects.create(name="Cement"),
+                                     price=1, cost=1)
+        Stock.objects.create(product=bag, branch=main, quantity=30)
+        Stock.objects.create(product=bag, branch=town, quantity=30)
+        now = timezone.now()
+
+        # Ordered at Main, checked in four days later.
+        po = PurchaseOrder.objects.create(branch=main)
+        PurchaseOrderItem.objects.create(purchase_order=po, product=bag, quantity=1, unit_cost=1)
+        PurchaseOrder.objects.filter(pk=po.pk).update(created_at=now - timedelta(days=30),
+                                                      checked_at=now - timedelta(days=26))
+        # Ten days of 4, 6, 4, 6 ... dispatched at Main (mean 5); a pending
+        # sale doesn't count.
+        for day in range(1, 11):
+            for status, quantity in (('dispatched', 4 if day % 2 else 6), ('pending', 100)):
+                sale = Sale.objects.create(branch=main, invoice_number=f"{status}-{day}", status=status)
+                SaleItem.objects.create(sale=sale, product=bag, quantity=quantity, price_at_sale=1)
+                Sale.objects.filter(pk=sale.pk).update(created_at=now - timedelta(days=day))
+
+        out = io.StringIO()
+        call_command('update_reorder_points', '--days', '10', stdout=out)
+        self.assertIn('changed 1 thresholds', out.getvalue())
+        # 5/day x 4 days + 1.645 x 1.054 x sqrt(4) safety stock, rounded up.
+        self.assertEqual(Stock.objects.get(product=bag, branch=main).low_stock_threshold, 24)
+        self.assertEqual(Stock.objects.get(product=bag, branch=town).low_stock_threshold, 10)
+
+
+class DemandForecastTest(TestCase):
+    def test_forecasts_follow_level_and_weekday(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from apps.sales.models import Sale, SaleItem
+        main = Branch.objects.create(name="Main Branch")
+        category = Category.objects.create(name="Cement")
+        bag = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=category, price=1, cost=1)
+        sheet = Product.objects.create(name="Iron sheet", sku="IRS-1", category=category, price=1, cost=1)
+        Stock.objects.create(product=bag, branch=main, quantity=20)
+        now = timezone.now()
+        # Four weeks: 3 bags every day, and 7 sheets on Saturdays only.
+        for day in range(1, 29):
+            when = now - timedelta(days=day)
+            sale = Sale.objects.create(branch=main, invoice_number=f"INV-{day}", status='dispatched')
+            SaleItem.objects.create(sale=sale, product=bag, quantity=3, price_at_sale=1)
+            if timezone.localdate(when).weekday() == 5:
+                SaleItem.objects.create(sale=sale, product=sheet, quantity=7, price_at_sale=1)
+            Sale.objects.filter(pk=sale.pk).update(created_at=when)
+
+        call_command('forecast_demand', '--days', '28', '--horizon', '7', stdout=io.StringIO())
+        from .models import DemandForecast
+        bags = DemandForecast.objects.filter(product=bag)
+        self.assertEqual(bags.count(), 7)
+        self.assertTrue(all(abs(f.quantity - 3) < 0.01 for f in bags))
+        sheets = list(DemandForecast.objects.filter(product=sheet))
+        self.assertEqual([(f.day.weekday(), round(f.quantity)) for f in sheets], [(5, 7)])
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        totals = client.get(f'/api/forecasts/totals/?branch={main.pk}').json()['results']
+        self.assertEqual([(t['sku'], t['expected'], t['on_hand'], t['shortfall']) for t in totals],
+                         [("CEM-50", 21.0, 20, 1.0), ("IRS-1", 7.0, 0, 7.0)])
+
+    def test_process_pool_matches_one_process(self):
+        import numpy as np
+        from unittest import mock
+        from . import forecasting
+        demand = np.random.default_rng(1).poisson(2, (40, 21)).astype(float)
+        weekdays, ahead = np.arange(21) % 7, np.arange(7) % 7
+        with mock.patch.object(forecasting, 'POOL_MIN_SERIES', 10):
+            pooled = forecasting.forecast(demand, weekdays, ahead, workers=2)
+        np.testing.assert_allclose(pooled, forecasting.forecast(demand, weekdays, ahead, workers=1))
+
+
+class CycleCountTest(TestCase):
+    def test_counts_upload_and_post_as_one_adjustment(self):
+        from apps.core.models import Notification, SystemActivity
+        from .models import StockAdjustment
+
+        main = Branch.objects.create(name="Main")
+        category = Category.objects.create(name="Cement")
+        a = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=category, price=1, cost=10)
+        b = Product.objects.create(name="Cement 25kg", sku="CEM-25", category=category, price=1, cost=5)
+        c = Product.objects.create(name="Cement 10kg", sku="CEM-10", category=category, price=1, cost=2)
+        Stock.objects.create(product=a, branch=main, quantity=10)
+        Stock.objects.create(product=b, branch=main, quantity=4)
+        counter = User.objects.create_user('counter', password='x')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+        from .counts import open_session
+        session = open_session(main, category=category, user=counter)
+        self.assertEqual(session.lines.count(), 3)
+        # Sold after the snapshot, before the shelf count: 8 on the books,
+        # 7 on the shelf, so one unit is missing and stock ends at 7.
+        move_stock([(a, main, -2)], reason='sale')
+
+        scans = ["sku,quantity"] + ["cem-50,1"] * 7 + ["CEM-25,4", "NOPE,1"]
+        resp = client.post(f'/api/count-sessions/{session.pk}/counts/',
+                           {'file': csv_upload(scans, 'scans.csv'), 'mode': 'add'}, format='multipart')
+        self.assertEqual(resp.data, {'updated': 2, 'unknown': ['NOPE'], 'unreadable': 0})
+        resp = client.post(f'/api/count-sessions/{session.pk}/counts/',
+                           {'counts': [{'product': c.pk, 'quantity': 3}], 'mode': 'add'}, format='json')
+        self.assertEqual(resp.data['updated'], 1)
+
+        resp = client.get(f'/api/count-sessions/{session.pk}/variances/')
+        self.assertEqual([(r['sku'], r['variance']) for r in resp.data['results']],
+                         [('CEM-50', -1), ('CEM-10', 3)])
+        self.assertEqual(resp.data['summary']['counted_lines'], 3)
+        self.assertEqual(resp.data['summary']['value'], -4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(f'/api/count-sessions/{session.pk}/approve/')
+        self.assertEqual((resp.data['status'], resp.data['adjusted']), ('approved', 2))
+        self.assertEqual(Stock.objects.get(product=a, branch=main).quantity, 7)
+        self.assertEqual(Stock.objects.get(product=c, branch=main).quantity, 3)
+        self.assertEqual(StockMovement.objects.filter(reason='count').count(), 2)
+        self.assertEqual(StockAdjustment.objects.count(), 2)
+        self.assertEqual(SystemActivity.objects.filter(activity_type='stock').count(), 1)
+        self.assertEqual(Notification.objects.filter(recipient=counter).count(), 1)
+        self.assertEqual(client.post(f'/api/count-sessions/{session.pk}/approve/').status_code, 400)
+
+
+class PurchaseOrderLinesTest(TestCase):
+    def test_bulk_lines_keep_the_total_in_constant_queries(self):
+        from decimal import Decimal
+        main = Branch.objects.create(name="Main")
+        category = Category.objects.create(name="Bolts")
+        products = [Product.objects.create(name=f"Bolt {i}", sku=f"BLT-{i}", category=category, price=2, cost=1)
+                    for i in range(60)]
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        resp = client.post('/api/purchase-orders/', {'branch': main.pk, 'items_input': [
+            {'product': products[0].pk, 'quantity': 2, 'unit_cost': '10'},
+            {'product': None, 'quantity': 1}]}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        po = resp.data['id']
+        self.assertEqual(Decimal(resp.data['total_amount']), 20)
+
+        def add(batch):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = client.post(f'/api/purchase-orders/{po}/lines/', {'items': [
+                    {'product': p.pk, 'quantity': 3, 'unit_cost': '1.50'} for p in batch]}, format='json')
+            self.assertEqual(resp.status_code, 201)
+            return resp, len(ctx.captured_queries)
+
+        _, few = add(products[1:6])
+        resp, many = add(products[6:56])
+        self.assertEqual(few, many)
+        self.assertEqual(Decimal(resp.data['total_amount']), 20 + 55 * Decimal('4.50'))
+
+        bad = client.post(f'/api/purchase-orders/{po}/lines/', {'items': [
+            {'product': products[56].pk, 'quantity': 1, 'unit_cost': 1}, {'product': 99999, 'quantity': 1}]},
+            format='json')
+        self.assertEqual(bad.status_code, 400)
+
+        first = resp.data['items'][0]['id']
+        resp = client.patch(f'/api/purchase-orders/{po}/lines/', {'items': [
+            {'id': first, 'quantity': 10}]}, format='json')
+        self.assertEqual(Decimal(resp.data['total_amount']), 20 + 54 * Decimal('4.50') + 15)
+
+        client.post(f'/api/purchase-orders/{po}/confirm/')
+        items = client.get(f'/api/purchase-orders/{po}/').data['items']
+        resp = client.post(f'/api/purchase-orders/{po}/cross_check/', {'items': [
+            {'item': it['id'], 'delivered_quantity': it['quantity']} for it in items]}, format='json')
+        self.assertEqual(resp.data['status'], 'received')
+        self.assertEqual(Stock.objects.get(product=products[0], branch=main).quantity, 2)
+        self.assertEqual(client.post(f'/api/purchase-orders/{po}/add_item/', {
+            'product': products[57].pk, 'quantity': 1, 'unit_cost': 1}, format='json').status_code, 400)
+
+    def test_lines_check_the_order_status_under_lock(self):
+        from . import purchase_lines
+        from .models import PurchaseOrder
+        category = Category.objects.create(name="Cement")
+        product = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=category, price=1, cost=1)
+        po = PurchaseOrder.objects.create(branch=Branch.objects.create(name="Main"), status='draft')
+        # Someone else cancels the order after this copy was loaded.
+        PurchaseOrder.objects.filter(pk=po.pk).update(status='cancelled')
+        with self.assertRaises(purchase_lines.LineError):
+            purchase_lines.add(po, [{'product': product.pk, 'quantity': 1, 'unit_cost': 1}])
+        self.assertFalse(po.items.exists())
+
+
+class GRNReceiveTest(TestCase):
+    def test_whole_delivery_is_checked_against_the_order_and_replay_safe(self):
+        from .models import GoodsReceivedNote, GRNItem, PurchaseOrder, PurchaseOrderItem
+        main = Branch.objects.create(name="Main")
+        category = Category.objects.create(name="Cement")
+        a = Product.objects.create(name="Cement 50kg", sku="CEM-50", category=category, price=1, cost=1)
+        b = Product.objects.create(name="Cement 25kg", sku="CEM-25", category=category, price=1, cost=1)
+        other = Product.objects.create(name="Nails", sku="NL-1", category=category, price=1, cost=1)
+        po = PurchaseOrder.objects.create(branch=main, status='sent')
+        PurchaseOrderItem.objects.create(purchase_order=po, product=a, quantity=10, unit_cost=1)
+        PurchaseOrderItem.objects.create(purchase_order=po, product=b, quantity=5, unit_cost=1)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+        delivery = {'receipt_number': 'DN-1', 'purchase_order': po.pk,
+                    'items': [{'product': a.pk, 'quantity_received': 6}, {'product': b.pk, 'quantity_received': 5}]}
+        resp = client.post('/api/grns/receive/', delivery, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.data['items']), 2)
+        resp = client.post('/api/grns/receive/', delivery, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(GoodsReceivedNote.objects.count(), 1)
+        self.assertEqual(Stock.objects.get(product=a, branch=main).quantity, 6)
+        po.refresh_from_db()
+        self.assertEqual(po.status, 'sent')
+
+        resp = client.post('/api/grns/receive/', {'receipt_number': 'DN-2', 'purchase_order': po.pk, 'items': [
+            {'product': a.pk, 'quantity_received': 5}, {'product': other.pk, 'quantity_received': 1}]},
+            format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(len(resp.data['error']), 2)
+        self.assertEqual(GRNItem.objects.count(), 2)
+
+        resp = client.post('/api/grns/receive/', {'receipt_number': 'DN-2', 'purchase_order': po.pk, 'items': [
+            {'product': a.pk, 'quantity_received': 4}]}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Stock.objects.get(product=a, branch=main).quantity, 10)
+        po.refresh_from_db()
+        self.assertEqual(po.status, 'received')
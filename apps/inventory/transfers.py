@@ -0,0 +1,97 @@
+"""Multi-line branch transfers (TransferOrder).
+
+Usage:
+    from apps.inventory import transfers
+
+    order = transfers.create(from_branch, to_branch, [(product_id, qty), ...],
+                             user=request.user, status='in_transit')
+    transfers.receive(order, user=request.user)
+
+draft -> in_transit -> received, or draft / in_transit -> cancelled:
+  * dispatch takes every line out of the source branch,
+  * receive puts every line into the destination branch,
+  * cancelling an in-transit order returns the lines to the source,
+  * create(..., status='received') does both legs at once, as the single
+    line /api/transfers/ always has.
+Each step is one move_stock() call, so all lines are checked against the
+locked source rows and applied by one UPDATE in one transaction: a single
+short line (InsufficientStock lists all of them) leaves nothing moved. The
+order row is locked too, so two people can't dispatch or receive it twice.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import TransferOrder, TransferOrderItem
+from .movements import move_stock
+
+
+class TransferStateError(Exception):
+    """The order isn't in a state that allows the requested step."""
+
+
+def create(from_branch, to_branch, lines, user=None, note='', status='draft'):
+    """New order for (product_id, quantity) lines (repeats are summed), left
+    as a draft or taken straight on to 'in_transit' / 'received'."""
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[int(product_id)] = quantities.get(int(product_id), 0) + int(quantity)
+    with transaction.atomic():
+        order = TransferOrder.objects.create(
+            from_branch=from_branch, to_branch=to_branch, note=note,
+            created_by=user if getattr(user, 'is_authenticated', False) else None,
+        )
+        TransferOrderItem.objects.bulk_create([
+            TransferOrderItem(transfer=order, product_id=pid, quantity=qty)
+            for pid, qty in sorted(quantities.items()) if qty > 0
+        ])
+        if status in ('in_transit', 'received'):
+            _step(order, ('draft',), status, user)
+    return order
+
+
+def _lines(order, sign, branch_id):
+    return [(pid, branch_id, sign * qty)
+            for pid, qty in order.items.values_list('product_id', 'quantity')]
+
+
+def _step(order, allowed, to, user):
+    if order.status not in allowed:
+        raise TransferStateError(f"{order.number} is {order.get_status_display().lower()}.")
+    now = timezone.now()
+    user = user if getattr(user, 'is_authenticated', False) else None
+    fields = ['status']
+    moves = []
+    if order.status == 'draft' and to in ('in_transit', 'received'):
+        moves += _lines(order, -1, order.from_branch_id)
+        order.dispatched_by, order.dispatched_at = user, now
+        fields += ['dispatched_by', 'dispatched_at']
+    if to == 'received':
+        moves += _lines(order, 1, order.to_branch_id)
+        order.received_by, order.received_at = user, now
+        fields += ['received_by', 'received_at']
+    if order.status == 'in_transit' and to == 'cancelled':
+        moves += _lines(order, 1, order.from_branch_id)
+    move_stock(moves, reason='transfer', reference=order.number, user=user,
+               require_available=True)
+    order.status = to
+    order.save(update_fields=fields)
+    return order
+
+
+def _locked(order):
+    return TransferOrder.objects.select_for_update().get(pk=order.pk)
+
+
+def dispatch(order, user=None):
+    with transaction.atomic():
+        return _step(_locked(order), ('draft',), 'in_transit', user)
+
+
+def receive(order, user=None):
+    with transaction.atomic():
+        return _step(_locked(order), ('draft', 'in_transit'), 'received', user)
+
+
+def cancel(order, user=None):
+    with transaction.atomic():
+        return _step(_locked(order), ('draft', 'in_transit'), 'cancelled', user)
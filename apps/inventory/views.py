@@ -1,39 +1,46 @@
 from rest_framework import viewsets, permissions
-from .models import Branch, Category, Product, Stock, Purchase, Supplier, StockTransfer, PurchaseOrder, PurchaseOrderItem, Truck, TruckAllocation, StockAdjustment, GoodsReceivedNote, GRNItem, Driver, TruckMaintenance, TruckCost, DriverIssue
+from .models import Branch, Category, DemandForecast, Product, Stock, Purchase, Supplier, StockTransfer, TransferOrder, CountSession, PurchaseOrder, Truck, TruckAllocation, StockAdjustment, GoodsReceivedNote, GRNItem, Driver, TruckMaintenance, TruckCost, DriverIssue
 from .serializers import (
-    BranchSerializer, CategorySerializer, ProductSerializer,
+    BranchSerializer, CategorySerializer, DemandForecastSerializer, ProductSerializer,
     StockSerializer, PurchaseSerializer, SupplierSerializer, StockTransferSerializer,
     PurchaseOrderSerializer, PurchaseOrderItemSerializer, TruckSerializer, TruckAllocationSerializer, StockAdjustmentSerializer,
-    GoodsReceivedNoteSerializer, GRNItemSerializer, DriverSerializer, TruckMaintenanceSerializer, TruckCostSerializer
+    GoodsReceivedNoteSerializer, GRNItemSerializer, DriverSerializer, TruckMaintenanceSerializer, TruckCostSerializer,
+    TransferOrderSerializer, CountSessionSerializer, GRNReceiveSerializer,
 )
 import io
 import csv
 import json
-import openpyxl
 from datetime import date
 from decimal import Decimal
 from django.db import transaction
 from rest_framework import status
 from rest_framework.response import Response
-from django.db.models import Q, Sum
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django.http import HttpResponse
+from django.utils.text import slugify
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from apps.users.permissions import IsStoreManager, IsStoreKeeper, IsStockController, IsAfisaUgavi, CanManageFleet, CanHandleGRN, CanManagePurchaseOrders
+from apps.core.mixins import FieldProjectionMixin
+from apps.core.jobs import enqueue, job_accepted
+from .movements import move_stock, set_stock, InsufficientStock
+from apps.core.uploads import check_upload, UnsupportedUpload
 
-class BranchViewSet(viewsets.ModelViewSet):
+class BranchViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Branch.objects.all()
     serializer_class = BranchSerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -45,146 +52,351 @@ class ProductViewSet(viewsets.ModelViewSet):
         if not file:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-        file_name = file.name
-        headers = []
-        rows = []
-        imported_count = 0
-        errors = []
-
         try:
-            print(f"Starting import for file: {file_name}")
-            if file_name.endswith('.csv'):
-                decoded_file = file.read().decode('utf-8')
-                io_string = io.StringIO(decoded_file)
-                reader = csv.DictReader(io_string)
-                rows = list(reader)
-                headers = reader.fieldnames or []
-            elif file_name.endswith(('.xlsx', '.xls')):
-                wb = openpyxl.load_workbook(file, data_only=True)
-                sheet = wb.active
-                # Get headers and strip them
-                headers = [str(cell.value).strip() if cell.value else "" for cell in sheet[1]]
-                for row_idx, row_data in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                    row_dict = dict(zip(headers, row_data))
-                    if any(row_dict.values()):  # Skip empty rows
-                        rows.append(row_dict)
-            else:
-                return Response({"error": "Unsupported file format. Please upload CSV or Excel."}, status=status.HTTP_400_BAD_REQUEST)
-            print(f"Read {len(rows)} rows from file. Headers: {headers}")
-        except Exception as e:
-            print(f"Error reading file: {str(e)}")
-            return Response({"error": f"Failed to read file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+            check_upload(file)
+        except UnsupportedUpload as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Parsed and written by a worker; the page polls /api/jobs/<id>/.
+        job = enqueue('inventory.import_products', request.user, upload=file)
+        return job_accepted(job)
+
+    @action(detail=False, methods=['GET'])
+    def search(self, request):
+        """GET /api/products/search/?q=&branch=&category=&limit=
+
+        Ranked typeahead matches on name, SKU and category name, each with
+        its stock at `branch` (default: the user's branch)."""
+        from .search import search
+        params = request.query_params
+        branch = params.get('branch') or getattr(request.user, 'branch_id', None)
+        try:
+            limit = int(params.get('limit') or 0)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(search(params.get('q', ''), branch=branch, category=params.get('category'),
+                               limit=limit))
+
+    @action(detail=False, methods=['GET'])
+    def scan(self, request):
+        """GET /api/products/scan/?code=<barcode or SKU>&branch=
+
+        One scanned code -> product, price and stock at `branch` (default:
+        the user's branch), from the in-process map in apps.inventory.scan."""
+        from . import scan
+        branch = request.query_params.get('branch') or getattr(request.user, 'branch_id', None)
+        item = scan.resolve(request.query_params.get('code'), branch)
+        if item is None:
+            return Response({"error": "Unknown barcode"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(item)
+
+    @action(detail=False, methods=['POST'], url_path='scan-cart',
+            permission_classes=[permissions.IsAuthenticated])
+    def scan_cart(self, request):
+        """POST /api/products/scan-cart/ {"codes": [...], "branch": id}
+
+        Resolve a whole scanned basket at once; repeated codes are counted
+        into one line."""
+        from . import scan
+        codes = request.data.get('codes')
+        if not isinstance(codes, list):
+            return Response({"error": "codes must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        branch = request.data.get('branch') or getattr(request.user, 'branch_id', None)
+        items, unknown = scan.resolve_many(codes, branch)
+        return Response({'items': items, 'unknown': unknown})
+
+    @action(detail=False, methods=['GET'])
+    def labels(self, request):
+        """GET /api/products/labels/?category=<id> or ?grn=<id> [&copies=n]
+
+        A4 PDF of barcode labels: one per product in the category, or one
+        per unit received on the GRN (unless `copies` is given)."""
+        from .labels import label_sheet
+        params = request.query_params
+        try:
+            copies = int(params['copies']) if params.get('copies') else None
+        except ValueError:
+            return Response({"error": "copies must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if params.get('grn'):
+            grn = GoodsReceivedNote.objects.filter(pk=params['grn']).first()
+            if grn is None:
+                return Response({"error": "GRN not found"}, status=status.HTTP_404_NOT_FOUND)
+            lines = grn.items.select_related('product').order_by('pk')
+            items = [(line.product, copies if copies is not None else line.quantity_received) for line in lines]
+            name, title = f"labels_{grn.number}", f"{grn.number} ({grn.receipt_number})"
+        elif params.get('category'):
+            category = Category.objects.filter(pk=params['category']).first()
+            if category is None:
+                return Response({"error": "Category not found"}, status=status.HTTP_404_NOT_FOUND)
+            items = [(p, copies or 1) for p in category.products.order_by('name')]
+            name, title = f"labels_{category.name}", category.name
+        else:
+            return Response({"error": "Pass category or grn"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = HttpResponse(label_sheet(items, title=title), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{slugify(name)}.pdf"'
+        return response
+
+class StockHealthPagination(CursorPagination):
+    """The health lists are always paged (50 rows unless ?page_size=)."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-pk'
+
+class StockMatrixPagination(PageNumberPagination):
+    """Matrix rows are per product (grouped), so page numbers."""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class StockViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
+    queryset = Stock.objects.all()
+    serializer_class = StockSerializer
+    permission_classes = [permissions.DjangoModelPermissions]
+    filterset_fields = ['branch', 'product']
 
+    def perform_create(self, serializer):
+        # The row starts at 0; the opening quantity is a ledger movement, so
+        # snapshots and as-of reports can account for it.
+        quantity = serializer.validated_data.pop('quantity', 0)
+        with transaction.atomic():
+            stock = serializer.save(quantity=0)
+            if quantity:
+                set_stock(stock.product, stock.branch, quantity, reason='opening',
+                          reference=f"Stock #{stock.pk}", user=self.request.user)
+                stock.refresh_from_db(fields=['quantity'])
+
+    def perform_update(self, serializer):
+        # Quantity edits go through the ledger like every other change. The
+        # other fields are written with update_fields: a full save would put
+        # back the quantity get_object() read, losing any move_stock() since.
+        data = serializer.validated_data
+        quantity = data.pop('quantity', None)
+        stock = serializer.instance
         with transaction.atomic():
-            for i, row in enumerate(rows):
-                try:
-                    # Case-insensitive row lookup helper
-                    def get_case_insensitive(d, key, default=None):
-                        low_key = key.lower()
-                        for k, v in d.items():
-                            if k and k.lower() == low_key:
-                                return v
-                        return default
-
-                    category_name = get_case_insensitive(row, 'Category')
-                    if not category_name:
-                        errors.append(f"Row {i+2}: Missing Category")
-                        continue
-                        
-                    category, _ = Category.objects.get_or_create(name=str(category_name).strip())
-
-                    sku = get_case_insensitive(row, 'SKU')
-                    sku = str(sku).strip() if sku else None
-
-                    product_name = get_case_insensitive(row, 'Name')
-                    if not product_name:
-                        errors.append(f"Row {i+2}: Missing Product Name")
-                        continue
-
-                    def get_val(key, default=''):
-                        val = get_case_insensitive(row, key)
-                        return val if val is not None else default
-
-                    # If SKU exists, try to find by SKU. If not, try to find by Name + Category to prevent duplicates
-                    product = None
-                    created = False
-                    
-                    if sku:
-                        product, created = Product.objects.get_or_create(
-                            sku=sku,
-                            defaults={
-                                'name': str(product_name).strip(),
-                                'category': category,
-                                'product_type': str(get_val('Type', 'product')).lower().strip(),
-                                'cost': float(str(get_val('Cost', 0) or 0).replace(',', '')),
-                                'price': float(str(get_val('Price', 0) or 0).replace(',', '')),
-                                'weight': float(str(get_val('Weight (kg)', 0) or 0).replace(',', '')),
-                                'description': str(get_val('Description', '')).strip(),
-                            }
-                        )
-                    else:
-                        # No SKU provided, check by Name and Category
-                        product, created = Product.objects.get_or_create(
-                            name=str(product_name).strip(),
-                            category=category,
-                            defaults={
-                                'product_type': str(get_val('Type', 'product')).lower().strip(),
-                                'cost': float(str(get_val('Cost', 0) or 0).replace(',', '')),
-                                'price': float(str(get_val('Price', 0) or 0).replace(',', '')),
-                                'weight': float(str(get_val('Weight (kg)', 0) or 0).replace(',', '')),
-                                'description': str(get_val('Description', '')).strip(),
-                            }
-                        )
-
-                    # Handle Opening Stock (Additive)
-                    try:
-                        raw_opening = get_val('Opening Stock', 0)
-                        raw_low = get_val('Low Stock Alert', 10)
-                        opening_stock = int(float(str(raw_opening or 0).replace(',', '')))
-                        low_stock = int(float(str(raw_low or 10).replace(',', '')))
-                    except (ValueError, TypeError):
-                        opening_stock = 0
-                        low_stock = 10
-                    
-                    # Ensure Stock record exists in the Main Branch for 'product' types
-                    product_type = str(get_val('Type', 'product')).lower().strip()
-                    if product_type == 'product':
-                        branch, _ = Branch.objects.get_or_create(name="Main Branch")
-                        stock_obj, s_created = Stock.objects.get_or_create(
-                            product=product,
-                            branch=branch,
-                            defaults={
-                                'quantity': opening_stock,
-                                'low_stock_threshold': low_stock
-                            }
-                        )
-                        if not s_created:
-                            # If stock record already existed, ADD to it
-                            stock_obj.quantity += opening_stock
-                            stock_obj.save()
-
-                    imported_count += 1
-                except Exception as e:
-                    errors.append(f"Row {i+2}: {str(e)}")
+            for field, value in data.items():
+                setattr(stock, field, value)
+            if data:
+                stock.save(update_fields=list(data))
+            if quantity is not None:
+                set_stock(stock.product, stock.branch, quantity,
+                          reference=f"Stock #{stock.pk} edit", user=self.request.user)
+            stock.refresh_from_db(fields=['quantity'])
+
+    @action(detail=False, methods=['GET'])
+    def health(self, request):
+        """GET /api/stocks/health/?branch=&category=&status=&page_size=&cursor=
+
+        Healthy / low / out-of-stock counts for the filtered rows, plus one
+        cursor-paged list of the rows in `status` (low, out, healthy, or the
+        default "attention" = low and out together)."""
+        stocks = Stock.objects.all()
+        branch = request.query_params.get('branch')
+        category = request.query_params.get('category')
+        if branch:
+            stocks = stocks.filter(branch_id=branch)
+        if category:
+            stocks = stocks.filter(product__category_id=category)
+
+        conditions = {
+            'out': Q(quantity__lte=0),
+            'low': Q(quantity__gt=0, quantity__lte=F('low_stock_threshold')),
+            'healthy': Q(quantity__gt=F('low_stock_threshold')) & Q(quantity__gt=0),
+            'attention': Q(quantity__lte=F('low_stock_threshold')) | Q(quantity__lte=0),
+        }
+        wanted = request.query_params.get('status') or 'attention'
+        if wanted not in conditions:
+            return Response({"error": f"status must be one of {', '.join(conditions)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        counts = stocks.aggregate(**{name: Count('pk', filter=q) for name, q in conditions.items()
+                                     if name != 'attention'})
+
+        paginator = StockHealthPagination()
+        rows = paginator.paginate_queryset(
+            stocks.filter(conditions[wanted]).select_related('product', 'branch'), request, view=self)
+        results = StockSerializer(rows, many=True).data
+        for item, stock in zip(results, rows):
+            item['status'] = ('out' if stock.quantity <= 0 else
+                              'low' if stock.quantity <= stock.low_stock_threshold else 'healthy')
+        return Response({
+            'counts': counts,
+            'status': wanted,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': results,
+        })
+
+    @action(detail=False, methods=['GET'])
+    def matrix(self, request):
+        """GET /api/stocks/matrix/?category=&status=low|out|attention&q=&product=&page=&page_size=
+
+        One row per product with its quantity at every branch
+        ({"<branch id>": qty}) and the total, pivoted by a single grouped
+        query. `status` keeps products that are low / out somewhere. Sends an
+        ETag; a matching If-None-Match gets 304 and no body."""
+        import hashlib
+        from django.contrib.postgres.aggregates import ArrayAgg
+        from django.utils.http import parse_etags, quote_etag
+
+        params = request.query_params
+        in_stock = Q(stocks__isnull=False)
+        flags = {
+            'low': Q(stocks__quantity__gt=0, stocks__quantity__lte=F('stocks__low_stock_threshold')),
+            'out': Q(stocks__quantity__lte=0),
+            'attention': Q(stocks__quantity__lte=F('stocks__low_stock_threshold')) | Q(stocks__quantity__lte=0),
+        }
+        wanted = params.get('status')
+        if wanted and wanted not in flags:
+            return Response({"error": f"status must be one of {', '.join(flags)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
+        products = Product.objects.filter(product_type='product')
+        if params.get('category'):
+            products = products.filter(category_id=params['category'])
+        if params.get('product'):
+            products = products.filter(pk=params['product'])
+        if params.get('q'):
+            products = products.filter(Q(name__icontains=params['q']) | Q(sku__icontains=params['q']))
+        rows = products.annotate(
+            branch_ids=ArrayAgg('stocks__branch_id', filter=in_stock, ordering='stocks__branch_id', default=[]),
+            quantities=ArrayAgg('stocks__quantity', filter=in_stock, ordering='stocks__branch_id', default=[]),
+            total=Coalesce(Sum('stocks__quantity'), 0),
+            attention=Count('stocks', filter=flags['attention']),
+        )
+        if wanted:
+            rows = rows.annotate(matching=Count('stocks', filter=flags[wanted])).filter(matching__gt=0)
+        rows = rows.order_by('name', 'pk').values('id', 'name', 'sku', 'category_id', 'branch_ids',
+                                                  'quantities', 'total', 'attention')
+
+        paginator = StockMatrixPagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        data = {
+            'branches': list(Branch.objects.order_by('pk').values('id', 'name')),
+            'count': paginator.page.paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': [{
+                'product': r['id'], 'name': r['name'], 'sku': r['sku'], 'category': r['category_id'],
+                'quantities': {str(b): q for b, q in zip(r['branch_ids'], r['quantities'])},
+                'total': r['total'], 'attention': r['attention'] > 0,
+            } for r in page],
+        }
+
+        etag = quote_etag(hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest())
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['GET'], url_path='as-of')
+    def as_of(self, request):
+        """GET /api/stocks/as-of/?branch=&at=2026-06-30&category=&product=
+
+        Stock on hand at a branch at a past moment. `at` is a date (closing
+        stock that day) or a date-time. Rebuilt from the nearest nightly
+        snapshot plus the movements since, see apps.inventory.asof.
+        `complete` is false for moments before the branch's stock ledger
+        starts (`history_starts`); those figures are not reliable."""
+        from django.utils import timezone
+        from django.utils.dateparse import parse_date, parse_datetime
+        from .asof import day_end, stock_as_of
+
+        branch = request.query_params.get('branch') or ''
+        raw = request.query_params.get('at') or ''
+        if not branch.isdigit() or not Branch.objects.filter(pk=branch).exists():
+            return Response({"error": "A valid branch is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            moment = parse_datetime(raw) if 'T' in raw or ' ' in raw else None
+            day = None if moment else parse_date(raw)
+        except ValueError:
+            moment = day = None
+        if moment is None and day is None:
+            return Response({"error": "at must be a date (2026-06-30) or date-time"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if moment is None:
+            moment = day_end(day)
+        elif timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+
+        products = None
+        if request.query_params.get('category'):
+            products = Product.objects.filter(category_id=request.query_params['category'])
+        if request.query_params.get('product'):
+            products = (products or Product.objects).filter(pk=request.query_params['product'])
+        levels, basis = stock_as_of(branch, moment, products)
+
+        rows = Product.objects.filter(pk__in=levels).order_by('name').values('id', 'name', 'sku')
         return Response({
-            "message": f"Processed {len(rows)} rows, successfully imported/found {imported_count} products.",
-            "errors": errors,
-            "detected_headers": headers
-        }, status=status.HTTP_201_CREATED if not errors else status.HTTP_207_MULTI_STATUS)
+            'branch': int(branch),
+            'at': moment.isoformat(),
+            'snapshot': basis['snapshot'],
+            'movements_replayed': basis['movements'],
+            'complete': basis['complete'],
+            'history_starts': basis['history_starts'].isoformat() if basis['history_starts'] else None,
+            'results': [{'product': r['id'], 'product_name': r['name'], 'sku': r['sku'],
+                         'quantity': levels[r['id']]} for r in rows],
+        })
 
-class StockViewSet(viewsets.ModelViewSet):
-    queryset = Stock.objects.all()
-    serializer_class = StockSerializer
+class ForecastTotalsPagination(PageNumberPagination):
+    """Totals are grouped rows (no pk to key a cursor on), so page numbers."""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class DemandForecastViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
+    """Stored daily forecasts (manage.py forecast_demand)."""
+    queryset = DemandForecast.objects.select_related('product', 'branch')
+    serializer_class = DemandForecastSerializer
     permission_classes = [permissions.DjangoModelPermissions]
-    filterset_fields = ['branch', 'product']
+    filterset_fields = ['branch', 'product', 'day']
 
-class SupplierViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['GET'])
+    def totals(self, request):
+        """GET /api/forecasts/totals/?branch=&category=&days=7
+
+        Expected dispatches per product and branch over the next `days`
+        days (default: the whole stored horizon) next to stock on hand,
+        largest first: what purchasing should cover."""
+        from datetime import timedelta
+        from django.db.models import OuterRef, Subquery
+        from django.utils import timezone
+
+        forecasts = DemandForecast.objects.filter(day__gte=timezone.localdate())
+        params = request.query_params
+        if params.get('days'):
+            try:
+                days = int(params['days'])
+            except ValueError:
+                return Response({"error": "days must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+            forecasts = forecasts.filter(day__lt=timezone.localdate() + timedelta(days=days))
+        if params.get('branch'):
+            forecasts = forecasts.filter(branch_id=params['branch'])
+        if params.get('category'):
+            forecasts = forecasts.filter(product__category_id=params['category'])
+
+        on_hand = Stock.objects.filter(product=OuterRef('product_id'), branch=OuterRef('branch_id')).values('quantity')[:1]
+        rows = (forecasts.values('product_id', 'branch_id')
+                .annotate(expected=Sum('quantity'), product_name=F('product__name'), sku=F('product__sku'),
+                          branch_name=F('branch__name'), on_hand=Coalesce(Subquery(on_hand), 0))
+                .order_by('-expected', 'product_id', 'branch_id'))
+        paginator = ForecastTotalsPagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        for row in page:
+            row['expected'] = round(row['expected'], 1)
+            row['shortfall'] = max(0, round(row['expected'] - row['on_hand'], 1))
+        return paginator.get_paginated_response(page)
+
+class SupplierViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -200,18 +412,13 @@ class PurchaseViewSet(viewsets.ModelViewSet):
             total_cost = serializer.validated_data['quantity'] * serializer.validated_data['unit_cost']
             purchase = serializer.save(total_cost=total_cost)
             # Increase Stock
-            stock, _ = Stock.objects.get_or_create(
-                product=purchase.product,
-                branch=purchase.branch,
-                defaults={'quantity': 0}
-            )
-            stock.quantity += purchase.quantity
-            stock.save()
+            move_stock([(purchase.product, purchase.branch, purchase.quantity)],
+                       reason='purchase', reference=f"Purchase #{purchase.pk}", user=request.user)
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-class StockTransferViewSet(viewsets.ModelViewSet):
+class StockTransferViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = StockTransfer.objects.all()
     serializer_class = StockTransferSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -219,24 +426,76 @@ class StockTransferViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        transfer = serializer.save()
-
-        # Update Stocks
-        with transaction.atomic():
-            # Decrease Source
-            source_stock, _ = Stock.objects.get_or_create(product=transfer.product, branch=transfer.from_branch)
-            source_stock.quantity -= transfer.quantity
-            source_stock.save()
 
-            # Increase Dest
-            dest_stock, _ = Stock.objects.get_or_create(product=transfer.product, branch=transfer.to_branch)
-            dest_stock.quantity += transfer.quantity
-            dest_stock.save()
+        # Record the transfer and move the stock together; the source branch
+        # must actually hold the quantity being sent.
+        try:
+            with transaction.atomic():
+                transfer = serializer.save()
+                move_stock([
+                    (transfer.product, transfer.from_branch, -transfer.quantity),
+                    (transfer.product, transfer.to_branch, transfer.quantity),
+                ], reason='transfer', reference=f"Transfer #{transfer.pk}",
+                   user=request.user, require_available=True)
+        except InsufficientStock as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-class PurchaseOrderViewSet(viewsets.ModelViewSet):
+class TransferOrderViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
+    """Multi-line transfers: create with every line at once (optionally
+    straight to in_transit or received), then dispatch / receive / cancel.
+    See apps.inventory.transfers."""
+    queryset = TransferOrder.objects.select_related('from_branch', 'to_branch', 'created_by').prefetch_related('items__product')
+    serializer_class = TransferOrderSerializer
+    permission_classes = [permissions.DjangoModelPermissions]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        for param in ('status', 'from_branch', 'to_branch'):
+            value = self.request.query_params.get(param)
+            if value:
+                qs = qs.filter(**{param: value})
+        return qs
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = serializer.save(created_by=request.user)
+        except InsufficientStock as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        data = self.get_serializer(self.get_queryset().get(pk=order.pk)).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def _step(self, request, step):
+        from .transfers import TransferStateError
+        order = self.get_object()
+        try:
+            step(order, user=request.user)
+        except TransferStateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_queryset().get(pk=order.pk)).data)
+
+    @action(detail=True, methods=['POST'], url_path='dispatch')
+    def send(self, request, pk=None):  # not `dispatch`: that name is APIView's
+        from .transfers import dispatch
+        return self._step(request, dispatch)
+
+    @action(detail=True, methods=['POST'])
+    def receive(self, request, pk=None):
+        from .transfers import receive
+        return self._step(request, receive)
+
+    @action(detail=True, methods=['POST'])
+    def cancel(self, request, pk=None):
+        from .transfers import cancel
+        return self._step(request, cancel)
+
+class PurchaseOrderViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = PurchaseOrder.objects.all()
     serializer_class = PurchaseOrderSerializer
     permission_classes = [permissions.IsAuthenticated, CanManagePurchaseOrders]
@@ -287,18 +546,14 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
 
         mismatch = False
         with transaction.atomic():
-            for it in po.items.all():
-                delivered = delivered_map.get(it.id, 0)
-                it.delivered_quantity = delivered
-                it.save(update_fields=['delivered_quantity'])
-                if delivered != it.quantity:
+            from .purchase_lines import record_delivery
+            receipts = []
+            for it in record_delivery(po, delivered_map):
+                if it.delivered_quantity != it.quantity:
                     mismatch = True
-                if delivered > 0:
-                    stock, _ = Stock.objects.get_or_create(
-                        product=it.product, branch=po.branch, defaults={'quantity': 0}
-                    )
-                    stock.quantity += delivered
-                    stock.save()
+                if it.delivered_quantity > 0:
+                    receipts.append((it.product_id, po.branch_id, it.delivered_quantity))
+            move_stock(receipts, reason='po_receipt', reference=po.number, user=request.user)
             po.checked_by = request.user
             po.checked_at = timezone.now()
             po.store_note = note
@@ -312,8 +567,8 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
             supplier = po.supplier.name if po.supplier else 'supplier'
             notify(
                 po.created_by,
-                title=f"Delivery discrepancy on PO-{po.id:05d}",
-                message=(f"The Store Manager found that the delivery for PO-{po.id:05d} ({supplier}) "
+                title=f"Delivery discrepancy on {po.number}",
+                message=(f"The Store Manager found that the delivery for {po.number} ({supplier}) "
                          f"does not match what was ordered. Please open the order and add a comment "
                          f"explaining why the goods are not complete."),
                 url='/inventory/purchase-orders/',
@@ -321,7 +576,7 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
             )
             SystemActivity.objects.create(
                 user=request.user, activity_type='purchase',
-                description=f"Delivery discrepancy flagged on PO-{po.id:05d} at store cross-check",
+                description=f"Delivery discrepancy flagged on {po.number} at store cross-check",
                 icon_class='bi-exclamation-triangle',
             )
 
@@ -362,7 +617,7 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
         ctx = {
             'doc': {
                 'type': 'PURCHASE ORDER', 'number_label': 'P.O. No.',
-                'number': 'PO-%05d' % po.id, 'date': po.order_date or po.created_at,
+                'number': po.number, 'date': po.order_date or po.created_at,
                 'valid_until': None, 'page': '1/1',
                 'recipient_label': 'Supplier',
                 'branch': po.branch.name if po.branch else '',
@@ -387,38 +642,45 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['POST'])
     def add_item(self, request, pk=None):
-        po = self.get_object()
-        product_id = request.data.get('product')
-        quantity = int(request.data.get('quantity', 0))
-        unit_cost = float(request.data.get('unit_cost', 0))
-        
-        product = Product.objects.get(pk=product_id)
-        
-        item = PurchaseOrderItem.objects.create(
-            purchase_order=po,
-            product=product,
-            quantity=quantity,
-            unit_cost=unit_cost,
-            total_cost=quantity * unit_cost
-        )
-        
-        # Update PO total
-        po.total_amount = sum(i.total_cost for i in po.items.all())
-        po.save()
-        
+        from .purchase_lines import LineError, add
+        try:
+            item, = add(self.get_object(), [request.data])
+        except LineError as e:
+            return Response({"error": e.errors}, status=status.HTTP_400_BAD_REQUEST)
         return Response(PurchaseOrderItemSerializer(item).data)
 
-class TruckViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['POST', 'PATCH'])
+    def lines(self, request, pk=None):
+        """POST {"items": [{product, quantity, unit_cost, unit}, ...]} adds
+        lines; PATCH {"items": [{id, quantity?, unit_cost?, unit?}, ...]}
+        changes existing ones. All or nothing; total_amount follows."""
+        from . import purchase_lines
+        po = self.get_object()
+        rows = request.data.get('items')
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "Send a non-empty list of items."}, status=status.HTTP_400_BAD_REQUEST)
+        rows = [r if isinstance(r, dict) else {} for r in rows]
+        step = purchase_lines.add if request.method == 'POST' else purchase_lines.update
+        try:
+            items = step(po, rows)
+        except purchase_lines.LineError as e:
+            return Response({"error": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        items = po.items.select_related('product').filter(pk__in=[i.pk for i in items]).order_by('pk')
+        return Response({'total_amount': po.total_amount,
+                         'items': PurchaseOrderItemSerializer(items, many=True).data},
+                        status=status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK)
+
+class TruckViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Truck.objects.all()
     serializer_class = TruckSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageFleet]
 
-class TruckAllocationViewSet(viewsets.ModelViewSet):
+class TruckAllocationViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = TruckAllocation.objects.all()
     serializer_class = TruckAllocationSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageFleet]
 
-class GoodsReceivedNoteViewSet(viewsets.ModelViewSet):
+class GoodsReceivedNoteViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = GoodsReceivedNote.objects.all()
     serializer_class = GoodsReceivedNoteSerializer
     # Stock Controller creates GRN; Store Keeper verifies it in the UI — both need access.
@@ -432,6 +694,28 @@ class GoodsReceivedNoteViewSet(viewsets.ModelViewSet):
             grn.purchase_order.status = 'received'
             grn.purchase_order.save()
 
+    @action(detail=False, methods=['post'])
+    def receive(self, request):
+        """POST /api/grns/receive/ with receipt_number, branch, purchase_order,
+        notes and items [{product, quantity_received, remarks}, ...]: the
+        GRN, all its lines and the stock in one go (apps.inventory.receiving).
+        Posting the same receipt_number again returns the recorded GRN (200)
+        without moving stock."""
+        from .receiving import ReceivingError, receive
+
+        serializer = GRNReceiveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            grn, created = receive(data['receipt_number'], data['branch'], data['items'],
+                                   purchase_order=data.get('purchase_order'), user=request.user,
+                                   notes=data.get('notes', ''))
+        except ReceivingError as e:
+            return Response({'error': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        grn = GoodsReceivedNote.objects.prefetch_related('items__product').get(pk=grn.pk)
+        return Response(GoodsReceivedNoteSerializer(grn).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
         grn = self.get_object()
@@ -440,21 +724,17 @@ class GoodsReceivedNoteViewSet(viewsets.ModelViewSet):
         
         try:
             product = Product.objects.get(id=product_id)
-            item = GRNItem.objects.create(
-                grn=grn,
-                product=product,
-                quantity_received=qty,
-                remarks=request.data.get('remarks', '')
-            )
-            
-            # UPDATE STOCK
-            stock, created = Stock.objects.get_or_create(
-                product=product, 
-                branch=grn.branch,
-                defaults={'quantity': 0}
-            )
-            stock.quantity += int(qty)
-            stock.save()
+            with transaction.atomic():
+                item = GRNItem.objects.create(
+                    grn=grn,
+                    product=product,
+                    quantity_received=qty,
+                    remarks=request.data.get('remarks', '')
+                )
+
+                # UPDATE STOCK
+                move_stock([(product, grn.branch, int(qty))], reason='grn',
+                           reference=grn.receipt_number, user=request.user)
 
             return Response(GRNItemSerializer(item).data)
         except Exception as e:
@@ -545,39 +825,126 @@ class InventoryHealthView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Inventory Health'
         context['resource'] = 'stocks'
+        context['branches'] = Branch.objects.order_by('name')
+        context['categories'] = Category.objects.order_by('name')
         return context
 
+AGING_BUCKETS = (
+    # key, label, min days, max days, badge
+    ('0-30', '0-30 days', 0, 30, 'success'),
+    ('31-60', '31-60 days', 31, 60, 'info'),
+    ('61-90', '61-90 days', 61, 90, 'warning'),
+    ('90+', 'Over 90 days', 91, None, 'danger'),
+)
+
+
+def _aging_queryset(params, now):
+    """Stock rows annotated with `last_date`: the latest of the last purchase,
+    the last GRN receipt at that branch and (if neither) the product's
+    creation date. Both lookups are correlated subqueries, so the whole
+    report is one query however many rows it has. Oldest stock first.
+
+    Filters (all optional): branch, category, bucket (see AGING_BUCKETS).
+    """
+    from django.db.models import OuterRef, Subquery
+    from django.db.models.functions import Coalesce, Greatest
+    from datetime import timedelta
+
+    last_purchase = (Purchase.objects.filter(product=OuterRef('product_id'), branch=OuterRef('branch_id'))
+                     .order_by('-date_purchased').values('date_purchased')[:1])
+    last_grn = (GRNItem.objects.filter(product=OuterRef('product_id'), grn__branch=OuterRef('branch_id'))
+                .order_by('-grn__received_date').values('grn__received_date')[:1])
+    qs = (Stock.objects.select_related('product', 'branch')
+          .annotate(last_purchase=Subquery(last_purchase), last_grn=Subquery(last_grn))
+          .annotate(last_date=Coalesce(Greatest('last_purchase', 'last_grn'),
+                                       'last_purchase', 'last_grn', 'product__created_at'))
+          .order_by('last_date', 'pk'))
+
+    branch = (params.get('branch') or '').strip()
+    category = (params.get('category') or '').strip()
+    if branch:
+        qs = qs.filter(branch_id=branch)
+    if category:
+        qs = qs.filter(product__category_id=category)
+
+    bucket = next((b for b in AGING_BUCKETS if b[0] == params.get('bucket')), None)
+    if bucket:
+        _, _, low, high, _ = bucket
+        qs = qs.filter(last_date__lte=now - timedelta(days=low))
+        if high is not None:
+            qs = qs.filter(last_date__gt=now - timedelta(days=high + 1))
+    return qs
+
+
+def _aging_row(stock, now):
+    days = (now - stock.last_date).days
+    badge = next(b[4] for b in reversed(AGING_BUCKETS) if days >= b[2])
+    return {
+        'product_name': stock.product.name,
+        'sku': stock.product.sku,
+        'branch_name': stock.branch.name,
+        'quantity': stock.quantity,
+        'last_date': stock.last_date,
+        'days': days,
+        'status': badge,
+    }
+
+
 class InventoryAgingView(LoginRequiredMixin, TemplateView):
+    """GET ?branch=&category=&bucket=&page=, or ?export=csv for the whole
+    filtered report as a CSV file."""
     template_name = 'inventory_aging.html'
+    paginate_by = 100
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('export') == 'csv':
+            return self._export_csv()
+        return super().get(request, *args, **kwargs)
+
+    def _export_csv(self):
+        from django.utils import timezone
+        now = timezone.now()
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="inventory_aging_%s.csv"' % date.today().isoformat()
+        writer = csv.writer(response)
+        writer.writerow(['Product', 'SKU', 'Branch', 'Quantity', 'Last Received', 'Age (days)', 'Bucket'])
+        labels = {b[4]: b[1] for b in AGING_BUCKETS}
+        for stock in _aging_queryset(self.request.GET, now).iterator(chunk_size=2000):
+            row = _aging_row(stock, now)
+            writer.writerow([row['product_name'], row['sku'], row['branch_name'], row['quantity'],
+                             row['last_date'].date().isoformat(), row['days'], labels[row['status']]])
+        return response
+
     def get_context_data(self, **kwargs):
-        from apps.inventory.models import Stock, Purchase
+        from urllib.parse import urlencode
+        from django.core.paginator import Paginator
+        from django.db.models import Count, Q
         from django.utils import timezone
+        from datetime import timedelta
         context = super().get_context_data(**kwargs)
-        
-        stocks = Stock.objects.select_related('product', 'branch').all()
         now = timezone.now()
-        
-        aging_data = []
-        for stock in stocks:
-            # Find the latest purchase for this product in this branch
-            last_purchase = Purchase.objects.filter(
-                product=stock.product, 
-                branch=stock.branch
-            ).order_by('-date_purchased').first()
-            
-            last_date = last_purchase.date_purchased if last_purchase else stock.product.created_at
-            days = (now - last_date).days
-            
-            aging_data.append({
-                'product_name': stock.product.name,
-                'branch_name': stock.branch.name,
-                'quantity': stock.quantity,
-                'last_date': last_date,
-                'days': days,
-                'status': 'danger' if days > 90 else 'warning' if days > 60 else 'info' if days > 30 else 'success'
-            })
-            
-        context['aging_data'] = sorted(aging_data, key=lambda x: x['days'], reverse=True)
+        params = self.request.GET
+
+        qs = _aging_queryset(params, now)
+        page = Paginator(qs, self.paginate_by).get_page(params.get('page'))
+
+        # Bucket totals for the current branch/category filter, one query.
+        base = _aging_queryset({k: v for k, v in params.items() if k != 'bucket'}, now)
+        counts = base.aggregate(**{
+            b[0]: Count('pk', filter=Q(last_date__lte=now - timedelta(days=b[2])) & (
+                Q(last_date__gt=now - timedelta(days=b[3] + 1)) if b[3] is not None else Q()))
+            for b in AGING_BUCKETS
+        })
+
+        clean = {k: v for k, v in params.items() if k in ('branch', 'category', 'bucket') and v}
+        context['aging_data'] = [_aging_row(stock, now) for stock in page.object_list]
+        context['page_obj'] = page
+        context['buckets'] = [{'key': b[0], 'label': b[1], 'badge': b[4], 'count': counts[b[0]]}
+                              for b in AGING_BUCKETS]
+        context['filters'] = clean
+        context['filter_querystring'] = urlencode(clean)
+        context['branches'] = Branch.objects.order_by('name')
+        context['categories'] = Category.objects.order_by('name')
         context['title'] = 'Inventory Aging'
         context['resource'] = 'stocks'
         return context
@@ -628,9 +995,39 @@ class ABCAnalysisView(LoginRequiredMixin, TemplateView):
         return context
 
 class ProfitabilityReportView(LoginRequiredMixin, TemplateView):
+    """Revenue, COGS and margin of actual sales. GET ?start=&end= (dates,
+    default this month), ?group=product|category|branch|period, and
+    optional ?branch= / ?category= to drill down."""
     template_name = 'inventory_profitability.html'
+
     def get_context_data(self, **kwargs):
+        from datetime import datetime
+        from django.utils import timezone
+        from .profitability import GROUPS, profitability, summarize
         context = super().get_context_data(**kwargs)
+        params = self.request.GET
+
+        today = timezone.localdate()
+        try:
+            start = datetime.strptime(params['start'], '%Y-%m-%d').date() if params.get('start') else today.replace(day=1)
+            end = datetime.strptime(params['end'], '%Y-%m-%d').date() if params.get('end') else today
+        except ValueError:
+            start, end = today.replace(day=1), today
+        if end < start:
+            start, end = end, start
+        group = params.get('group') if params.get('group') in GROUPS else 'product'
+
+        lines, total = summarize(profitability(start, end), group,
+                                 branch=params.get('branch'), category=params.get('category'))
+        context['lines'] = lines
+        context['total'] = total
+        context['group'] = group
+        context['groups'] = list(GROUPS)
+        context['start'] = start
+        context['end'] = end
+        context['filters'] = {k: params.get(k, '') for k in ('branch', 'category')}
+        context['branches'] = Branch.objects.order_by('name')
+        context['categories'] = Category.objects.order_by('name')
         context['title'] = 'Profitability Report'
         context['resource'] = 'stocks'
         return context
@@ -650,7 +1047,7 @@ def download_product_template(request):
 
     return response
 
-class StockAdjustmentViewSet(viewsets.ModelViewSet):
+class StockAdjustmentViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = StockAdjustment.objects.all().order_by('-created_at')
     serializer_class = StockAdjustmentSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -668,24 +1065,106 @@ class StockAdjustmentViewSet(viewsets.ModelViewSet):
             adjustment = serializer.save(user=request.user if request.user.is_authenticated else None)
             
             # Update Stock
-            stock, _ = Stock.objects.get_or_create(
-                product=adjustment.product, 
-                branch=adjustment.branch,
-                defaults={'quantity': 0}
-            )
-            
-            if adjustment.adjustment_type == 'addition':
-                stock.quantity += adjustment.quantity
-            elif adjustment.adjustment_type == 'deduction':
-                stock.quantity -= adjustment.quantity
-            elif adjustment.adjustment_type == 'correction':
-                stock.quantity = adjustment.quantity
-            
-            stock.save()
+            reference = f"Adjustment #{adjustment.pk}"
+            if adjustment.adjustment_type == 'correction':
+                set_stock(adjustment.product, adjustment.branch, adjustment.quantity,
+                          reference=reference, user=request.user)
+            else:
+                sign = -1 if adjustment.adjustment_type == 'deduction' else 1
+                move_stock([(adjustment.product, adjustment.branch, sign * int(adjustment.quantity))],
+                           reason='adjustment', reference=reference, user=request.user)
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
+class CountVariancePagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+class CountSessionViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
+    """Cycle counts (apps.inventory.counts): open a session for a branch or
+    category, upload counts in bulk, review the variances, approve."""
+    queryset = CountSession.objects.select_related('branch', 'category', 'created_by', 'approved_by')
+    serializer_class = CountSessionSerializer
+    permission_classes = [permissions.DjangoModelPermissions]
+    filterset_fields = ['branch', 'status']
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['POST'])
+    def counts(self, request, pk=None):
+        """POST /api/count-sessions/<id>/counts/
+
+        Either a .csv / .xlsx `file` with `sku` (or `product`) and `quantity`
+        columns, or JSON {"counts": [{"sku": "CEM-50", "quantity": 12}, ...]}.
+        `mode` is "set" (default) or "add" to add to earlier uploads; one row
+        per scan is fine, repeated codes are summed."""
+        from apps.core.uploads import read_upload
+        from .counts import CountError, record
+
+        session = self.get_object()
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                _, rows = read_upload(upload)
+            except UnsupportedUpload as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            rows = ({str(k or '').strip().lower(): v for k, v in row.items()} for row in rows)
+        else:
+            rows = request.data.get('counts')
+            if not isinstance(rows, list):
+                return Response({"error": "Send a file or a list of counts."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = [r for r in rows if isinstance(r, dict)]
+        try:
+            updated, unknown, bad = record(session, rows, mode=request.data.get('mode') or 'set')
+        except CountError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': updated, 'unknown': unknown, 'unreadable': len(bad)})
+
+    @action(detail=True, methods=['GET'])
+    def variances(self, request, pk=None):
+        """Totals for the session plus a page of the lines whose count
+        differs from the book quantity when they were counted."""
+        from .counts import summary, variances
+
+        session = self.get_object()
+        rows = variances(session).values('product_id', 'expected', 'book', 'counted', 'variance', 'value',
+                                         product_name=F('product__name'), sku=F('product__sku'))
+        paginator = CountVariancePagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        response = paginator.get_paginated_response(page)
+        response.data['summary'] = summary(session)
+        return response
+
+    @action(detail=True, methods=['POST'], permission_classes=[permissions.IsAuthenticated, IsStoreManager])
+    def approve(self, request, pk=None):
+        """Post every variance as one stock adjustment."""
+        from .counts import CountError, approve
+
+        session = self.get_object()
+        try:
+            adjusted = approve(session, user=request.user)
+        except CountError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        session.refresh_from_db()
+        return Response({**self.get_serializer(session).data, 'adjusted': adjusted})
+
+    @action(detail=True, methods=['POST'])
+    def cancel(self, request, pk=None):
+        from .counts import CountError, cancel
+
+        try:
+            session = cancel(self.get_object())
+        except CountError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data)
+
 class PurchaseOrderListView(LoginRequiredMixin, TemplateView):
     template_name = 'inventory/purchase_order_list.html'
 
@@ -708,12 +1187,12 @@ class StockAdjustmentView(LoginRequiredMixin, TemplateView):
         context['resource'] = 'stocks'
         return context
 
-class DriverViewSet(viewsets.ModelViewSet):
+class DriverViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Driver.objects.all()
     serializer_class = DriverSerializer
     permission_classes = [permissions.IsAuthenticated, IsStoreManager]
 
-class TruckMaintenanceViewSet(viewsets.ModelViewSet):
+class TruckMaintenanceViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = TruckMaintenance.objects.all().order_by('-date')
     serializer_class = TruckMaintenanceSerializer
     permission_classes = [permissions.IsAuthenticated, IsStoreManager]
@@ -721,7 +1200,7 @@ class TruckMaintenanceViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(recorded_by=self.request.user)
 
-class TruckCostViewSet(viewsets.ModelViewSet):
+class TruckCostViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = TruckCost.objects.select_related('truck', 'allocation', 'recorded_by').all()
     serializer_class = TruckCostSerializer
     permission_classes = [permissions.IsAuthenticated, IsAfisaUgavi]
@@ -964,15 +1443,24 @@ def _export_purchases_pdf(qs, params):
     return resp
 
 
+def build_purchase_export(params):
+    qs = _filter_purchases(params)
+    fmt = (params.get('format') or 'excel').lower()
+    if fmt == 'pdf':
+        return _export_purchases_pdf(qs, params)
+    return _export_purchases_excel(qs, params)
+
+
 class PurchaseReportExportView(LoginRequiredMixin, TemplateView):
-    """GET ?format=excel|pdf plus the same filter params as the report page."""
+    """GET ?format=excel|pdf plus the same filter params as the report page.
+    With ?background=1 the file is built by a job (202 + job id)."""
 
     def get(self, request, *args, **kwargs):
-        qs = _filter_purchases(request.GET)
-        fmt = (request.GET.get('format') or 'excel').lower()
-        if fmt == 'pdf':
-            return _export_purchases_pdf(qs, request.GET)
-        return _export_purchases_excel(qs, request.GET)
+        if request.GET.get('background'):
+            job = enqueue('inventory.purchase_report_export', request.user,
+                          payload={'params': request.GET.dict()})
+            return job_accepted(job)
+        return build_purchase_export(request.GET)
 
 
 # ----------------------------------------------------------------------------
@@ -1200,12 +1688,21 @@ def _export_truck_costs_pdf(qs, params):
     return resp
 
 
+def build_truck_cost_export(params):
+    qs = _filter_truck_costs(params).order_by('-date', '-created_at')
+    fmt = (params.get('format') or 'excel').lower()
+    if fmt == 'pdf':
+        return _export_truck_costs_pdf(qs, params)
+    return _export_truck_costs_excel(qs, params)
+
+
 class TransportCostExportView(LoginRequiredMixin, TemplateView):
-    """GET ?format=excel|pdf plus the same filter params as the page."""
+    """GET ?format=excel|pdf plus the same filter params as the page.
+    With ?background=1 the file is built by a job (202 + job id)."""
 
     def get(self, request, *args, **kwargs):
-        qs = _filter_truck_costs(request.GET).order_by('-date', '-created_at')
-        fmt = (request.GET.get('format') or 'excel').lower()
-        if fmt == 'pdf':
-            return _export_truck_costs_pdf(qs, request.GET)
-        return _export_truck_costs_excel(qs, request.GET)
+        if request.GET.get('background'):
+            job = enqueue('inventory.transport_cost_export', request.user,
+                          payload={'params': request.GET.dict()})
+            return job_accepted(job)
+        return build_truck_cost_export(request.GET)
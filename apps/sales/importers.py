@@ -0,0 +1,112 @@
+"""Batched customer import.
+
+CustomerViewSet.import_customers streams the upload through CustomerImporter.
+Each batch looks its names up with one ``IN`` query, then updates the
+existing customers with bulk_update and inserts the rest with bulk_create,
+which is what update_or_create(name=...) did one row at a time. As in
+apps.inventory.importers, a batch the database rejects is retried in
+halves, each in its own savepoint, so only the offending customers are
+reported and the rest are still imported.
+"""
+from django.db import transaction
+
+from apps.core.uploads import chunked
+from .models import Customer
+
+
+FIELDS = ('phone', 'email', 'address')
+
+
+class CustomerImporter:
+    """Import customer rows keyed by the template headers (Name, Phone, Email,
+    Address). Rows without a Name are skipped, as before."""
+    batch_size = 1000
+
+    def __init__(self, batch_size=None, progress=None):
+        if batch_size:
+            self.batch_size = batch_size
+        self.progress = progress
+        self.processed = 0
+        self.imported = 0
+        self.errors = []
+
+    def run(self, rows):
+        for batch in chunked(rows, self.batch_size):
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(self)
+        return self
+
+    def _parse(self, row):
+        values = {'name': str(row.get('Name')).strip()}
+        for field in FIELDS:
+            value = row.get(field.capitalize())
+            values[field] = str(value).strip() if value is not None else ''
+        for field, value in values.items():
+            max_length = Customer._meta.get_field(field).max_length
+            if max_length and len(value) > max_length:
+                raise ValueError(f"{field.capitalize()} is too long")
+        return values
+
+    def import_batch(self, batch):
+        parsed, counts = {}, {}
+        for row in batch:
+            self.processed += 1
+            if not row.get('Name'):
+                continue
+            try:
+                values = self._parse(row)
+            except Exception as e:
+                self.errors.append(f"Error importing {row.get('Name')}: {str(e)}")
+                continue
+            # A name repeated within the file: the last row wins, as it did
+            # when every row went through update_or_create in turn.
+            parsed[values['name']] = values
+            counts[values['name']] = counts.get(values['name'], 0) + 1
+        if not parsed:
+            return
+
+        existing = {}
+        ambiguous = set()
+        for customer in Customer.objects.filter(name__in=parsed):
+            if customer.name in existing:
+                ambiguous.add(customer.name)
+            existing[customer.name] = customer
+        for name in ambiguous:
+            self.errors.append(f"Error importing {name}: more than one customer has this name")
+            parsed.pop(name)
+
+        customers = []
+        for name, values in parsed.items():
+            customer = existing.get(name)
+            if customer is None:
+                customer = Customer(**values)
+            else:
+                for field in FIELDS:
+                    setattr(customer, field, values[field])
+            customers.append(customer)
+        self._write_isolating(customers, counts)
+
+    def _write_isolating(self, customers, counts):
+        """Write the customers in one savepoint; if that fails, split them in
+        halves and retry each, down to single customers, so only the ones
+        the database rejects are lost."""
+        created = [c for c in customers if c.pk is None]
+        try:
+            with transaction.atomic():
+                updated = [c for c in customers if c.pk is not None]
+                if updated:
+                    Customer.objects.bulk_update(updated, FIELDS, batch_size=self.batch_size)
+                if created:
+                    Customer.objects.bulk_create(created, batch_size=self.batch_size)
+        except Exception as e:
+            for c in created:  # their INSERT was rolled back
+                c.pk = None
+            if len(customers) == 1:
+                self.errors.append(f"Error importing {customers[0].name}: {str(e)}")
+                return
+            half = len(customers) // 2
+            self._write_isolating(customers[:half], counts)
+            self._write_isolating(customers[half:], counts)
+            return
+        self.imported += sum(counts[c.name] for c in customers)
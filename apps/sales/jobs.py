@@ -0,0 +1,21 @@
+"""Background job handlers for the sales app (see apps.core.jobs)."""
+from apps.core.jobs import register
+from apps.core.uploads import read_upload
+
+from .importers import CustomerImporter
+
+
+@register('sales.import_customers')
+def import_customers(job):
+    with job.input_file.open('rb') as f:
+        _, rows = read_upload(f)
+        importer = CustomerImporter(progress=lambda imp: job.report_progress(imp.processed))
+        try:
+            importer.run(rows)
+        except Exception as e:
+            importer.errors.append(f"Failed to read file after row {importer.processed + 1}: {str(e)}")
+    job.report_progress(importer.processed)
+    return {
+        "message": f"Successfully imported {importer.imported} customers",
+        "errors": importer.errors,
+    }
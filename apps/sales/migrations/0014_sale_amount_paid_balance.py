@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_balances(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    Transaction = apps.get_model('sales', 'Transaction')
+    PaymentReceipt = apps.get_model('finance', 'PaymentReceipt')
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    def paid():
+        transactions = (Transaction.objects.filter(sale=OuterRef('pk'))
+                        .values('sale').annotate(t=Sum('amount')).values('t'))
+        receipts = (PaymentReceipt.objects.filter(sale=OuterRef('pk'))
+                    .values('sale').annotate(t=Sum('amount_paid')).values('t'))
+        return (Coalesce(Subquery(transactions, output_field=money), Value(0), output_field=money)
+                + Coalesce(Subquery(receipts, output_field=money), Value(0), output_field=money))
+
+    Sale.objects.update(amount_paid=paid(), balance=F('total_amount') - paid())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_stock_low_stock_index'),
+        ('sales', '0013_historicalsale_discount_sale_discount'),
+        ('finance', '0008_bankaccount_expense_bank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('balance__gt', 0)), fields=['customer', 'created_at'], name='sales_sale_open_balance_idx'),
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_history_object_index'),
+        ('sales', '0014_sale_amount_paid_balance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalsale',
+            index=models.Index(fields=['id', 'history_date'], name='sales_histo_id_8d6a9c_idx'),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.conf import settings
-from simple_history.models import HistoricalRecords
+from apps.core.history import IndexedHistoricalRecords
 
 class Customer(models.Model):
     name = models.CharField(max_length=200)
@@ -67,8 +67,18 @@ class Sale(models.Model):
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     discount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00,
                                    help_text="Flat discount applied to this sale")
+    # Kept in step with Transactions / PaymentReceipts by apps.sales.receivables.
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, editable=False)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    history = HistoricalRecords()
+    history = IndexedHistoricalRecords(excluded_fields=['amount_paid', 'balance'])
+
+    class Meta:
+        indexes = [
+            # Open invoices only: credit list and debtors report.
+            models.Index(fields=['customer', 'created_at'], name='sales_sale_open_balance_idx',
+                         condition=models.Q(balance__gt=0)),
+        ]
 
     def __str__(self):
         return f"Invoice #{self.invoice_number}"
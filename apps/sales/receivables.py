@@ -0,0 +1,103 @@
+"""Receivables: the paid / outstanding figures kept on each Sale.
+
+Sale.amount_paid is the sum of the sale's Transactions plus the finance
+PaymentReceipts logged against it; Sale.balance is total_amount minus that.
+Both are stored so the credit list and the debtors report only read open
+invoices (see the partial index on Sale) instead of summing payments over
+every sale on each request.
+
+refresh_balances() recomputes them from the payment rows. Signals
+(apps.sales.signals) call it in the same transaction as every Transaction,
+PaymentReceipt or Sale write, so the stored figures never drift; the sale
+row is locked first so two payments landing together can't both compute
+from a snapshot without the other.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+AGING_BUCKETS = (
+    # key, column alias, min days, max days (None = no limit)
+    ('0-30', 'age_0_30', 0, 30),
+    ('31-60', 'age_31_60', 31, 60),
+    ('61-90', 'age_61_90', 61, 90),
+    ('90+', 'age_90_plus', 91, None),
+)
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _paid_expression():
+    from apps.finance.models import PaymentReceipt
+    from .models import Transaction
+    transactions = (Transaction.objects.filter(sale=OuterRef('pk'))
+                    .values('sale').annotate(t=Sum('amount')).values('t'))
+    receipts = (PaymentReceipt.objects.filter(sale=OuterRef('pk'))
+                .values('sale').annotate(t=Sum('amount_paid')).values('t'))
+    return (Coalesce(Subquery(transactions, output_field=MONEY), Value(Decimal('0')), output_field=MONEY)
+            + Coalesce(Subquery(receipts, output_field=MONEY), Value(Decimal('0')), output_field=MONEY))
+
+
+def refresh_balances(sale_ids):
+    """Recompute amount_paid / balance for these sales (one UPDATE)."""
+    from .models import Sale
+    sale_ids = sorted({pk for pk in sale_ids if pk})
+    if not sale_ids:
+        return
+    with transaction.atomic():
+        list(Sale.objects.select_for_update().filter(pk__in=sale_ids).values_list('pk', flat=True))
+        Sale.objects.filter(pk__in=sale_ids).update(
+            amount_paid=_paid_expression(),
+            balance=F('total_amount') - _paid_expression(),
+        )
+
+
+def open_invoices():
+    """Sales with money still owed (served by the open-balance index)."""
+    from .models import Sale
+    return Sale.objects.filter(balance__gt=0).exclude(status='cancelled')
+
+
+def _bucket_filter(low, high, now):
+    q = Q(created_at__lte=now - timedelta(days=low))
+    if high is not None:
+        q &= Q(created_at__gt=now - timedelta(days=high + 1))
+    return q
+
+
+def aging(row):
+    """{'0-30': amount, ...} from a debtors() or totals() row."""
+    return {key: row[alias] for key, alias, _, _ in AGING_BUCKETS}
+
+
+def debtors(now, branch=None):
+    """Per-customer receivables, largest first. Walk-in sales without a
+    customer record are grouped by the name typed on the sale."""
+    qs = open_invoices()
+    if branch:
+        qs = qs.filter(branch_id=branch)
+    buckets = {alias: Coalesce(Sum('balance', filter=_bucket_filter(low, high, now)),
+                               Value(Decimal('0')), output_field=MONEY)
+               for _, alias, low, high in AGING_BUCKETS}
+    return (qs.annotate(debtor=Coalesce('customer__name', 'customer_name'))
+            .values('customer_id', 'debtor')
+            .annotate(invoices=Count('pk'), invoiced=Sum('total_amount'), paid=Sum('amount_paid'),
+                      outstanding=Sum('balance'), oldest=Min('created_at'), **buckets)
+            .order_by('-outstanding', 'debtor'))
+
+
+def totals(now, branch=None):
+    """Overall outstanding and per-bucket totals for the same invoices."""
+    qs = open_invoices()
+    if branch:
+        qs = qs.filter(branch_id=branch)
+    return qs.aggregate(
+        outstanding=Coalesce(Sum('balance'), Value(Decimal('0')), output_field=MONEY),
+        invoices=Count('pk'),
+        **{alias: Coalesce(Sum('balance', filter=_bucket_filter(low, high, now)), Value(Decimal('0')),
+                           output_field=MONEY)
+           for _, alias, low, high in AGING_BUCKETS}
+    )
@@ -26,8 +26,6 @@ class SaleSerializer(serializers.ModelSerializer):
     items = serializers.ListField(child=serializers.DictField(), write_only=True)
     payment_details = serializers.DictField(write_only=True, required=False)
     
-    amount_paid = serializers.SerializerMethodField()
-    balance = serializers.SerializerMethodField()
     payment_status = serializers.SerializerMethodField()
     total_weight = serializers.SerializerMethodField()
     
@@ -52,65 +50,82 @@ class SaleSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('total_amount', 'invoice_number', 'amount_paid', 'balance', 'payment_status', 'status', 'approved_at')
 
-    def get_amount_paid(self, obj):
-        return sum(t.amount for t in obj.transactions.all())
-
-    def get_balance(self, obj):
-        return obj.total_amount - self.get_amount_paid(obj)
-
     def get_payment_status(self, obj):
-        paid = self.get_amount_paid(obj)
+        paid = obj.amount_paid
         if paid >= obj.total_amount:
             return 'Paid'
         elif paid > 0:
             return 'Partial'
         return 'Credit'
 
+    # SaleViewSet annotates total_weight on its queryset; the fallback only
+    # runs for a freshly created sale.
     def get_total_weight(self, obj):
-        return sum(item.quantity * item.product.weight for item in obj.items.all())
+        weight = getattr(obj, 'total_weight', None)
+        if weight is None:
+            weight = sum(item.quantity * item.product.weight for item in obj.items.all())
+        return weight
 
     def create(self, validated_data):
         from decimal import Decimal
+        from django.db import transaction
+        from apps.core.numbering import next_number
         items_data = validated_data.pop('items')
         payment_data = validated_data.pop('payment_details', None)
-        
-        # Generate Invoice Number
-        import uuid
-        validated_data['invoice_number'] = str(uuid.uuid4())[:8].upper()
         validated_data['status'] = 'pending'
-        
-        sale = Sale.objects.create(**validated_data)
 
-        # Handle Subtotals ONLY (No stock deduction here anymore)
+        # Price the lines first so the sale is written once with its totals
+        # (one save, one history row). No stock deduction here.
+        try:
+            ids = [int(item['product']) for item in items_data]
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError({'items': "Every line needs a product."})
+        products = Product.objects.in_bulk(ids)
+        missing = sorted(set(ids) - set(products))
+        if missing:
+            raise serializers.ValidationError({'items': f"Unknown products: {missing}"})
+        lines = []
         total = Decimal('0.00')
-        for item in items_data:
-            product = Product.objects.get(id=item['product'])
+        for pid, item in zip(ids, items_data):
+            product = products[pid]
             qty = int(item['quantity'])
             price = Decimal(str(item.get('price_at_sale', product.price)))
-
-            subtotal = price * qty
-            SaleItem.objects.create(sale=sale, product=product, quantity=qty, price_at_sale=price, subtotal=subtotal)
-            total += subtotal
+            lines.append((product, qty, price, price * qty))
+            total += price * qty
 
         # Apply the flat discount (never below zero).
-        discount = Decimal(str(sale.discount or '0.00'))
+        discount = Decimal(str(validated_data.get('discount') or '0.00'))
         if discount < 0:
             discount = Decimal('0.00')
         if discount > total:
             discount = total
-        sale.discount = discount
-        sale.total_amount = total - discount
-        sale.save()
-
-        # Handle Payment
-        if payment_data and payment_data.get('amount'):
-            from .models import Transaction
-            Transaction.objects.create(
-                sale=sale,
-                amount=payment_data['amount'],
-                payment_method=payment_data.get('method', 'cash'),
-                transaction_type='income'
-            )
+        validated_data['discount'] = discount
+        validated_data['total_amount'] = total - discount
+
+        # The invoice number is taken in its own short transaction, once the
+        # lines are known to be good, and not inside the sale's: there the
+        # branch's INV counter row would stay locked through the sale's
+        # inserts, signals and stock work, and every till at the branch would
+        # queue behind the slowest sale. The trade-off is deliberate: a sale
+        # that fails after this point leaves a gap in the series; rejected
+        # input never reaches it (see apps.core.numbering).
+        validated_data['invoice_number'] = next_number('INV', branch=validated_data.get('branch'))
+        with transaction.atomic():
+            sale = Sale.objects.create(**validated_data)
+            for product, qty, price, subtotal in lines:
+                SaleItem.objects.create(sale=sale, product=product, quantity=qty, price_at_sale=price,
+                                        subtotal=subtotal)
+
+            # Handle Payment
+            if payment_data and payment_data.get('amount'):
+                Transaction.objects.create(
+                    sale=sale,
+                    amount=payment_data['amount'],
+                    payment_method=payment_data.get('method', 'cash'),
+                    transaction_type='income'
+                )
+        # amount_paid / balance were recomputed in the database by signals.
+        sale.refresh_from_db(fields=['amount_paid', 'balance'])
 
         return sale
 
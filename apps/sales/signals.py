@@ -1,6 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Sale
+from .models import Sale, Transaction
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
@@ -31,3 +31,30 @@ def sale_notification(sender, instance, created, **kwargs):
             }
         }
     )
+
+
+@receiver(post_save, sender=Sale)
+def sale_balance(sender, instance, update_fields=None, **kwargs):
+    # total_amount may have changed; payments are handled below.
+    if update_fields is not None and 'total_amount' not in update_fields:
+        return
+    from .receivables import refresh_balances
+    refresh_balances([instance.pk])
+
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_save, sender='finance.PaymentReceipt')
+def payment_moved(sender, instance, **kwargs):
+    # Remember the sale an edited payment belonged to, in case it moves.
+    if instance.pk:
+        instance._previous_sale_id = (sender.objects.filter(pk=instance.pk)
+                                      .values_list('sale_id', flat=True).first())
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender='finance.PaymentReceipt')
+@receiver(post_delete, sender='finance.PaymentReceipt')
+def payment_balance(sender, instance, **kwargs):
+    from .receivables import refresh_balances
+    refresh_balances([instance.sale_id, getattr(instance, '_previous_sale_id', None)])
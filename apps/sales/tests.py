@@ -1,3 +1,207 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.users.models import User
+from apps.inventory.models import Branch, Category, Product, Stock
+from .models import Customer, Sale, SaleItem, Transaction, Vehicle
+
+
+class SaleListQueryCountTest(TestCase):
+    """Listing sales must cost the same number of queries for 2 or 20 rows."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.branch = Branch.objects.create(name="Main Branch")
+        category = Category.objects.create(name="Cement")
+        self.products = [
+            Product.objects.create(name=f"P{i}", sku=f"P-{i}", category=category,
+                                   price=100, cost=80, weight=50)
+            for i in range(3)
+        ]
+        self.vehicle = Vehicle.objects.create(registration_number="T 123 ABC", driver_name="Juma")
+
+    def _make_sales(self, n):
+        for _ in range(n):
+            sale = Sale.objects.create(
+                invoice_number=f"INV-{Sale.objects.count() + 1}", branch=self.branch,
+                user=self.user, approved_by=self.user, store_keeper=self.user,
+                vehicle=self.vehicle, total_amount=600,
+            )
+            for product in self.products:
+                SaleItem.objects.create(sale=sale, product=product, quantity=2, price_at_sale=100)
+            Transaction.objects.create(sale=sale, amount=250)
+
+    def _count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/api/sales/')
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()
+
+    def test_constant_queries_and_annotated_totals(self):
+        self._make_sales(2)
+        small, _ = self._count_list_queries()
+        self._make_sales(18)
+        large, body = self._count_list_queries()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(body), 20)
+        row = body[0]
+        self.assertEqual(float(row['amount_paid']), 250)
+        self.assertEqual(float(row['balance']), 350)
+        self.assertEqual(row['payment_status'], 'Partial')
+        self.assertEqual(float(row['total_weight']), 300)
+
+    def test_credit_filter_uses_stored_balance(self):
+        self._make_sales(1)
+        paid = Sale.objects.create(invoice_number="INV-PAID", branch=self.branch, total_amount=100)
+        Transaction.objects.create(sale=paid, amount=100)
+        numbers = [s['invoice_number'] for s in self.client.get('/api/sales/?status=credit').json()]
+        self.assertNotIn("INV-PAID", numbers)
+        self.assertEqual(len(numbers), 1)
+
+    def test_balance_follows_payments_and_receipts(self):
+        from datetime import date, timedelta
+        from django.utils import timezone
+        from apps.finance.models import PaymentReceipt
+        acme = Customer.objects.create(name="Acme")
+        sale = Sale.objects.create(invoice_number="INV-A", branch=self.branch, customer=acme, total_amount=1000)
+        payment = Transaction.objects.create(sale=sale, amount=300)
+        PaymentReceipt.objects.create(sale=sale, invoice_number="INV-A", amount_paid=200, payment_date=date.today())
+        sale.refresh_from_db()
+        self.assertEqual((sale.amount_paid, sale.balance), (500, 500))
+
+        payment.delete()
+        sale.total_amount = 1200
+        sale.save()
+        sale.refresh_from_db()
+        self.assertEqual((sale.amount_paid, sale.balance), (200, 1000))
+
+        old = Sale.objects.create(invoice_number="INV-B", branch=self.branch, customer=acme, total_amount=50)
+        Sale.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=45))
+        Sale.objects.create(invoice_number="INV-C", branch=self.branch, customer_name="Cash buyer", total_amount=10)
+        body = self.client.get('/api/sales/debtors/').json()
+        self.assertEqual(body['count'], 2)
+        top = body['results'][0]
+        self.assertEqual((top['customer_name'], top['invoices'], float(top['outstanding'])), ("Acme", 2, 1050))
+        self.assertEqual({k: float(v) for k, v in top['aging'].items()},
+                         {'0-30': 1000, '31-60': 50, '61-90': 0, '90+': 0})
+        self.assertEqual(float(body['totals']['outstanding']), 1060)
+
+    def test_rejected_sale_hands_back_its_invoice_number(self):
+        line = {'product': self.products[0].pk, 'quantity': 2}
+        unknown = {'product': 99999, 'quantity': 1}
+        resp = self.client.post('/api/sales/', {'branch': self.branch.pk, 'items': [line, unknown]}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+
+        resp = self.client.post('/api/sales/', {'branch': self.branch.pk, 'items': [line]}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['invoice_number'], f'INV-{self.branch.pk}-000001')
+        self.assertEqual(resp.data['total_amount'], '200.00')
+
+
+@override_settings(JOBS_ALWAYS_EAGER=True, MEDIA_ROOT=tempfile.mkdtemp())
+class CustomerImportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+
+    def test_import_updates_existing_and_creates_new(self):
+        Customer.objects.create(name="Asha", phone="0700")
+        csv_text = "\n".join([
+            "Name,Phone,Email,Address",
+            "Asha,0711,asha@example.com,Arusha",
+            "Baraka,0722,,Dodoma",
+            ",0733,,",
+            "Baraka,0799,,Dodoma",
+        ]) + "\n"
+        upload = SimpleUploadedFile('customers.csv', csv_text.encode('utf-8'), content_type='text/csv')
+
+        resp = self.client.post('/api/customers/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(resp.status_code, 202)
+        job = self.client.get(resp.json()['status_url']).json()
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['result']['message'], "Successfully imported 3 customers")
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(Customer.objects.get(name="Asha").phone, "0711")
+        self.assertEqual(Customer.objects.get(name="Baraka").phone, "0799")
+
+    def test_rows_the_database_rejects_do_not_sink_the_batch(self):
+        from .importers import CustomerImporter
+        Customer.objects.create(name="Asha", phone="0700")
+        rows = [{'Name': f"Customer {i}", 'Phone': f"07{i:02d}"} for i in range(6)]
+        rows[3]['Address'] = "Arusha\x00"  # PostgreSQL refuses NUL characters
+        rows.append({'Name': "Asha", 'Phone': "0711"})
+
+        importer = CustomerImporter().run(rows)
+
+        self.assertEqual(len(importer.errors), 1)
+        self.assertTrue(importer.errors[0].startswith("Error importing Customer 3:"))
+        self.assertEqual(importer.imported, 6)
+        self.assertEqual(Customer.objects.count(), 6)
+        self.assertEqual(Customer.objects.get(name="Asha").phone, "0711")
+
+    def test_rejects_unknown_format(self):
+        upload = SimpleUploadedFile('customers.txt', b"Name\nAsha\n")
+        resp = self.client.post('/api/customers/import/', {'file': upload}, format='multipart')
+        self.assertEqual(resp.status_code, 400)
+
+
+class DispatchOrderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.branch = Branch.objects.create(name="Main Branch")
+        self.category = Category.objects.create(name="Cement")
+        self.vehicle = Vehicle.objects.create(registration_number="T 123 ABC", driver_name="Juma")
+
+    def _approved_sale(self, lines, stock=10):
+        sale = Sale.objects.create(invoice_number=f"INV-{Sale.objects.count() + 1}", branch=self.branch,
+                                   user=self.user, status='approved', total_amount=100)
+        start = Product.objects.count()
+        for i in range(lines):
+            product = Product.objects.create(name=f"P{start + i}", sku=f"P-{start + i}", category=self.category,
+                                             price=10, cost=5)
+            Stock.objects.create(product=product, branch=self.branch, quantity=stock)
+            SaleItem.objects.create(sale=sale, product=product, quantity=2, price_at_sale=10)
+        return sale
+
+    def _dispatch(self, sale):
+        return self.client.post(f'/api/sales/{sale.pk}/dispatch_order/',
+                                {'store_keeper': self.user.pk, 'vehicle_id': self.vehicle.pk}, format='json')
+
+    def test_constant_round_trips(self):
+        counts = []
+        for lines in (3, 60):
+            sale = self._approved_sale(lines)
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self._dispatch(sale)
+            self.assertEqual(resp.status_code, 200, resp.data)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(set(Stock.objects.values_list('quantity', flat=True)), {8})
+
+    def test_refused_dispatch_changes_nothing(self):
+        sale = self._approved_sale(3)
+        Stock.objects.filter(product=sale.items.order_by('pk').last().product).update(quantity=1)
+
+        resp = self._dispatch(sale)
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data['error'], [f"Insufficient stock for {sale.items.order_by('pk').last().product.name}"])
+        self.assertEqual(sorted(Stock.objects.values_list('quantity', flat=True)), [1, 10, 10])
+        sale.refresh_from_db()
+        self.vehicle.refresh_from_db()
+        self.assertEqual(sale.status, 'approved')
+        self.assertNotEqual(self.vehicle.status, 'busy')
+
+        self.assertEqual(self._dispatch(Sale.objects.get(pk=sale.pk)).status_code, 400)
@@ -1,14 +1,18 @@
 from django.shortcuts import render
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
 from apps.users.permissions import IsSales, CanManageVehicles, CanApproveSales
+from apps.core.mixins import FieldProjectionMixin
+from apps.core.jobs import enqueue, job_accepted
+from apps.core.uploads import check_upload, UnsupportedUpload
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from .models import Sale, SaleItem, Transaction, Customer, Vehicle, Quotation, QuotationItem
 from .serializers import SaleSerializer, SaleItemSerializer, TransactionSerializer, CustomerSerializer, VehicleSerializer, QuotationSerializer, QuotationItemSerializer
 
-import io
 import csv
 from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
 from django.http import HttpResponse
 from django.views.generic import TemplateView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -97,23 +101,38 @@ def _amount_in_words(amount, currency='TZS'):
     result = '%s %s' % (words, cur)
     return result + ' Only'
 
-class SaleViewSet(viewsets.ModelViewSet):
+class DebtorPagination(PageNumberPagination):
+    """Debtors are grouped rows (no pk to key a cursor on), so page numbers."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class SaleViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.all().order_by('-created_at')
     serializer_class = SaleSerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        from django.db.models import F, Prefetch, Sum, Value, DecimalField, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        money = DecimalField(max_digits=12, decimal_places=2)
+
+        # Load weight is computed in the database (a correlated subquery, so
+        # it doesn't multiply through a join; amount_paid / balance are
+        # stored on the sale) and everything the serializer touches is
+        # fetched up front: listing N sales costs a constant number of queries.
+        weight = (SaleItem.objects.filter(sale=OuterRef('pk'))
+                  .values('sale').annotate(w=Sum(F('quantity') * F('product__weight'))).values('w'))
+        queryset = (super().get_queryset()
+                    .select_related('user', 'approved_by', 'dispatch_manager', 'store_keeper',
+                                    'vehicle', 'customer', 'branch')
+                    .prefetch_related(Prefetch('items', queryset=SaleItem.objects.select_related('product')))
+                    .annotate(
+                        total_weight=Coalesce(Subquery(weight, output_field=money), Value(0), output_field=money),
+                    ))
         status = self.request.query_params.get('status')
         if status == 'credit':
-            from django.db.models import Sum, F, DecimalField
-            from django.db.models.functions import Coalesce
-            queryset = queryset.annotate(
-                total_paid=Coalesce(
-                    Sum('transactions__amount'), 0,
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            ).filter(total_paid__lt=F('total_amount'))
+            queryset = queryset.filter(balance__gt=0)
         return queryset
 
     def perform_create(self, serializer):
@@ -121,17 +140,44 @@ class SaleViewSet(viewsets.ModelViewSet):
 
     def perform_destroy(self, instance):
         # Restore stock if dispatched
-        if instance.status == 'dispatched':
-            from apps.inventory.models import Stock
-            for item in instance.items.all():
-                try:
-                    stock = Stock.objects.get(product=item.product, branch=instance.branch)
-                    stock.quantity += item.quantity
-                    stock.save()
-                except Stock.DoesNotExist:
-                    pass # Should not happen, but safe to ignore if stock record gone
-        
-        instance.delete()
+        with transaction.atomic():
+            if instance.status == 'dispatched':
+                from apps.inventory.movements import move_stock
+                move_stock([(item.product_id, instance.branch_id, item.quantity) for item in instance.items.all()],
+                           reason='sale_reversal', reference=instance.invoice_number, user=self.request.user)
+            instance.delete()
+
+    @action(detail=False, methods=['GET'])
+    def debtors(self, request):
+        """GET /api/sales/debtors/?branch=&page=&page_size=
+
+        Customers with open invoices, largest balance first, each with the
+        outstanding amount split into 0-30 / 31-60 / 61-90 / 90+ day buckets
+        (by invoice date), plus the same totals over all debtors. Reads only
+        open invoices."""
+        from django.utils import timezone
+        from .receivables import aging, debtors, totals
+
+        now = timezone.now()
+        branch = request.query_params.get('branch')
+        paginator = DebtorPagination()
+        page = paginator.paginate_queryset(debtors(now, branch), request, view=self)
+        results = [{
+            'customer_id': row['customer_id'],
+            'customer_name': row['debtor'] or 'Walk-in Customer',
+            'invoices': row['invoices'],
+            'invoiced': row['invoiced'],
+            'paid': row['paid'],
+            'outstanding': row['outstanding'],
+            'oldest_invoice': row['oldest'],
+            'aging': aging(row),
+        } for row in page]
+        response = paginator.get_paginated_response(results)
+        summary = totals(now, branch)
+        response.data['totals'] = {'outstanding': summary['outstanding'], 'invoices': summary['invoices'],
+                                   'aging': aging(summary)}
+        return response
+
     @action(detail=True, methods=['POST'], permission_classes=[permissions.IsAuthenticated, CanApproveSales])
     def approve(self, request, pk=None):
         from rest_framework.response import Response
@@ -172,14 +218,10 @@ class SaleViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['POST'], permission_classes=[permissions.IsAuthenticated])
     def dispatch_order(self, request, pk=None):
         if not (request.user.is_superuser or request.user.is_manager or request.user.is_admin_role):
-             from rest_framework.response import Response
-             from rest_framework import status
              return Response({"error": "You do not have permission to dispatch orders"}, status=status.HTTP_403_FORBIDDEN)
 
         sale = self.get_object()
         if sale.status != 'approved':
-            from rest_framework.response import Response
-            from rest_framework import status
             return Response({"error": "Only approved orders can be dispatched"}, status=status.HTTP_400_BAD_REQUEST)
         
         store_keeper_id = request.data.get('store_keeper')
@@ -187,13 +229,9 @@ class SaleViewSet(viewsets.ModelViewSet):
         lorry_info = request.data.get('lorry_info')
         
         if not store_keeper_id:
-            from rest_framework.response import Response
-            from rest_framework import status
             return Response({"error": "Store keeper is required"}, status=status.HTTP_400_BAD_REQUEST)
 
         if not vehicle_id and not lorry_info:
-            from rest_framework.response import Response
-            from rest_framework import status
             return Response({"error": "Vehicle or Lorry Info is required"}, status=status.HTTP_400_BAD_REQUEST)
         
         from django.contrib.auth import get_user_model
@@ -201,47 +239,45 @@ class SaleViewSet(viewsets.ModelViewSet):
         try:
             store_keeper = User.objects.get(id=store_keeper_id)
         except User.DoesNotExist:
-            from rest_framework.response import Response
-            from rest_framework import status
             return Response({"error": "Invalid store keeper"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 1. Deduct Stock
-        from apps.inventory.models import Stock
-        errors = []
-        for item in sale.items.all():
-            try:
-                stock = Stock.objects.get(product=item.product, branch=sale.branch)
-                if stock.quantity < item.quantity:
-                    errors.append(f"Insufficient stock for {item.product.name}")
-                stock.quantity -= item.quantity
-                stock.save()
-            except Stock.DoesNotExist:
-                errors.append(f"No stock record for {item.product.name} at this branch")
-
-        if errors:
-            from rest_framework.response import Response
-            from rest_framework import status
-            return Response({"error": errors}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 2. Update Sale Status
-        sale.status = 'dispatched'
-        sale.store_keeper = store_keeper
+        vehicle = None
         if vehicle_id:
-            sale.vehicle_id = vehicle_id
-            v = Vehicle.objects.get(id=vehicle_id)
-            v.status = 'busy'
-            v.save()
-            
-            if not lorry_info:
-                 sale.lorry_info = f"{v.registration_number} ({v.driver_name})"
-            else:
-                 sale.lorry_info = lorry_info
-        else:
-            sale.lorry_info = lorry_info
-        sale.save()
-        
+            vehicle = Vehicle.objects.filter(id=vehicle_id).first()
+            if vehicle is None:
+                return Response({"error": "Invalid vehicle"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Everything below commits together or not at all: the stock service
+        # locks every Stock row in one query, checks them all, then deducts
+        # them in one UPDATE, so a 50-line order costs the same round trips
+        # as a 1-line order and a refused dispatch leaves stock untouched.
+        from apps.inventory.movements import move_stock, InsufficientStock
+        try:
+            with transaction.atomic():
+                # Lock the sale too, so a double submit can't deduct twice.
+                if not Sale.objects.select_for_update().filter(pk=sale.pk, status='approved').values_list('pk', flat=True):
+                    return Response({"error": "Only approved orders can be dispatched"}, status=status.HTTP_400_BAD_REQUEST)
+
+                # 1. Deduct Stock
+                move_stock([(item.product_id, sale.branch_id, -item.quantity) for item in sale.items.all()],
+                           reason='sale', reference=sale.invoice_number, user=request.user,
+                           require_available=True)
+
+                # 2. Update Sale Status
+                sale.status = 'dispatched'
+                sale.store_keeper = store_keeper
+                if vehicle:
+                    sale.vehicle = vehicle
+                    vehicle.status = 'busy'
+                    vehicle.save(update_fields=['status'])
+                    sale.lorry_info = lorry_info or f"{vehicle.registration_number} ({vehicle.driver_name})"
+                else:
+                    sale.lorry_info = lorry_info
+                sale.save()
+        except InsufficientStock as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
         # 3. Generate PDF (Mock for now, will implement utility next)
-        from rest_framework.response import Response
         return Response({
             "message": "Order dispatched successfully and stock deducted",
             "invoice_url": f"/api/sales/{sale.id}/receipt/",
@@ -408,12 +444,12 @@ class DispatchDashboardView(LoginRequiredMixin, UserPassesTestMixin, TemplateVie
     def test_func(self):
         return self.request.user.is_superuser or self.request.user.is_manager or self.request.user.is_admin_role
 
-class SaleItemViewSet(viewsets.ModelViewSet):
+class SaleItemViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = SaleItem.objects.all()
     serializer_class = SaleItemSerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Vehicle.objects.all().order_by('registration_number')
     serializer_class = VehicleSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageVehicles]
@@ -433,13 +469,13 @@ class VehicleManagementView(LoginRequiredMixin, UserPassesTestMixin, TemplateVie
         return self.request.user.is_superuser or self.request.user.is_manager or self.request.user.is_admin_role
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [permissions.DjangoModelPermissions]
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -450,40 +486,15 @@ class CustomerViewSet(viewsets.ModelViewSet):
         if not file:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-        decoded_file = file.read().decode('utf-8')
-        io_string = io.StringIO(decoded_file)
-        reader = csv.DictReader(io_string)
-
-        imported_count = 0
-        errors = []
-
-        for row in reader:
-            try:
-                # Basic validation or defaults
-                name = row.get('Name')
-                if not name:
-                    continue
-
-                Customer.objects.update_or_create(
-                    name=name,
-                    defaults={
-                        'phone': row.get('Phone', ''),
-                        'email': row.get('Email', ''),
-                        'address': row.get('Address', ''),
-                    }
-                )
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Error importing {row.get('Name')}: {str(e)}")
+        try:
+            check_upload(file)
+        except UnsupportedUpload as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        from rest_framework.response import Response
-        from rest_framework import status
-        return Response({
-            "message": f"Successfully imported {imported_count} customers",
-            "errors": errors
-        }, status=status.HTTP_201_CREATED if not errors else status.HTTP_207_MULTI_STATUS)
+        job = enqueue('sales.import_customers', request.user, upload=file)
+        return job_accepted(job)
 
-class QuotationViewSet(viewsets.ModelViewSet):
+class QuotationViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Quotation.objects.all().order_by('-created_at')
     serializer_class = QuotationSerializer
     permission_classes = [permissions.IsAuthenticated, IsSales]
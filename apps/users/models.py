@@ -1,3 +1,5 @@
+from functools import cached_property
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
@@ -19,49 +21,55 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='staff')
     branch = models.ForeignKey('inventory.Branch', on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
 
+    @cached_property
+    def group_names(self):
+        """Names of this user's groups, loaded once per User instance (so once
+        per request for request.user) and shared by all the is_* role flags.
+        Dropped on group membership changes, see apps.users.signals."""
+        return frozenset(g.name for g in self.groups.all())
+
+    def _has_role(self, roles, groups):
+        return self.role in roles or not self.group_names.isdisjoint(groups)
+
     @property
     def is_manager(self):
-        return self.role == 'manager' or self.groups.filter(name__in=['Manager', 'Store Manager', 'manager']).exists()
+        return self._has_role(('manager',), ('Manager', 'Store Manager', 'manager'))
 
     @property
     def is_admin_role(self):
-        return self.role == 'admin' or self.groups.filter(name__in=['Admin', 'admin']).exists()
+        return self._has_role(('admin',), ('Admin', 'admin'))
 
     @property
     def is_sales_manager(self):
-        return self.role == 'sales_credit_manager' or self.groups.filter(
-            name__in=['Sales Manager', 'sales_manager', 'Sales & Credit Manager']
-        ).exists()
+        return self._has_role(('sales_credit_manager',), ('Sales Manager', 'sales_manager', 'Sales & Credit Manager'))
 
     @property
     def is_procurement_officer(self):
-        return self.role == 'afisa_ugavi' or self.groups.filter(name__in=['Afisa Ugavi', 'Procurement Officer']).exists()
+        return self._has_role(('afisa_ugavi',), ('Afisa Ugavi', 'Procurement Officer'))
 
     @property
     def is_stock_controller(self):
-        return self.role == 'stock_controller' or self.groups.filter(name__in=['Stock Controller', 'stock_controller']).exists()
+        return self._has_role(('stock_controller',), ('Stock Controller', 'stock_controller'))
 
     @property
     def is_sales_rep(self):
-        return self.role == 'sales_rep' or self.groups.filter(name__in=['Sales Representative', 'Sales Rep']).exists()
+        return self._has_role(('sales_rep',), ('Sales Representative', 'Sales Rep'))
 
     @property
     def is_store_manager(self):
-        return self.role == 'store_manager' or self.groups.filter(name__in=['Store Manager']).exists()
+        return self._has_role(('store_manager',), ('Store Manager',))
 
     @property
     def is_accountant(self):
-        return self.role == 'accountant' or self.groups.filter(name__in=['Accountant']).exists()
+        return self._has_role(('accountant',), ('Accountant',))
 
     @property
     def is_store_keeper(self):
-        return self.role == 'store_keeper' or self.groups.filter(name__in=['Store Keeper']).exists()
+        return self._has_role(('store_keeper',), ('Store Keeper',))
 
     @property
     def is_hr(self):
-        return self.role in ('hr_officer', 'hr_manager') or self.groups.filter(
-            name__in=['HR Officer', 'HR Manager']
-        ).exists()
+        return self._has_role(('hr_officer', 'hr_manager'), ('HR Officer', 'HR Manager'))
 
     def __str__(self):
         return f"{self.username} ({self.role})"
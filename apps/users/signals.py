@@ -0,0 +1,15 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import User
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_group_names(sender, instance, **kwargs):
+    """Forget the cached User.group_names when memberships change, so role
+    flags read after user.groups.add()/remove()/clear() are current.
+
+    For group.user_set.add(...) the users arrive as pks only; other User
+    instances are per request and load fresh names on the next one."""
+    if isinstance(instance, User):
+        instance.__dict__.pop('group_names', None)
@@ -1,3 +1,24 @@
+from django.contrib.auth.models import Group
 from django.test import TestCase
 
-# Create your tests here.
+from .models import User
+
+
+class RoleFlagTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('asha', password='x')
+        self.user.groups.add(Group.objects.create(name='Store Manager'))
+        self.user = User.objects.get(pk=self.user.pk)
+
+    def test_group_names_are_loaded_once(self):
+        with self.assertNumQueries(1):
+            flags = [self.user.is_manager, self.user.is_store_manager, self.user.is_admin_role,
+                     self.user.is_accountant, self.user.is_hr, self.user.is_sales_rep]
+        self.assertEqual(flags, [True, True, False, False, False, False])
+
+    def test_membership_changes_reset_the_cache(self):
+        self.assertFalse(self.user.is_accountant)
+        self.user.groups.add(Group.objects.create(name='Accountant'))
+        self.assertTrue(self.user.is_accountant)
+        self.user.groups.clear()
+        self.assertFalse(self.user.is_manager)
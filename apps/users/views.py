@@ -6,6 +6,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.db.models import Q
+from apps.core.mixins import FieldProjectionMixin
 
 User = get_user_model()
 
@@ -48,7 +49,7 @@ class RoleListView(LoginRequiredMixin, TemplateView):
 class RoleCreateView(LoginRequiredMixin, TemplateView):
     template_name = 'users/role_create.html'
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
 
     def get_queryset(self):
@@ -70,7 +71,7 @@ class UserViewSet(viewsets.ModelViewSet):
             raise ValidationError("Cannot delete a superuser account.")
         instance.delete()
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(FieldProjectionMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     permission_classes = [permissions.DjangoModelPermissions]
@@ -84,7 +85,7 @@ class GroupViewSet(viewsets.ModelViewSet):
             raise ValidationError("Cannot delete the 'Admin' role directly.")
         instance.delete()
 
-class PermissionViewSet(viewsets.ReadOnlyModelViewSet):
+class PermissionViewSet(FieldProjectionMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Permission.objects.filter(
         content_type__app_label__in=['inventory', 'sales', 'finance', 'users']
     ).select_related('content_type').order_by('content_type__app_label', 'content_type__model')
@@ -24,11 +24,15 @@ class ProductRepository {
   ProductRepository(this._api);
   final ApiClient _api;
 
-  Future<List<Product>> list({String? search}) async {
-    final results = await _api.list(
-      '/api/products/',
-      query: {if (search != null && search.isNotEmpty) 'search': search},
-    );
+  /// Typed searches go to the server-side ranked search (top 50 hits)
+  /// instead of pulling the whole catalogue.
+  Future<List<Product>> list({String? search, int? branch}) async {
+    final results = (search != null && search.isNotEmpty)
+        ? await _api.list(
+            '/api/products/search/',
+            query: {'q': search, 'limit': 50, if (branch != null) 'branch': branch},
+          )
+        : await _api.list('/api/products/');
     return results
         .map((j) => Product.fromJson(Map<String, dynamic>.from(j)))
         .toList();
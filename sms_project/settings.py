@@ -74,6 +74,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
 
     # Third Party
     'rest_framework',
@@ -198,6 +199,28 @@ AUTH_USER_MODEL = 'users.User'
 
 # Channels
 ASGI_APPLICATION = 'sms_project.asgi.application'
+# Background jobs (apps.core.jobs): worker threads per process.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Jobs still 'running' after this long are taken to be lost to a restart
+# (manage.py recover_jobs marks them failed). Keep it well above the longest
+# job: a job failed while still working has its late result dropped.
+JOB_STALE_MINUTES = int(os.environ.get('JOB_STALE_MINUTES', 120))
+# Product typeahead (apps.inventory.search): in-process cache entries for
+# short queries; 0 turns the cache off.
+PRODUCT_SEARCH_CACHE_SIZE = int(os.environ.get('PRODUCT_SEARCH_CACHE_SIZE', 256))
+# Barcode scans (apps.inventory.scan): seconds before the in-process SKU and
+# stock maps are rebuilt, bounding staleness across worker processes.
+SCAN_MAP_TTL = int(os.environ.get('SCAN_MAP_TTL', 60))
+# Change history (apps.core.history): stock quantity changes are recorded
+# in the StockMovement ledger; set to also write Stock history rows for them.
+STOCK_HISTORY_WITH_LEDGER = os.environ.get('STOCK_HISTORY_WITH_LEDGER') == 'True'
+# Days of full history kept by `manage.py compact_history`; older changes are
+# collapsed to one version per object per day.
+HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', 90))
+# Demand forecasting (apps.inventory.forecasting): worker processes used
+# once a run has more series than fit comfortably in one.
+FORECAST_WORKERS = int(os.environ.get('FORECAST_WORKERS', os.cpu_count() or 1))
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
@@ -223,6 +246,11 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Keyset pagination on every list endpoint. Opt-in per request
+    # (?page_size= / ?cursor=) so existing unpaged callers keep working;
+    # see apps.core.pagination.
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.OptionalCursorPagination',
+    'PAGE_SIZE': 50,
     # In production serve JSON only. The browsable API renders an HTML page
     # that advertises "Django REST framework" in its chrome — a free
     # fingerprint of the stack — so we drop it outside DEBUG.
@@ -11,11 +11,11 @@ ADMIN_URL = os.environ.get('ADMIN_URL', 'admin/' if os.environ.get('DEBUG') == '
 if not ADMIN_URL.endswith('/'):
     ADMIN_URL += '/'
 
-from apps.inventory.views import BranchViewSet, CategoryViewSet, ProductViewSet, StockViewSet, SupplierViewSet, PurchaseViewSet, StockTransferViewSet, PurchaseOrderViewSet, GoodsReceivedNoteViewSet, TruckViewSet, TruckAllocationViewSet, DriverViewSet, StockAdjustmentViewSet, TruckMaintenanceViewSet, TruckCostViewSet
+from apps.inventory.views import BranchViewSet, CategoryViewSet, ProductViewSet, StockViewSet, SupplierViewSet, PurchaseViewSet, StockTransferViewSet, PurchaseOrderViewSet, GoodsReceivedNoteViewSet, TruckViewSet, TruckAllocationViewSet, DriverViewSet, StockAdjustmentViewSet, TruckMaintenanceViewSet, TruckCostViewSet, DemandForecastViewSet, TransferOrderViewSet, CountSessionViewSet
 from apps.sales.views import SaleViewSet, SaleItemViewSet, TransactionViewSet, CustomerViewSet, VehicleViewSet, QuotationViewSet
 from apps.finance.views import ExpenseViewSet, ExpenseCategoryViewSet, IncomeViewSet, TaxPaymentViewSet, SupplierPaymentViewSet, PaymentReceiptViewSet, BankAccountViewSet
 from apps.users.views import UserViewSet, GroupViewSet, PermissionViewSet
-from apps.core.api_views import ActivityViewSet, NotificationViewSet
+from apps.core.api_views import ActivityViewSet, NotificationViewSet, JobViewSet
 from apps.hr.views import (
     DepartmentViewSet, JobPositionViewSet, EmployeeViewSet, LeaveTypeViewSet,
     LeaveRequestViewSet, AttendanceRecordViewSet, PayrollPeriodViewSet,
@@ -26,10 +26,12 @@ from apps.hr.views import (
 router = DefaultRouter()
 router.register(r'activities', ActivityViewSet)
 router.register(r'notifications', NotificationViewSet, basename='notification')
+router.register(r'jobs', JobViewSet, basename='job')
 router.register(r'branches', BranchViewSet)
 router.register(r'categories', CategoryViewSet)
 router.register(r'products', ProductViewSet)
 router.register(r'stocks', StockViewSet)
+router.register(r'forecasts', DemandForecastViewSet)
 router.register(r'suppliers', SupplierViewSet)
 router.register(r'purchases', PurchaseViewSet)
 router.register(r'purchase-orders', PurchaseOrderViewSet)
@@ -41,6 +43,8 @@ router.register(r'truck-costs', TruckCostViewSet)
 router.register(r'drivers', DriverViewSet)
 router.register(r'stock-adjustments', StockAdjustmentViewSet)
 router.register(r'transfers', StockTransferViewSet)
+router.register(r'transfer-orders', TransferOrderViewSet)
+router.register(r'count-sessions', CountSessionViewSet)
 router.register(r'customers', CustomerViewSet)
 router.register(r'sales', SaleViewSet)
 router.register(r'vehicles', VehicleViewSet)
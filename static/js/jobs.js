@@ -0,0 +1,62 @@
+/* Background jobs (apps.core.jobs).
+ *
+ * Endpoints that hand work to the job pool answer 202 {job_id, status_url}.
+ *   const job = await waitForJob(data.job_id, (j) => console.log(j.progress));
+ *   job.status === 'succeeded' ? job.result : job.error
+ *
+ * Polls /api/jobs/<id>/ and also wakes up early on the "job_update" socket
+ * event (notification_handler.js re-dispatches it as a window event).
+ *
+ * Links marked  data-job-export  (report Excel/PDF buttons) are run as a job
+ * and the finished file is downloaded from /api/jobs/<id>/download/.
+ */
+const JOB_POLL_MS = 1500;
+
+function waitForJob(jobId, onProgress) {
+    return new Promise((resolve, reject) => {
+        let timer = null;
+        const check = async () => {
+            clearTimeout(timer);
+            try {
+                const r = await fetch(`/api/jobs/${jobId}/`, { quiet: true });
+                if (!r.ok) throw new Error(`Job status request failed (${r.status})`);
+                const job = await r.json();
+                if (job.status === 'succeeded' || job.status === 'failed') {
+                    window.removeEventListener('job:update', onEvent);
+                    resolve(job);
+                    return;
+                }
+                if (onProgress) onProgress(job);
+                timer = setTimeout(check, JOB_POLL_MS);
+            } catch (e) {
+                window.removeEventListener('job:update', onEvent);
+                reject(e);
+            }
+        };
+        const onEvent = (e) => { if (e.detail && e.detail.id == jobId) check(); };
+        window.addEventListener('job:update', onEvent);
+        check();
+    });
+}
+
+function jobProgressText(job) {
+    if (job.total) return `${job.progress} of ${job.total}`;
+    return job.progress ? `${job.progress} rows processed` : 'Queued…';
+}
+
+document.addEventListener('click', async function (e) {
+    const link = e.target.closest('a[data-job-export]');
+    if (!link) return;
+    e.preventDefault();
+    const url = link.href + (link.href.includes('?') ? '&' : '?') + 'background=1';
+    try {
+        const r = await fetch(url);
+        const data = await r.json();
+        if (r.status !== 202) throw new Error(data.error || r.statusText);
+        const job = await waitForJob(data.job_id);
+        if (job.status !== 'succeeded') throw new Error(job.error || 'Export failed');
+        window.location.href = job.download_url;
+    } catch (err) {
+        alert('Export failed: ' + err.message);
+    }
+});
@@ -14,6 +14,12 @@ document.addEventListener('DOMContentLoaded', function () {
         showToast('Low Stock Warning', data.data.message, 'warning');
     });
 
+    // Background jobs: let waitForJob() (jobs.js) know straight away. The
+    // event only carries id and status; waitForJob() ignores other ids.
+    socketService.on('job_update', function (data) {
+        window.dispatchEvent(new CustomEvent('job:update', { detail: data.data }));
+    });
+
     // --- Persistent notification inbox (bell dropdown) ---
     if (document.getElementById('notifBell')) {
         loadNotifications();